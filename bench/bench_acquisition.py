@@ -0,0 +1,45 @@
+"""
+Đo độ trễ một lượt đọc đủ các kênh: tuần tự và tách pha Modbus (chạy trên thiết bị)
+
+    mpremote run bench/bench_acquisition.py
+
+Tuần tự: MAX31855 #1, #2, DHT22 rồi mới gửi và chờ giao dịch Modbus.
+Tách pha: gửi request Modbus, đọc MAX31855/DHT22 trong lúc slave xử lý,
+rồi nhận phản hồi. Chỉnh các chân bên dưới theo phần cứng thực tế.
+"""
+import time
+import config
+import logger
+from sensors import SensorManager
+
+PINS = dict(max1_clk=2, max1_do=1, max1_cs=0, max2_clk=6, max2_do=5, max2_cs=4, dht_pin=15)
+N = 10
+
+
+def main():
+    logger.set_level("info")
+    config.TELEMETRY_LOG_ENABLED = False
+    config.DHT22_MIN_INTERVAL = 0  # Đo cả DHT22 trong mỗi lượt
+    sm = SensorManager(**PINS)
+
+    sequential = []
+    pipelined = []
+    for _ in range(N):
+        t0 = time.ticks_us()
+        for name in sm.CHANNELS:
+            sm.read_channel(name)
+        sequential.append(time.ticks_diff(time.ticks_us(), t0))
+        time.sleep(2)  # DHT22 cần >= 2 s giữa hai lần đo
+
+        sm.read_channels(sm.CHANNELS)
+        pipelined.append(sm.acquisition_trace["total_us"])
+        time.sleep(2)  # DHT22 cần >= 2 s giữa hai lần đo
+
+    print("tuần tự : trung bình {:8.1f} ms, max {:8.1f} ms".format(
+        sum(sequential) / N / 1000, max(sequential) / 1000))
+    print("tách pha: trung bình {:8.1f} ms, max {:8.1f} ms".format(
+        sum(pipelined) / N / 1000, max(pipelined) / 1000))
+    print("pha lượt cuối (us):", sm.acquisition_trace)
+
+
+main()
@@ -0,0 +1,221 @@
+"""
+Đo bộ nhớ của mô hình dữ liệu trong một ngày chạy mô phỏng: dict cũ và Reading
+
+    mpremote run bench/bench_footprint.py    (trên thiết bị, gc.mem_alloc)
+    python bench/bench_footprint.py [giờ]    (CPython, tracemalloc)
+
+Đồng hồ mô phỏng chạy từng giây theo config.CHANNEL_PERIODS: mỗi lượt đọc
+công bố snapshot và ghi lịch sử, mỗi SENSOR_READ_INTERVAL đưa một bản ghi vào
+outbox rồi gửi đi. Không đọc cảm biến, không serialize JSON (giống nhau ở hai
+cách), chỉ đo phần dữ liệu đi từ SensorManager đến các nơi dùng.
+
+- Cách cũ: thuộc tính rời + dict alerts dùng chung; mỗi lần công bố tạo dict
+  upload, bản sao alerts, bản sao trong Snapshot và dict changed; outbox nhận
+  thêm một dict nữa
+- Cách mới: mảng giá trị + bitmask cảnh báo; mỗi lần công bố tạo một Reading
+  dùng chung cho snapshot, lịch sử và outbox
+
+Trên MicroPython "cấp phát" là tổng byte cấp phát (churn) đo bằng gc.mem_alloc
+khi tắt GC; trên CPython chỉ đo được đỉnh bộ nhớ tạm trong một lượt.
+"""
+import sys
+import os
+import gc
+from array import array
+
+try:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+except (AttributeError, TypeError):
+    pass  # MicroPython: module nằm cùng thư mục trên flash
+
+import config
+from runtime import ticks_ms, format_time
+from history import History
+from outbox import Outbox
+from snapshot import SnapshotCache
+from reading import Reading, TEMP1, TEMP2, ROOM_TEMP, HUMIDITY, WATER_LEVEL, TANK_VOLUME
+from schema import ALERT_BITS
+
+CHUNK = 60  # Số giây mô phỏng mỗi lần đo (GC tắt trong một chunk)
+
+CHANNEL_VALUES = {
+    "temp1": ("temp1",),
+    "temp2": ("temp2",),
+    "dht22": ("room_temp", "humidity"),
+    "water_level": ("water_level", "tank_volume"),
+}
+THRESHOLDS = {"temp1": 8000, "temp2": 8000, "water_level": 2000}
+
+
+def sample(name, t):
+    """Giá trị fixed-point mô phỏng của kênh name tại giây t"""
+    if name == "temp1":
+        return 2500 + (t // 7) % 40 * 25
+    if name == "temp2":
+        return 7800 + (t // 11) % 30 * 25  # Thỉnh thoảng vượt ngưỡng
+    if name == "room_temp":
+        return 2810 + (t // 13) % 5 * 10
+    if name == "humidity":
+        return 6500 + (t // 17) % 9 * 10
+    if name == "water_level":
+        return 1500 + (t // 30) % 600
+    return (5000 + (t // 30) % 600 * 5)
+
+
+class LegacySnapshot:
+    """Snapshot trước khi có Reading: sao chép dict và alerts"""
+    __slots__ = ("version", "data", "changed")
+
+    def __init__(self, version, data, prev=None):
+        data = dict(data)
+        data["alerts"] = dict(data["alerts"])
+        self.version = version
+        self.data = data
+        self.changed = None
+        if prev is not None:
+            old = prev.data
+            self.changed = {k: data[k] for k in data if old.get(k) != data[k]}
+
+
+class LegacyManager:
+    """Đường dữ liệu cũ của SensorManager (thuộc tính rời, dict)"""
+
+    def __init__(self):
+        self.temp1 = self.temp2 = self.room_temp = self.humidity = 0
+        self.water_level = self.tank_volume = 0
+        self.timestamp = None
+        self.alerts = {"temp1": False, "temp2": False, "water_level": False}
+        self.history = History()
+        self.outbox = Outbox(spill_dir="")
+        self.current = None
+        self.version = 0
+
+    def update(self, channel, t):
+        for name in CHANNEL_VALUES[channel]:
+            setattr(self, name, sample(name, t))
+        self.timestamp = format_time(t)
+
+    def get_upload_data(self):
+        return {
+            "temp1": self.temp1,
+            "temp2": self.temp2,
+            "room_temp": self.room_temp,
+            "humidity": self.humidity,
+            "water_level": self.water_level,
+            "tank_volume": self.tank_volume
+        }
+
+    def publish(self, t, keys):
+        for name in THRESHOLDS:
+            self.alerts[name] = getattr(self, name) > THRESHOLDS[name]
+        data = self.get_upload_data()
+        data["alerts"] = dict(self.alerts)
+        data["timestamp"] = self.timestamp
+        self.history.record(t, data, keys)
+        self.version += 1
+        self.current = LegacySnapshot(self.version, data, self.current)
+
+    def upload(self, t):
+        self.outbox.put(self.get_upload_data(), t)
+        self.outbox.commit(self.outbox.peek())
+
+
+class ReadingManager:
+    """Đường dữ liệu mới của SensorManager (mảng giá trị, Reading dùng chung)"""
+
+    INDEX = {"temp1": TEMP1, "temp2": TEMP2, "room_temp": ROOM_TEMP,
+             "humidity": HUMIDITY, "water_level": WATER_LEVEL, "tank_volume": TANK_VOLUME}
+
+    def __init__(self):
+        self.values = array("i", [0] * 6)
+        self.alert_bits = 0
+        self.timestamp = None
+        self.history = History()
+        self.outbox = Outbox(spill_dir="")
+        self.cache = SnapshotCache(None)
+        self.current = None
+
+    def update(self, channel, t):
+        for name in CHANNEL_VALUES[channel]:
+            self.values[self.INDEX[name]] = sample(name, t)
+        self.timestamp = format_time(t)
+
+    def publish(self, t, keys):
+        for name in THRESHOLDS:
+            if self.values[self.INDEX[name]] > THRESHOLDS[name]:
+                self.alert_bits |= ALERT_BITS[name]
+            else:
+                self.alert_bits &= ~ALERT_BITS[name]
+        self.current = Reading(self.values, self.alert_bits, self.timestamp)
+        self.history.record(t, self.current, keys)
+        self.cache.publish(self.current)
+
+    def upload(self, t):
+        self.outbox.put(self.current, t)
+        self.outbox.commit(self.outbox.peek())
+
+
+def step(manager, t):
+    """Một giây mô phỏng: đọc các kênh đến hạn, công bố, đưa vào outbox"""
+    keys = []
+    for channel in CHANNEL_VALUES:
+        if t % config.CHANNEL_PERIODS.get(channel, config.SENSOR_READ_INTERVAL) == 0:
+            manager.update(channel, t)
+            keys.extend(CHANNEL_VALUES[channel])
+    if keys:
+        manager.publish(t, keys)
+    if t % config.SENSOR_READ_INTERVAL == 0:
+        manager.upload(t)
+
+
+def run(factory, seconds, t0=1700000000):
+    """Trả về (bộ nhớ giữ lại sau khi chạy, tổng cấp phát hoặc đỉnh tạm mỗi chunk)"""
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        base = gc.mem_alloc()
+        manager = factory()
+        churn = 0
+        for start in range(0, seconds, CHUNK):
+            gc.collect()
+            gc.disable()
+            before = gc.mem_alloc()
+            for t in range(start, min(start + CHUNK, seconds)):
+                step(manager, t0 + t)
+            churn += gc.mem_alloc() - before
+            gc.enable()
+        gc.collect()
+        return gc.mem_alloc() - base, churn
+    import tracemalloc
+    tracemalloc.start()
+    manager = factory()
+    peak_transient = 0
+    for start in range(0, seconds, CHUNK):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        for t in range(start, min(start + CHUNK, seconds)):
+            step(manager, t0 + t)
+        current, peak = tracemalloc.get_traced_memory()
+        peak_transient = max(peak_transient, peak - before)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return retained, peak_transient
+
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    seconds = int(hours * 3600)
+    device = hasattr(gc, "mem_alloc")
+    print("mô phỏng {} giờ ({} giây)".format(hours, seconds))
+    print("cách       giữ lại (byte)  {}".format(
+        "cấp phát tổng (byte)  byte/giây" if device else "đỉnh tạm mỗi chunk (byte)"))
+    for label, factory in (("dict cũ  ", LegacyManager), ("Reading  ", ReadingManager)):
+        retained, churn = run(factory, seconds)
+        if device:
+            print("{}  {:14d}  {:20d}  {:9.1f}".format(label, retained, churn, churn / seconds))
+        else:
+            print("{}  {:14d}  {:25d}".format(label, retained, churn))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Kiểm thử tải web server: số client dashboard đồng thời một thiết bị phục vụ được
+
+    python bench/bench_http_load.py [--clients 8] [--seconds 10] [--paths /,/data,/missing]
+                                    [--keep-alive] [--save] [--threshold 0.3]
+
+Chạy WebServer cùng SensorManager trên phần cứng giả lập (gói sim, thời gian
+thực) trong một process con, rồi từ process này mở --clients client đồng
+thời, mỗi client gửi lần lượt các đường dẫn trong --paths trong --seconds
+giây. Mặc định mỗi request một kết nối (Connection: close) như trình duyệt
+mở nhiều tab; --keep-alive dùng lại kết nối (server chỉ giữ
+HTTP_MAX_KEEPALIVE kết nối, các kết nối khác bị đóng và mở lại).
+
+Kết quả: throughput (req/s), p50/p95/p99 độ trễ (ms) và byte mỗi response
+theo từng đường dẫn, và đỉnh heap của server (tracemalloc, đo ở một lượt
+chạy riêng ngắn hơn vì tracemalloc làm chậm server).
+
+Kết quả được so với bench/http_load_baseline.json (cùng cấu hình): chỉ số
+xấu đi quá --threshold (tỷ lệ) thì in REGRESSION và thoát với mã 1. --save
+ghi kết quả lần chạy này làm baseline. Baseline phụ thuộc máy nên không nằm
+trong repo (.gitignore): chạy với --save trên máy của mình trước khi sửa code,
+rồi chạy lại không có --save sau khi sửa để so sánh.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "http_load_baseline.json")
+
+# Chỉ số so với baseline: (đường dẫn trong kết quả, 1 = càng lớn càng tốt, -1 = càng nhỏ càng tốt)
+CHECKS = (
+    ("throughput_rps", 1),
+    ("heap_peak_bytes", -1),
+)
+PATH_CHECKS = (("p50_ms", -1), ("p95_ms", -1), ("p99_ms", -1), ("bytes", -1))
+
+
+def serve(port, heap):
+    """Process con: main() thu nhỏ trên phần cứng giả lập, in đỉnh heap khi nhận SIGINT"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "tools"))
+    import sim
+    world = sim.install(speed=1)
+    world.wlan_state(0).connect_delay = 0
+
+    import config
+    config.LOG_CONSOLE_LEVEL = "warning"
+    config.HTTP_PORT = port
+    from iriv_standin import Standin
+    world.routes[(config.IRIV_IP, config.IRIV_PORT)] = Standin(config.IRIV_IDLE_TIMEOUT * 2, 0, verbose=False).client
+
+    import runtime
+    from sensors import SensorManager
+    from wifi_manager import WiFiManager
+    from webserver import WebServer
+    os.chdir(ROOT)
+    sensor_manager = SensorManager(2, 1, 0, 6, 5, 4, 15, iriv_ip=config.IRIV_IP)
+    wifi_manager = WiFiManager()
+    wifi_manager.connect()
+    web_server = WebServer(wifi_manager, sensor_manager)
+
+    if heap:
+        import tracemalloc
+        import gc
+        gc.collect()
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+    try:
+        runtime.asyncio.run(runtime.run(sensor_manager, web_server))
+    except KeyboardInterrupt:
+        pass
+    result = {}
+    if heap:
+        result["heap_peak_bytes"] = tracemalloc.get_traced_memory()[1] - base
+    print("RESULT " + json.dumps(result), flush=True)
+
+
+def start_server(port, heap):
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", str(port)]
+    if heap:
+        cmd.append("--heap")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server không khởi động được:\n" + proc.stdout.read())
+
+
+def stop_server(proc):
+    """Dừng server (SIGINT), trả về dict RESULT nó in ra"""
+    proc.send_signal(signal.SIGINT)
+    out, _ = proc.communicate(timeout=30)
+    for line in out.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[7:])
+    raise RuntimeError("server không trả kết quả:\n" + out)
+
+
+async def request(port, path, conn, keep_alive):
+    """Gửi một GET, trả về (số byte response, kết nối còn dùng được hay None)"""
+    if conn is None:
+        conn = await asyncio.open_connection("127.0.0.1", port)
+    reader, writer = conn
+    writer.write("GET {} HTTP/1.1\r\nHost: bench\r\nConnection: {}\r\n\r\n".format(
+        path, "keep-alive" if keep_alive else "close").encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    close = not keep_alive
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection" and value.strip().lower() == b"close":
+            close = True
+    await reader.readexactly(length)
+    if close:
+        writer.close()
+        return len(head) + length, None
+    return len(head) + length, conn
+
+
+async def client(port, paths, keep_alive, until, samples, errors):
+    conn = None
+    i = 0
+    while time.monotonic() < until:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            size, conn = await request(port, path, conn, keep_alive)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            errors[0] += 1
+            if conn is not None:
+                conn[1].close()
+            conn = None
+            continue
+        samples[path].append((time.perf_counter() - start, size))
+    if conn is not None:
+        conn[1].close()
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def load(port, clients, seconds, paths, keep_alive):
+    samples = {path: [] for path in paths}
+    errors = [0]
+    start = time.monotonic()
+    until = start + seconds
+    await asyncio.gather(*[client(port, paths, keep_alive, until, samples, errors) for _ in range(clients)])
+    elapsed = time.monotonic() - start
+
+    total = sum(len(s) for s in samples.values())
+    result = {"requests": total, "errors": errors[0], "throughput_rps": round(total / elapsed, 1), "paths": {}}
+    for path, items in samples.items():
+        if not items:
+            continue
+        latencies = sorted(t * 1000 for t, _ in items)
+        result["paths"][path] = {
+            "requests": len(items),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "bytes": round(sum(size for _, size in items) / len(items)),
+        }
+    return result
+
+
+def compare(result, baseline, threshold):
+    """Danh sách dòng REGRESSION (rỗng nếu không có chỉ số nào xấu đi quá threshold)"""
+    found = []
+
+    def check(name, value, base, direction):
+        if value is None or not base:
+            return
+        change = (value - base) / base
+        if change * direction < -threshold:
+            found.append("REGRESSION {}: {} -> {} ({:+.0%})".format(name, base, value, change))
+
+    for key, direction in CHECKS:
+        check(key, result.get(key), baseline.get(key), direction)
+    for path, stats in result["paths"].items():
+        base = baseline.get("paths", {}).get(path, {})
+        for key, direction in PATH_CHECKS:
+            check("{} {}".format(path, key), stats.get(key), base.get(key), direction)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--paths", default="/,/data,/missing")
+    parser.add_argument("--keep-alive", action="store_true")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="ghi kết quả làm baseline")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--heap", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.heap)
+        return 0
+
+    paths = args.paths.split(",")
+    key = "clients={} paths={} keep_alive={}".format(args.clients, args.paths, args.keep_alive)
+
+    proc = start_server(args.port, False)
+    try:
+        result = asyncio.run(load(args.port, args.clients, args.seconds, paths, args.keep_alive))
+    finally:
+        stop_server(proc)
+    # Đỉnh heap: lượt riêng có tracemalloc
+    proc = start_server(args.port, True)
+    try:
+        asyncio.run(load(args.port, args.clients, min(args.seconds, 3), paths, args.keep_alive))
+    finally:
+        result["heap_peak_bytes"] = stop_server(proc).get("heap_peak_bytes")
+
+    print(key)
+    print("requests={requests} errors={errors} throughput={throughput_rps} req/s "
+          "heap_peak={heap_peak_bytes} B".format(**result))
+    print("{:<12} {:>8} {:>8} {:>8} {:>8} {:>8}".format("path", "requests", "p50 ms", "p95 ms", "p99 ms", "bytes"))
+    for path, stats in result["paths"].items():
+        print("{:<12} {requests:>8} {p50_ms:>8} {p95_ms:>8} {p99_ms:>8} {bytes:>8}".format(path, **stats))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    if args.save:
+        baselines[key] = result
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print("đã ghi baseline: " + args.baseline)
+        return 0
+    if key not in baselines:
+        print("chưa có baseline cho cấu hình này (chạy lại với --save)")
+        return 0
+    regressions = compare(result, baselines[key], args.threshold)
+    for line in regressions:
+        print(line)
+    if result["errors"]:
+        print("REGRESSION errors: {}".format(result["errors"]))
+        regressions.append("errors")
+    print("OK" if not regressions else "FAIL ({} chỉ số)".format(len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
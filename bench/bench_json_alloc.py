@@ -0,0 +1,105 @@
+"""
+Đo bộ nhớ cấp phát cho mỗi request /data: cách cũ và SnapshotWriter
+
+    mpremote run bench/bench_json_alloc.py   (trên thiết bị, dùng gc.mem_alloc)
+    python bench/bench_json_alloc.py         (CPython, dùng tracemalloc)
+
+Cách cũ: thay None bằng 0.0, json.dumps, encode, nối chuỗi header rồi encode.
+Cách mới: JSON serialize một lần mỗi snapshot vào bộ đệm cấp sẵn, mỗi request
+chỉ ghi các hằng bytes và bytes đã cache.
+"""
+import sys
+import os
+import gc
+import json
+
+try:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+except (AttributeError, TypeError):
+    pass  # MicroPython: module nằm cùng thư mục trên flash
+
+from jsonwriter import SnapshotWriter
+from reading import Reading
+
+N = 100
+CONN = b"Connection: close\r\n\r\n"
+PREFIX = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: "
+
+# Snapshot fixed-point (fixedpoint.py) cho SnapshotWriter, cảnh báo water_level bật
+DATA = Reading((2525, 3050, 2810, 6530, 1502, 0), 4, "2024-01-01 12:00:00")
+# Cùng snapshot dạng dict float như cách cũ
+FLOAT_DATA = {
+    "temp1": 25.25, "temp2": 30.5, "room_temp": 28.1, "humidity": 65.3,
+    "water_level": 1.502, "tank_volume": None,
+    "alerts": {"temp1": False, "temp2": False, "water_level": True},
+    "timestamp": DATA.timestamp,
+}
+
+
+class Sink:
+    """Thay cho StreamWriter: chỉ đếm số byte"""
+    n = 0
+
+    def write(self, b):
+        self.n += len(b)
+
+
+def old_request(sink):
+    data = {}
+    for key in FLOAT_DATA:
+        value = FLOAT_DATA[key]
+        data[key] = 0.0 if value is None and key != "alerts" else value
+    json_bytes = json.dumps(data).encode()
+    response = "HTTP/1.1 200 OK\r\n"
+    response += "Content-Type: application/json\r\n"
+    response += f"Content-Length: {len(json_bytes)}\r\n"
+    sink.write(response.encode())
+    sink.write(CONN)
+    sink.write(json_bytes)
+
+
+writer = SnapshotWriter()
+body = writer.dumps(DATA)
+length = str(len(body)).encode() + b"\r\n"
+
+
+def new_request(sink):
+    sink.write(PREFIX)
+    sink.write(length)
+    sink.write(CONN)
+    sink.write(body)
+
+
+def new_serialize(sink):
+    sink.write(writer.view[:writer.write(DATA)])
+
+
+def allocated(fn):
+    """Số byte cấp phát trung bình mỗi lần gọi fn"""
+    sink = Sink()
+    fn(sink)  # làm nóng
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(N):
+            fn(sink)
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used / N
+    import tracemalloc
+    tracemalloc.start()
+    fn(sink)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    print("JSON mới ({} byte): {}".format(len(body), body.decode()))
+    print("cách cũ, mỗi request        : {:7.1f} byte".format(allocated(old_request)))
+    print("cách mới, mỗi request       : {:7.1f} byte".format(allocated(new_request)))
+    print("cách mới, serialize snapshot: {:7.1f} byte".format(allocated(new_serialize)))
+
+
+main()
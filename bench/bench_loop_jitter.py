@@ -0,0 +1,136 @@
+"""
+Đo độ trễ (jitter) của vòng lặp asyncio khi 20 client liên tục gọi /data
+
+Chạy trên CPython: python bench/bench_loop_jitter.py [số_client] [số_giây] [--stub]
+
+Mặc định SensorManager chạy trên phần cứng giả lập (gói sim, đồng hồ thật)
+và task đọc cảm biến của runtime chạy song song với web server, với chu kỳ
+kênh rút ngắn (BENCH_PERIODS) để trong vài giây đã có nhiều giao dịch Modbus
+(slave trả lời sau 20-25 ms) và lần đo DHT22 (DHT22_MEASURE_MS): độ trễ đo
+được bao gồm cả phần đọc cảm biến. --stub chỉ đo web server với dữ liệu cố
+định (BenchSensors), không đọc cảm biến.
+"""
+import sys
+import os
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+PORT = 8081
+PROBE_PERIOD_MS = 10
+
+# Chu kỳ kênh (giây) khi đo cùng task đọc cảm biến
+BENCH_PERIODS = {"temp1": 0.2, "temp2": 0.2, "dht22": 2, "water_level": 0.25}
+# Thời gian một lần DHT22.measure() trên thiết bị (xung start 18 ms + khung 40 bit)
+DHT22_MEASURE_MS = 25
+
+
+class BenchWLAN:
+    def isconnected(self):
+        return True
+
+
+class BenchWiFi:
+    wlan = BenchWLAN()
+
+    def get_ip(self):
+        return "127.0.0.1"
+
+
+class BenchSensors:
+    """Dữ liệu cố định, không chạm phần cứng"""
+
+    def __init__(self):
+        # Import muộn: sim.install() phải chạy trước khi import firmware
+        from reading import Reading
+        from snapshot import SnapshotCache
+        # 25.00 °C, 30.00 °C, 28.00 °C, 65.00 %, 1500 mm, 500.0 L (fixed-point)
+        self.reading = Reading((2500, 3000, 2800, 6500, 1500, 5000), 0, "2000-01-01 00:00:00")
+        self.cache = SnapshotCache(self.read_all)
+        self.cache.publish(self.reading)
+
+    def read_all(self, upload=True):
+        return self.reading
+
+
+def sim_sensors():
+    """SensorManager trên phần cứng giả lập, chu kỳ kênh theo BENCH_PERIODS"""
+    import sim
+    world = sim.install(realtime=True)
+    for sensor in world.dht.values():
+        sensor.measure_ms = DHT22_MEASURE_MS
+
+    import config
+    config.LOG_CONSOLE_LEVEL = "warning"
+    config.TELEMETRY_LOG_ENABLED = False
+    config.CHANNEL_PERIODS = BENCH_PERIODS
+    config.DHT22_MIN_INTERVAL = BENCH_PERIODS["dht22"]
+    from sensors import SensorManager
+    return SensorManager(2, 1, 0, 6, 5, 4, 15, iriv_ip=config.IRIV_IP)
+
+
+async def probe(lateness, stop):
+    """Task ngủ PROBE_PERIOD_MS và ghi lại độ trễ so với lịch"""
+    from runtime import asyncio, ticks_ms, ticks_diff
+    while not stop:
+        t0 = ticks_ms()
+        await asyncio.sleep(PROBE_PERIOD_MS / 1000)
+        lateness.append(ticks_diff(ticks_ms(), t0) - PROBE_PERIOD_MS)
+
+
+async def client(counter, stop):
+    from runtime import asyncio
+    while not stop:
+        reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+        writer.write(b"GET /data HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        status = await reader.readline()
+        while await reader.read(1024):
+            pass
+        writer.close()
+        counter[0] += 1
+        if not status.startswith(b"HTTP/1.1 200"):
+            counter[1] += 1
+
+
+async def bench(sensors, n_clients, seconds):
+    import runtime
+    from runtime import asyncio
+    from webserver import WebServer
+    server = WebServer(BenchWiFi(), sensors, port=PORT)
+    await server.start()
+    lateness = []
+    counter = [0, 0]  # [số request, số response không phải 200]
+    stop = []
+    tasks = [asyncio.create_task(probe(lateness, stop))]
+    tasks += [asyncio.create_task(client(counter, stop)) for _ in range(n_clients)]
+    acquisition = None
+    if hasattr(sensors, "run_due_async"):
+        acquisition = asyncio.create_task(runtime.acquisition_task(sensors))
+    await asyncio.sleep(seconds)
+    stop.append(True)
+    await asyncio.gather(*tasks)
+    if acquisition is not None:
+        acquisition.cancel()
+        await asyncio.gather(acquisition, return_exceptions=True)
+    server.stop()
+
+    lateness.sort()
+    n = len(lateness)
+    print("clients={} requests={} ({:.0f} req/s) errors={}".format(
+        n_clients, counter[0], counter[0] / seconds, counter[1]))
+    if acquisition is not None:
+        modbus = sensors.iriv.modbus.stats
+        print("acquisition: snapshots={} modbus transactions={} timeouts={}".format(
+            sensors.cache.version, modbus["transactions"], modbus["timeouts"]))
+    print("jitter ms: p50={} p99={} max={}".format(
+        lateness[n // 2], lateness[min(n - 1, n * 99 // 100)], lateness[-1]))
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--stub"]
+    n_clients = int(args[0]) if len(args) > 0 else 20
+    seconds = float(args[1]) if len(args) > 1 else 5
+    sensors = BenchSensors() if "--stub" in sys.argv else sim_sensors()
+    from runtime import asyncio
+    asyncio.run(bench(sensors, n_clients, seconds))
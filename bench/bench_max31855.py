@@ -0,0 +1,44 @@
+"""
+So sánh tốc độ đọc MAX31855: bit-bang và SPI phần cứng (chạy trên thiết bị)
+
+    mpremote run bench/bench_max31855.py
+
+Hai cảm biến nối chung SCK/SO, khác CS (chỉnh các chân bên dưới).
+Việc đọc là chặn (busy) nên us/read cũng chính là thời gian CPU mỗi lần đọc.
+"""
+import time
+import gc
+import machine
+import config
+import max31855
+
+SCK_PIN = 2
+SO_PIN = 0
+CS_PINS = (1, 4)
+SPI_ID = config.MAX31855_SPI_ID if config.MAX31855_SPI_ID is not None else 0
+N = 200
+
+
+def bench(name, bus):
+    gc.collect()
+    t0 = time.ticks_us()
+    for _ in range(N):
+        bus.read_all()
+    elapsed = time.ticks_diff(time.ticks_us(), t0)
+    reads = N * len(bus.devices)
+    print("{:10s} {:8.0f} reads/s  {:6.1f} us/read  temps={}".format(
+        name, reads * 1000000 / elapsed, elapsed / reads, bus.read_all()))
+
+
+def main():
+    sck = machine.Pin(SCK_PIN)
+    so = machine.Pin(SO_PIN)
+    cs = [machine.Pin(p) for p in CS_PINS]
+
+    bench("bit-bang", max31855.MAX31855Bus(max31855.BitBangTransport(sck, so), cs))
+
+    spi = max31855.make_spi(SPI_ID, machine.Pin(SCK_PIN), machine.Pin(SO_PIN), config.MAX31855_BAUDRATE)
+    bench("spi", max31855.MAX31855Bus(max31855.SPITransport(spi), cs))
+
+
+main()
@@ -0,0 +1,76 @@
+"""
+Đo độ trễ giao dịch Modbus RTU trên UART loopback (chạy trên CPython)
+
+    python bench/bench_modbus.py [latency_ms] [số_lần]
+
+So sánh cách cũ (ngủ cố định 100 ms, mỗi thanh ghi một giao dịch) với
+ModbusMaster (nhận theo độ dài/khoảng lặng 3.5 ký tự, gộp thanh ghi), và
+CRC bit-by-bit với CRC bảng tra.
+"""
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import config
+from modbus import ModbusMaster, crc16, read_request
+from modbus_loopback import LoopbackUART, RegisterSlave
+
+
+def crc_bitwise(data):
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc & 0xFFFF
+
+
+def old_read(uart, slave, register):
+    """Cách cũ trong IRIVController.read_level_sensor: ghi, ngủ 100 ms, đọc một lần"""
+    uart.read()
+    uart.write(read_request(slave, register, 1))
+    time.sleep(0.1)
+    response = uart.read()
+    return (response[3] << 8) | response[4]
+
+
+def timed(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) * 1000 / n
+
+
+def main():
+    latency_ms = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    slave_addr = config.MODBUS_SLAVE_ADDRESS
+    registers = config.MODBUS_REGISTERS
+    slave = RegisterSlave(slave_addr, {addr: 1000 + addr for addr in range(0, 16)}, latency_ms)
+
+    uart = LoopbackUART(slave)
+    old_one = timed(lambda: old_read(uart, slave_addr, registers["WATER_LEVEL"]), n)
+    old_all = old_one * len(registers)
+
+    master = ModbusMaster(LoopbackUART(slave))
+    new_one = timed(lambda: master.read_registers(slave_addr, registers["WATER_LEVEL"], 1), n)
+    master.stats["transactions"] = 0
+    new_all = timed(lambda: master.read_map(slave_addr, registers, config.MODBUS_MAX_GAP), n)
+
+    print("slave latency {} ms, 9600 baud".format(latency_ms))
+    print("1 thanh ghi     : cũ {:7.1f} ms   mới {:7.1f} ms".format(old_one, new_one))
+    print("{} thanh ghi     : cũ {:7.1f} ms   mới {:7.1f} ms ({} giao dịch)".format(
+        len(registers), old_all, new_all, master.stats["transactions"] // n))
+
+    frame = bytes(range(256))
+    print("CRC 256 byte    : bit-by-bit {:7.1f} us   bảng tra {:7.1f} us".format(
+        timed(lambda: crc_bitwise(frame), 200) * 1000, timed(lambda: crc16(frame), 200) * 1000))
+
+
+if __name__ == "__main__":
+    main()
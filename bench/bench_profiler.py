@@ -0,0 +1,100 @@
+"""
+Chi phí của profiler.py khi tắt và khi bật
+
+    python bench/bench_profiler.py          (CPython)
+    mpremote run bench/bench_profiler.py    (trên thiết bị, cần chép profiler.py lên)
+
+So sánh thời gian mỗi lời gọi của một method rất ngắn (trường hợp xấu nhất
+cho chi phí tương đối) ở ba trạng thái: class không đánh dấu, class đánh dấu
+bằng traced() khi profiler tắt, và khi profiler bật. Khi tắt, method trên
+class phải đúng là hàm gốc.
+"""
+import sys
+import os
+import time
+
+try:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+except (AttributeError, TypeError):
+    pass  # MicroPython: module nằm cùng thư mục trên flash
+
+import profiler
+
+N = 20000
+ROUNDS = 5
+
+
+class Plain:
+    def read_raw(self):
+        return 0x01900000
+
+
+@profiler.traced("read_raw")
+class Traced:
+    def read_raw(self):
+        return 0x01900000
+
+
+def per_call_us(fn):
+    """Thời gian trung bình mỗi lần gọi (us), lấy vòng nhanh nhất trong ROUNDS"""
+    best = None
+    for _ in range(ROUNDS):
+        if hasattr(time, "ticks_us"):
+            t0 = time.ticks_us()
+            fn(N)
+            us = time.ticks_diff(time.ticks_us(), t0)
+        else:
+            t0 = time.perf_counter()
+            fn(N)
+            us = (time.perf_counter() - t0) * 1000000
+        if best is None or us < best:
+            best = us
+    return best / N
+
+
+def calls(obj):
+    def run(n):
+        for _ in range(n):
+            obj.read_raw()
+    return run
+
+
+def spans(n):
+    for _ in range(n):
+        with profiler.span("bench"):
+            pass
+
+
+def empty(n):
+    for _ in range(n):
+        pass
+
+
+def main():
+    original = Traced.__dict__["read_raw"]
+    plain = per_call_us(calls(Plain()))
+    disabled = per_call_us(calls(Traced()))
+    same = Traced.__dict__["read_raw"] is original
+    loop = per_call_us(empty)
+    span_off = per_call_us(spans)
+
+    profiler.enable()
+    enabled = per_call_us(calls(Traced()))
+    span_on = per_call_us(spans)
+    result = profiler.report(2)
+    profiler.disable()
+    restored = Traced.__dict__["read_raw"] is original
+
+    print("vòng lặp rỗng              : {:7.3f} us".format(loop))
+    print("method không đánh dấu      : {:7.3f} us".format(plain))
+    print("method đánh dấu, tắt       : {:7.3f} us ({:+.3f} us)".format(disabled, disabled - plain))
+    print("method đánh dấu, bật       : {:7.3f} us ({:+.3f} us)".format(enabled, enabled - plain))
+    print("span() tắt                 : {:7.3f} us".format(span_off - loop))
+    print("span() bật                 : {:7.3f} us".format(span_on - loop))
+    print("khi tắt method là hàm gốc  : {} (sau disable(): {})".format(same, restored))
+    for entry in result["top"]:
+        print("  {name}: {calls} lần, {incl_us} us".format(**entry))
+
+
+if __name__ == "__main__":
+    main()
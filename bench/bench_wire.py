@@ -0,0 +1,76 @@
+"""
+So sánh kích thước và thời gian mã hóa: JSON và định dạng nhị phân (wire.py)
+
+    python bench/bench_wire.py          (CPython)
+    mpremote run bench/bench_wire.py    (trên thiết bị, cần chép wire.py lên)
+
+Số byte tính cả header HTTP của request POST như IRIVController gửi.
+"""
+import sys
+import os
+import time
+
+try:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+except (AttributeError, TypeError):
+    pass  # MicroPython: module nằm cùng thư mục trên flash
+
+import wire
+from jsonwriter import SnapshotWriter
+from reading import Reading
+
+writer = SnapshotWriter()
+
+HEADER = ("POST /api/data HTTP/1.1\r\nHost: 192.168.1.100\r\n"
+          "Content-Type: {}\r\nContent-Length: {}\r\n\r\n")
+
+
+def samples(n):
+    """Chuỗi mẫu mỗi 60 s với dao động nhỏ như dữ liệu thật"""
+    items = []
+    for i in range(n):
+        items.append((1700000000 + 60 * i, Reading((
+            2500 + (i % 7) * 25,        # temp1
+            3000 - (i % 5) * 25,        # temp2
+            2810 + (i % 3) * 10,        # room_temp
+            6500 + (i % 4) * 30,        # humidity
+            1500 + i * 2,               # water_level
+            5000 + i * 7,               # tank_volume
+        ))))
+    return items
+
+
+def json_body(items):
+    """Thân JSON như IRIVController.send_batch_async()"""
+    readings = []
+    for t, data in items:
+        readings.append(writer.dumps(data, alerts=False, timestamp="2023-11-14 22:13:20"))
+    return readings[0] if len(readings) == 1 else b"[" + b", ".join(readings) + b"]"
+
+
+def timed(fn, n):
+    t0 = time.ticks_us() if hasattr(time, "ticks_us") else time.perf_counter()
+    for _ in range(n):
+        fn()
+    if hasattr(time, "ticks_us"):
+        return time.ticks_diff(time.ticks_us(), t0) / n
+    return (time.perf_counter() - t0) * 1000000 / n
+
+
+def main():
+    print("lô   JSON B/mẫu  nhị phân B/mẫu   JSON us/mẫu  nhị phân us/mẫu")
+    for batch in (1, 10, 60):
+        items = samples(batch)
+        jb = json_body(items)
+        wb = wire.encode(items)
+        assert len(wire.decode(wb)) == batch
+        j_total = len(jb) + len(HEADER.format("application/json", len(jb)))
+        w_total = len(wb) + len(HEADER.format(wire.CONTENT_TYPE, len(wb)))
+        reps = max(1, 200 // batch)
+        j_us = timed(lambda: json_body(items), reps) / batch
+        w_us = timed(lambda: wire.encode(items), reps) / batch
+        print("{:3d}   {:10.1f}  {:14.1f}   {:11.1f}  {:15.1f}".format(
+            batch, j_total / batch, w_total / batch, j_us, w_us))
+
+
+main()
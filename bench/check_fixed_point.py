@@ -0,0 +1,134 @@
+"""
+Kiểm tra đường fixed-point cho cùng kết quả với đường float cũ
+
+    python bench/check_fixed_point.py
+
+Quét khung thô MAX31855, byte DHT22, giá trị thanh ghi mực nước (mm) và
+kích thước bể; với mỗi mẫu so sánh:
+- giá trị số (JSON, wire, lịch sử): lệch so với float cũ không quá 0.5/hệ số
+- chuỗi hiển thị (trang web, log): giống f"{x:.nf}" cũ, trừ trường hợp giá
+  trị nằm đúng giữa hai số (float làm tròn theo biểu diễn nhị phân, fixed-point
+  làm tròn nửa xa số 0) thì được lệch 1 ở chữ số cuối
+Thoát với mã 1 nếu có sai khác.
+"""
+import sys
+import os
+import json
+
+try:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+except (AttributeError, TypeError):
+    pass  # MicroPython: module nằm cùng thư mục trên flash
+
+try:
+    import machine
+except ImportError:
+    # Máy host: max31855 import Pin/SPI nhưng ở đây chỉ dùng decode()/decode_quarters()
+    import types
+    machine = types.ModuleType("machine")
+    machine.Pin = machine.SPI = None
+    sys.modules["machine"] = machine
+
+import max31855
+import wire
+from schema import CHANNELS
+from fixedpoint import format_channel, to_fixed
+from jsonwriter import SnapshotWriter
+
+errors = []
+checked = [0]
+
+
+def check(name, old, new, places, context):
+    """So sánh float cũ old với fixed-point new của kênh name"""
+    checked[0] += 1
+    scale = CHANNELS[name][0]
+    if abs(new / scale - old) > 0.5 / scale + 1e-9:
+        errors.append("{} {}: giá trị {} != {}".format(name, context, new / scale, old))
+    old_text = "{:.{}f}".format(old, places)
+    if float(old_text) == 0:
+        old_text = old_text.lstrip("-")  # float cũ có thể in "-0.0"
+    new_text = format_channel(name, new, places)
+    if old_text != new_text:
+        step = 10 ** -places
+        tie = abs(abs(old) / step % 1 - 0.5) < 1e-6
+        if not tie or abs(float(old_text) - float(new_text)) > step * 1.01:
+            errors.append("{} {}: hiển thị {} != {}".format(name, context, new_text, old_text))
+
+
+def check_max31855():
+    # 14 bit nhiệt độ (D31:D18) trên toàn dải, kèm bit D17:D0 khác nhau
+    for temp_data in range(0, 0x4000, 3):
+        for low in (0x0000, 0x0FF0, 0x1FFF0):
+            raw = (temp_data << 18) | (low & ~0x10007)
+            old = max31855.decode(raw)
+            quarters = max31855.decode_quarters(raw)
+            new = None if quarters is None else quarters * 25
+            if old is None or new is None:
+                if old is not new:
+                    errors.append("MAX31855 0x{:08X}: cờ lỗi khác nhau".format(raw))
+                continue
+            check("temp1", old, new, 1, "raw=0x{:08X}".format(raw))
+
+
+def check_dht22():
+    for hi in range(0, 0x04):
+        for lo in range(256):
+            value = (hi << 8) | lo
+            # Độ ẩm và nhiệt độ (dương/âm) từ cùng hai byte
+            check("humidity", value * 0.1, value * 10, 1, "raw={}".format(value))
+            for sign in (0, 0x80):
+                old = value * 0.1 * (-1 if sign else 1)
+                new = -value * 10 if sign else value * 10
+                check("room_temp", old, new, 1, "raw={} sign={}".format(value, sign))
+
+
+def check_level():
+    for height, capacity in ((2.0, 1000.0), (1.5, 750.0), (3.2, 2500.0), (0.8, 123.4)):
+        height_mm = to_fixed("water_level", height)
+        capacity_dl = to_fixed("tank_volume", capacity)
+        for mm in range(0, int(height * 1000) + 1, 7):
+            level = mm / 1000.0
+            volume = (level / height) * capacity
+            new_volume = (2 * mm * capacity_dl + height_mm) // (2 * height_mm)
+            context = "mm={} bể {}m/{}L".format(mm, height, capacity)
+            check("water_level", level, mm, 2, context)
+            check("tank_volume", volume, new_volume, 1, context)
+
+
+def check_serialized():
+    """JSON (SnapshotWriter) và wire của một bản ghi fixed-point khớp float cũ"""
+    writer = SnapshotWriter()
+    samples = [
+        ({"temp1": 2525, "temp2": -1075, "room_temp": 2810, "humidity": 6530,
+          "water_level": 1502, "tank_volume": 7510},
+         {"temp1": 25.25, "temp2": -10.75, "room_temp": 28.1, "humidity": 65.3,
+          "water_level": 1.502, "tank_volume": 751.0}),
+        ({"temp1": 0, "temp2": 102375, "room_temp": -400, "humidity": 10000,
+          "water_level": 5, "tank_volume": 3},
+         {"temp1": 0.0, "temp2": 1023.75, "room_temp": -4.0, "humidity": 100.0,
+          "water_level": 0.005, "tank_volume": 0.3}),
+    ]
+    for fixed, old in samples:
+        decoded = json.loads(writer.dumps(fixed, alerts=False))
+        unpacked = wire.decode(wire.encode([(1700000000, fixed)]))[0]
+        for name in old:
+            for source, value in (("JSON", decoded[name]), ("wire", unpacked[name])):
+                checked[0] += 1
+                if abs(value - old[name]) > 0.5 / CHANNELS[name][0]:
+                    errors.append("{} {}: {} != {}".format(source, name, value, old[name]))
+
+
+def main():
+    check_max31855()
+    check_dht22()
+    check_level()
+    check_serialized()
+    for line in errors[:20]:
+        print(line)
+    print("{} phép so sánh, {} sai khác".format(checked[0], len(errors)))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
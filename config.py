@@ -1,12 +1,22 @@
-DEBUG = True
+# Nhật ký (logger.py): "debug", "info", "warning" hoặc "error"
+LOG_LEVEL = "info"          # Mức ghi vào bộ đệm trong RAM (đổi lúc chạy: /logs?set=debug)
+LOG_CONSOLE_LEVEL = "info"  # Bản ghi từ mức này trở lên còn được in ra console (USB-CDC)
+LOG_BUFFER = 64             # Số bản ghi gần nhất giữ trong RAM cho /logs
 
 # Cấu hình WiFi
 WIFI_SSID = "test"
 WIFI_PASSWORD = "test"
+NTP_HOST = "pool.ntp.org"  # Đồng bộ RTC sau khi kết nối WiFi (None = không đồng bộ)
 
 # Cấu hình IRIV Controller
 IRIV_IP = "192.168.1.100"  # Thay đổi thành địa chỉ IP thực tế của IRIV Controller
 IRIV_PORT = 80
+IRIV_HTTP_TIMEOUT = 5   # Thời gian chờ kết nối/phản hồi HTTP (giây)
+# Kết nối keep-alive rảnh quá lâu thì mở lại. Phải lớn hơn SENSOR_READ_INTERVAL để
+# kết nối được dùng lại giữa hai lần upload; nếu server đã đóng trước đó thì
+# request được gửi lại trên kết nối mới (http_client.HTTPConnection)
+IRIV_IDLE_TIMEOUT = 150
+IRIV_WIRE_FORMAT = "json"  # "json" hoặc "binary" (wire.py, gọn hơn ~10 lần khi gửi theo lô)
 
 # Cấu hình Modbus/RS485 cho cảm biến QDY30A-B
 MODBUS_SLAVE_ADDRESS = 0x01  # Địa chỉ slave mặc định của cảm biến (thường là 1)
@@ -17,6 +27,11 @@ MODBUS_REGISTERS = {
     "BATTERY": 0x0008,      # Thanh ghi chứa giá trị pin (nếu có)
     "STATUS": 0x000A        # Thanh ghi chứa trạng thái thiết bị (nếu có)
 }
+MODBUS_TIMEOUT_MS = 200  # Thời gian chờ byte đầu tiên của phản hồi
+MODBUS_MAX_GAP = 4       # Gộp các thanh ghi cách nhau tối đa chừng này vào một lần đọc
+MODBUS_BACKOFF_MIN = 5   # Bỏ qua slave không trả lời trong số giây này (gấp đôi sau mỗi lần lỗi)
+MODBUS_BACKOFF_MAX = 300 # Thời gian bỏ qua tối đa (giây)
+MODBUS_LEVEL_MAX = 0x7FFF # Mực nước lớn nhất hợp lệ (mm); lớn hơn là mã lỗi/số âm của cảm biến
 
 # Cấu hình UART cho RS485
 UART_ID = 1
@@ -24,6 +39,11 @@ UART_TX_PIN = 8
 UART_RX_PIN = 9
 UART_DE_PIN = 10  # Có thể là None nếu không sử dụng
 
+# Cấu hình MAX31855: None = bit-bang, hoặc ID của SPI phần cứng (0/1)
+# SPI phần cứng chỉ dùng khi hai MAX31855 chung chân SCK/SO (khác CS)
+MAX31855_SPI_ID = None
+MAX31855_BAUDRATE = 5000000  # Tối đa 5 MHz theo datasheet
+
 # Cấu hình ngưỡng cảnh báo
 WATER_THRESHOLD = 2.0  # Ngưỡng mực nước (m)
 TEMP1_THRESHOLD = 80.0 # Ngưỡng nhiệt độ cảm biến 1 (°C)
@@ -36,32 +56,99 @@ EMAIL_RECIPIENT = ""
 
 PHONE_NUMBER = ""
 
-# Thời gian giữa các lần đọc cảm biến (giây)
+# Thời gian giữa các lần đọc cảm biến / gửi dữ liệu lên IRIV (giây)
 SENSOR_READ_INTERVAL = 60
 
+# Chu kỳ đọc riêng cho từng kênh (giây), kênh không có ở đây dùng SENSOR_READ_INTERVAL
+CHANNEL_PERIODS = {
+    "temp1": 5,          # MAX31855 đọc < 1 ms
+    "temp2": 5,
+    "dht22": 10,         # DHT22 không đọc nhanh hơn DHT22_MIN_INTERVAL
+    "water_level": 30,   # QDY30A-B mất 100+ ms cho mỗi giao dịch Modbus
+}
+DHT22_MIN_INTERVAL = 2
+
+# Tuổi tối đa của snapshot dữ liệu phục vụ web (giây), quá hạn sẽ đọc lại cảm biến
+SNAPSHOT_MAX_AGE = 90
+
+# Chủ động gc.collect() giữa các lượt đọc mỗi số giây này (0 = để MicroPython tự
+# thu gom khi hết heap, có thể rơi vào giữa một giao dịch)
+GC_COLLECT_INTERVAL = 10
+
+# Profiler các hàm đường nóng (profiler.py, /debug/profile): bật sẵn khi khởi
+# động hay không, và số mục tối đa của bảng kết quả
+PROFILE_ENABLED = False
+PROFILE_SLOTS = 24
+
+# Trace thô của phần cứng (hwtrace.py) để phát lại sự cố trên máy host bằng
+# tools/replay_trace.py. Ngừng ghi khi file đạt TRACE_MAX_BYTES.
+TRACE_ENABLED = False
+TRACE_FILE = "trace.bin"
+TRACE_MAX_BYTES = 256 * 1024
+TRACE_BUFFER = 512  # Gom bản ghi trong RAM, ghi xuống flash mỗi số byte này
+
+# Tài nguyên tĩnh của dashboard (nén sẵn bằng tools/build_assets.py)
+STATIC_DIR = "static"
+ASSET_MAX_AGE = 86400  # Cache-Control max-age (giây)
+
+# Cổng web server (dashboard, /data, /metrics)
+HTTP_PORT = 80
+
+# HTTP keep-alive của web server
+HTTP_IDLE_TIMEOUT = 5      # Đóng kết nối rảnh sau số giây này
+HTTP_MAX_REQUESTS = 100    # Số request tối đa trên một kết nối
+HTTP_MAX_KEEPALIVE = 4     # Số kết nối mở đồng thời tối đa được giữ lại
+HTTP_MAX_HEADERS = 32      # Số header tối đa của một request (vượt: 431)
+HTTP_MAX_LINE = 1024       # Độ dài tối đa dòng yêu cầu/một dòng header (byte)
+HTTP_MAX_BODY = 4096       # Thân request tối đa (byte, vượt: 413)
+
+# Server-Sent Events (/stream)
+SSE_MAX_SUBSCRIBERS = 3    # Số client nghe /stream đồng thời tối đa
+SSE_HEARTBEAT = 15         # Gửi comment heartbeat sau số giây không có dữ liệu
+
+# Lịch sử trong RAM (history.py): số phần tử mỗi kênh, ~35 KB cho 6 kênh
+HISTORY_RAW_CAPACITY = 120   # Mẫu thô gần nhất
+HISTORY_TIER_CAPACITY = {
+    "1m": 120,   # 2 giờ
+    "15m": 96,   # 1 ngày
+    "1h": 168,   # 7 ngày
+}
+HISTORY_MAX_POINTS = 240     # Số điểm tối đa trả về cho /history
+
+# Nhật ký telemetry nhị phân trên flash (telemetry_log.py)
+TELEMETRY_LOG_ENABLED = True
+TELEMETRY_DIR = "log"
+TELEMETRY_SEGMENTS = 8            # Số file segment xoay vòng
+TELEMETRY_SEGMENT_RECORDS = 1024  # Bản ghi mỗi segment (24 byte/bản ghi, ~196 KB tổng)
+TELEMETRY_INDEX_EVERY = 64        # Mỗi bao nhiêu bản ghi thì thêm một mục index
+TELEMETRY_LOG_INTERVAL = 60       # Ghi tối đa một bản ghi mỗi số giây này
+
+# Hàng đợi gửi dữ liệu lên IRIV Controller (outbox.py)
+OUTBOX_CAPACITY = 32          # Số bản ghi giữ trong RAM
+OUTBOX_BATCH = 10             # Số bản ghi tối đa trong một lần POST (1 = gửi từng bản ghi như cũ)
+OUTBOX_SPILL = True           # Khi RAM đầy, đẩy bản ghi cũ xuống flash thay vì bỏ
+OUTBOX_DIR = "outbox"
+OUTBOX_SPILL_SEGMENT = 64     # Bản ghi mỗi file segment trên flash
+OUTBOX_SPILL_SEGMENTS = 8     # Số segment tối đa, quá thì xóa segment cũ nhất
+UPLOAD_BACKOFF_MIN = 2        # Chờ trước lần thử lại đầu tiên (giây), gấp đôi sau mỗi lần lỗi
+UPLOAD_BACKOFF_MAX = 300      # Thời gian chờ tối đa (giây)
+
 # Cấu hình tank
 TANK_HEIGHT = 3.0       # Chiều cao bể nước (m)
 TANK_CAPACITY = 1000.0  # Dung tích tối đa (lít)
 
-# Hàm tính CRC16 Modbus
-def calculate_crc(data):
-    """Tính CRC16 Modbus"""
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x0001:
-                crc = (crc >> 1) ^ 0xA001
-            else:
-                crc >>= 1
-    return crc & 0xFFFF
-
-# Lệnh Modbus RTU mẫu để đọc mực nước từ thanh ghi 0x0004
-# Format: [Slave Address, Function Code, Register Hi, Register Lo, Count Hi, Count Lo]
-MODBUS_WATER_LEVEL_CMD = bytearray([MODBUS_SLAVE_ADDRESS, 0x03, 0x00, 0x04, 0x00, 0x01])
-
-# Tính và thêm CRC cho lệnh Modbus
-crc = calculate_crc(MODBUS_WATER_LEVEL_CMD)
-MODBUS_WATER_LEVEL_CMD.append(crc & 0xFF)        # CRC Lo
-MODBUS_WATER_LEVEL_CMD.append((crc >> 8) & 0xFF) # CRC Hi
-
+# Các cảm biến mức QDY30A-B trên cùng bus RS485, mỗi bể một slave
+# Slave đầu tiên là bể chính (water_level/tank_volume trên dashboard).
+# Chu kỳ CHANNEL_PERIODS["water_level"] áp dụng cho từng bể: bus được
+# chia đều cho các slave theo vòng (round-robin).
+MODBUS_SLAVES = [
+    {
+        "name": "tank1",
+        "address": MODBUS_SLAVE_ADDRESS,
+        "registers": MODBUS_REGISTERS,
+        "tank_height": TANK_HEIGHT,
+        "tank_capacity": TANK_CAPACITY,
+    },
+    # {"name": "tank2", "address": 0x02, "registers": {"WATER_LEVEL": 0x0004},
+    #  "tank_height": 2.0, "tank_capacity": 500.0},
+]
@@ -0,0 +1,48 @@
+from schema import CHANNELS
+
+# Giá trị cảm biến được mang dưới dạng số nguyên fixed-point suốt đường dữ liệu:
+# giá trị lưu = giá trị thực * hệ số của kênh (schema.CHANNELS), ví dụ
+# temp1 = 2525 nghĩa là 25.25 °C, water_level = 1502 nghĩa là 1.502 m.
+# Chỉ chuyển sang dạng thập phân ở lớp hiển thị (format_fixed, jsonwriter).
+
+
+def decimals(scale):
+    """Số chữ số thập phân của hệ số 10^n"""
+    n = 0
+    while scale > 1:
+        scale //= 10
+        n += 1
+    return n
+
+
+def to_fixed(name, value):
+    """Giá trị thực (float từ config hoặc driver chỉ trả float) -> fixed-point của kênh"""
+    return None if value is None else int(round(value * CHANNELS[name][0]))
+
+
+def format_fixed(value, scale, places=None):
+    """
+    Fixed-point -> chuỗi thập phân với places chữ số sau dấu chấm (mặc định
+    theo hệ số), làm tròn nửa xa số 0 bằng phép tính số nguyên
+    """
+    full = decimals(scale)
+    if places is None:
+        places = full
+    negative = value < 0
+    if negative:
+        value = -value
+    drop = 10 ** (full - places)
+    if drop > 1:
+        value = (value + drop // 2) // drop
+    unit = 10 ** places
+    text = str(value // unit)
+    if places:
+        text += "." + str(value % unit + unit)[1:]
+    return "-" + text if negative and value else text
+
+
+def format_channel(name, value, places=None):
+    """format_fixed theo hệ số của kênh name; None -> "N/A" """
+    if value is None:
+        return "N/A"
+    return format_fixed(value, CHANNELS[name][0], places)
@@ -0,0 +1,178 @@
+from array import array
+import config
+from schema import CHANNELS
+
+# Các mức rollup: (tên, độ dài bucket giây)
+TIERS = (("1m", 60), ("15m", 900), ("1h", 3600))
+
+
+class Ring:
+    """Bộ đệm vòng dung lượng cố định: timestamp (giây) + các cột giá trị array"""
+
+    def __init__(self, capacity, typecode, columns):
+        self.capacity = capacity
+        self.t = array("I", [0] * capacity)
+        self.columns = [array(typecode, [0] * capacity) for _ in range(columns)]
+        self.head = 0   # vị trí ghi kế tiếp
+        self.count = 0
+
+    def append(self, t, *values):
+        i = self.head
+        self.t[i] = t
+        for col, value in zip(self.columns, values):
+            col[i] = value
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _index(self, n):
+        """Chỉ số vật lý của phần tử thứ n theo thứ tự thời gian"""
+        return (self.head - self.count + n) % self.capacity
+
+    def oldest(self):
+        return self.t[self._index(0)] if self.count else None
+
+    def bisect(self, t):
+        """Vị trí logic đầu tiên có timestamp >= t (O(log n))"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.t[self._index(mid)] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, t_from, t_to):
+        """Khoảng vị trí logic [start, end) có timestamp trong [t_from, t_to]"""
+        return self.bisect(t_from), self.bisect(t_to + 1)
+
+    def rows(self, start, end):
+        """Sinh các hàng (t, giá trị...) theo thứ tự thời gian"""
+        for n in range(start, end):
+            i = self._index(n)
+            yield (self.t[i],) + tuple(col[i] for col in self.columns)
+
+    def nbytes(self):
+        return sum(len(a) * a.itemsize for a in [self.t] + self.columns)
+
+
+class Rollup:
+    """Gộp mẫu vào bucket cố định, lưu min/max/mean của mỗi bucket vào Ring"""
+
+    def __init__(self, name, seconds, capacity, typecode):
+        self.name = name
+        self.seconds = seconds
+        self.ring = Ring(capacity, typecode, 3)
+        self.bucket = None  # thời điểm bắt đầu bucket đang gộp
+        self.vmin = self.vmax = self.total = self.n = 0
+
+    def add(self, t, value):
+        bucket = t - t % self.seconds
+        if bucket != self.bucket:
+            self.flush()
+            self.bucket = bucket
+            self.vmin = self.vmax = value
+            self.total = 0
+            self.n = 0
+        if value < self.vmin:
+            self.vmin = value
+        if value > self.vmax:
+            self.vmax = value
+        self.total += value
+        self.n += 1
+
+    def flush(self):
+        """Ghi bucket đang gộp (nếu có) vào ring"""
+        if self.bucket is not None and self.n:
+            self.ring.append(self.bucket, self.vmin, self.vmax, self.total // self.n)
+            self.n = 0
+
+
+class ChannelHistory:
+    """Lịch sử một kênh: ring mẫu thô và các mức rollup"""
+
+    def __init__(self, scale, typecode):
+        self.scale = scale
+        self.raw = Ring(config.HISTORY_RAW_CAPACITY, typecode, 1)
+        self.tiers = [Rollup(name, seconds, config.HISTORY_TIER_CAPACITY[name], typecode)
+                      for name, seconds in TIERS]
+
+    def add(self, t, value):
+        """Thêm một mẫu fixed-point (đã nhân hệ số, xem fixedpoint.py)"""
+        self.raw.append(t, value)
+        for tier in self.tiers:
+            tier.add(t, value)
+
+    def resolutions(self):
+        """Danh sách (tên, ring) từ mịn đến thô"""
+        return [("raw", self.raw)] + [(tier.name, tier.ring) for tier in self.tiers]
+
+    def pick(self, t_from, t_to, max_points):
+        """
+        Chọn mức phù hợp cho khoảng [t_from, t_to]: mức mịn nhất còn bao phủ
+        t_from và không vượt quá max_points điểm; nếu không mức nào bao phủ
+        (mới khởi động) thì mức mịn nhất có dữ liệu trong khoảng
+        """
+        options = self.resolutions()
+        fallback = None
+        for name, ring in options:
+            start, end = ring.range(t_from, t_to)
+            if end - start > max_points:
+                continue
+            if ring.count and ring.oldest() <= t_from:
+                return name, ring
+            if fallback is None and end > start:
+                fallback = (name, ring)
+        return fallback or options[-1]
+
+    def nbytes(self):
+        return sum(ring.nbytes() for name, ring in self.resolutions())
+
+
+class History:
+    """Lịch sử trong RAM cho tất cả các kênh, dung lượng bộ nhớ cố định"""
+
+    def __init__(self):
+        self.channels = {}
+        for name in CHANNELS:
+            scale, typecode = CHANNELS[name]
+            self.channels[name] = ChannelHistory(scale, typecode)
+
+    def record(self, t, data, keys=None):
+        """Ghi giá trị fixed-point các kênh trong keys (mặc định tất cả) tại thời điểm t (giây)"""
+        for name in keys or self.channels:
+            channel = self.channels.get(name)
+            value = data.get(name)
+            if channel is not None and value is not None:
+                channel.add(t, value)
+
+    def query(self, name, t_from, t_to, res=None, max_points=None):
+        """
+        Truy vấn lịch sử của một kênh
+
+        Trả về dict {"channel", "res", "scale", "t", ...}: mẫu thô có cột "v",
+        mức rollup có "min", "max", "mean" (giá trị fixed-point, chia cho scale).
+        """
+        channel = self.channels[name]
+        max_points = max_points or config.HISTORY_MAX_POINTS
+        if res is None:
+            res, ring = channel.pick(t_from, t_to, max_points)
+        else:
+            ring = dict(channel.resolutions())[res]
+
+        start, end = ring.range(t_from, t_to)
+        start = max(start, end - max_points)
+        columns = ("v",) if res == "raw" else ("min", "max", "mean")
+        result = {"channel": name, "res": res, "scale": channel.scale, "t": []}
+        for col in columns:
+            result[col] = []
+        for row in ring.rows(start, end):
+            result["t"].append(row[0])
+            for col, value in zip(columns, row[1:]):
+                result[col].append(value)
+        return result
+
+    def nbytes(self):
+        """Tổng dung lượng các array (byte)"""
+        return sum(channel.nbytes() for channel in self.channels.values())
@@ -0,0 +1,167 @@
+import errno
+import config
+import metrics
+from runtime import asyncio, ticks_ms, ticks_us, ticks_diff
+
+CONNECT_TIME = metrics.histogram("iriv_connect_seconds", "Thời gian mở kết nối TCP đến IRIV Controller")
+REQUEST_TIME = metrics.histogram("iriv_request_seconds", "Thời gian một request đến IRIV (gửi đến nhận xong phản hồi)")
+ERRORS = metrics.counter("iriv_errors_total", "Số request đến IRIV thất bại")
+
+
+# errno cho thấy server đã đóng/reset kết nối (uerrno không có EPIPE)
+RESET_ERRNOS = (errno.ECONNRESET, errno.ECONNABORTED, errno.ENOTCONN, getattr(errno, "EPIPE", 32))
+
+
+class HTTPError(Exception):
+    """Phản hồi HTTP không hợp lệ hoặc kết nối bị đóng giữa chừng"""
+
+
+class StaleConnection(HTTPError):
+    """Kết nối bị reset/đóng trước khi có byte nào của phản hồi: gửi lại được"""
+
+
+class HTTPConnection:
+    """
+    Kết nối HTTP/1.1 keep-alive dùng lại cho nhiều request đến cùng một host
+
+    Kết nối được mở khi cần (lazy) và giữ lại sau mỗi request. Trước khi dùng
+    lại, kết nối mà server đã đóng (đã nhận FIN) hoặc rảnh quá idle_timeout
+    (có thể nửa mở do NAT) được mở lại; nếu request trên kết nối dùng lại thất
+    bại vì bị reset/đóng (không phải timeout) trước khi nhận được byte nào
+    của phản hồi thì mở kết nối mới và gửi lại một lần.
+    """
+
+    def __init__(self, host, port=80, timeout=None, idle_timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout or config.IRIV_HTTP_TIMEOUT
+        self.idle_timeout_ms = int((idle_timeout or config.IRIV_IDLE_TIMEOUT) * 1000)
+        self.reader = None
+        self.writer = None
+        self.last_used = 0
+        self.stats = {"requests": 0, "reused": 0, "connects": 0, "stale": 0, "errors": 0}
+
+    def close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        self.reader = self.writer = None
+
+    async def _connect(self):
+        self.close()
+        start = ticks_us()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        CONNECT_TIME.observe(ticks_diff(ticks_us(), start))
+        self.stats["connects"] += 1
+
+    def _closed_by_peer(self):
+        """Server đã đóng kết nối rảnh (uasyncio không có at_eof: coi như chưa)"""
+        at_eof = getattr(self.reader, "at_eof", None)
+        return at_eof is not None and at_eof()
+
+    async def _read_response(self, line):
+        """Đọc header và thân theo Content-Length sau status line đã nhận"""
+        reader = self.reader
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+            raise HTTPError("status line không hợp lệ: {}".format(line))
+        status = int(parts[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise HTTPError("kết nối đóng khi đang đọc header")
+            if line == b"\r\n" or line == b"\n":
+                break
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower().decode()] = value.strip().decode()
+
+        keep_alive = headers.get("connection", "").lower() != "close" and parts[0] != b"HTTP/1.0"
+        length = headers.get("content-length")
+        if length is not None:
+            try:
+                body = await reader.readexactly(int(length)) if int(length) else b""
+            except EOFError:
+                raise HTTPError("kết nối đóng khi đang đọc thân phản hồi")
+        else:
+            # Không có Content-Length: thân kéo dài đến khi server đóng kết nối
+            body = b""
+            while True:
+                chunk = await reader.read(512)
+                if not chunk:
+                    break
+                body += chunk
+            keep_alive = False
+        return status, headers, body, keep_alive
+
+    async def _request_once(self, request):
+        """
+        Gửi request và đọc phản hồi; ném StaleConnection nếu kết nối bị
+        reset/đóng trong lúc gửi hoặc trước khi có byte đầu của status line
+        """
+        try:
+            self.writer.write(request)
+            await self.writer.drain()
+            line = await self.reader.readline()
+        except OSError as e:
+            if e.errno not in RESET_ERRNOS:
+                raise
+            raise StaleConnection("kết nối bị reset: {}".format(e))
+        if not line:
+            raise StaleConnection("kết nối đã đóng")
+        return await self._read_response(line)
+
+    async def request(self, method, path, body=None, content_type=None):
+        """
+        Gửi request và trả về (status, headers, body)
+
+        Ném OSError/asyncio.TimeoutError/HTTPError khi lỗi; kết nối lỗi bị đóng
+        để lần sau mở lại.
+        """
+        head = "{} {} HTTP/1.1\r\nHost: {}\r\n".format(method, path, self.host)
+        if body is not None:
+            head += "Content-Type: {}\r\nContent-Length: {}\r\n".format(content_type, len(body))
+        request = head.encode() + b"\r\n" + (body or b"")
+
+        self.stats["requests"] += 1
+        start = ticks_us()
+        reused = self.writer is not None
+        if reused and (self._closed_by_peer() or
+                       ticks_diff(ticks_ms(), self.last_used) > self.idle_timeout_ms):
+            # Server đã đóng, hoặc rảnh quá lâu nên có thể đã đóng mà mình không biết
+            self.stats["stale"] += 1
+            self.close()
+            reused = False
+        try:
+            if not reused:
+                await self._connect()
+            else:
+                self.stats["reused"] += 1
+            try:
+                result = await asyncio.wait_for(self._request_once(request), self.timeout)
+            except StaleConnection:
+                if not reused:
+                    raise
+                # Server đã đóng kết nối dùng lại trước khi xử lý request: mở lại và
+                # gửi lại một lần. Timeout hay lỗi sau khi phản hồi bắt đầu thì không
+                # gửi lại vì server có thể đã nhận (POST bị ghi trùng).
+                self.stats["stale"] += 1
+                await self._connect()
+                result = await asyncio.wait_for(self._request_once(request), self.timeout)
+        except Exception:
+            self.stats["errors"] += 1
+            ERRORS.inc()
+            self.close()
+            raise
+        REQUEST_TIME.observe(ticks_diff(ticks_us(), start))
+
+        status, headers, body, keep_alive = result
+        if keep_alive:
+            self.last_used = ticks_ms()
+        else:
+            self.close()
+        return status, headers, body
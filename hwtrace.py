@@ -0,0 +1,425 @@
+"""
+Trace thô của phần cứng: ghi trên thiết bị, phát lại trên máy host
+
+Ghi lại đúng những gì firmware nhận từ bên ngoài, ở mức thấp nhất: khung
+32-bit của MAX31855, 5 byte (hoặc lỗi) của DHT22, frame Modbus gửi đi và các
+đoạn byte nhận về kèm thời điểm, request/response HTTP với IRIV Controller.
+Phát lại đưa các dữ liệu đó vào SensorManager/IRIVController thay cho phần
+cứng, nên toàn bộ đường xử lý (giải mã, CRC, backoff, outbox) chạy lại như
+lúc sự cố (chuỗi lỗi CRC, cảm biến mất tín hiệu...).
+
+File: header TRACE_MAGIC + epoch (time.time() lúc bắt đầu, uint32), sau đó
+các bản ghi: loại (1 byte), khoảng cách ticks_us so với bản ghi trước
+(varint), độ dài (varint), dữ liệu; một lần đọc MAX31855 tốn khoảng 11 byte.
+
+    python tools/replay_trace.py trace.bin [--realtime]
+"""
+import struct
+import time
+import config
+import logger
+from runtime import ticks_us, ticks_diff
+
+TRACE_MAGIC = b"HWT1"
+
+# Loại bản ghi
+MAX31855 = 1      # <BI: số thứ tự cảm biến, khung thô
+DHT22 = 2         # errno (1 byte, 0 = đọc được) + 5 byte buf nếu đọc được
+MODBUS_TX = 3     # frame request
+MODBUS_RX = 4     # đoạn byte nhận được từ UART
+HTTP_REQUEST = 5  # "METHOD path content-type\n" + thân
+HTTP_RESPONSE = 6 # <H status (0 = lỗi kết nối) + thân hoặc thông báo lỗi
+
+active = None  # TraceWriter đang ghi (tạo bởi record())
+
+KIND_NAMES = {MAX31855: "max31855", DHT22: "dht22", MODBUS_TX: "modbus_tx",
+              MODBUS_RX: "modbus_rx", HTTP_REQUEST: "http_request", HTTP_RESPONSE: "http_response"}
+
+
+def _varint(buf, value):
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class TraceWriter:
+    """
+    Ghi bản ghi vào bộ đệm trong RAM, đẩy xuống flash khi đầy
+
+    Dừng ghi (full = True) khi file đạt max_bytes để trace không chiếm hết flash.
+    """
+
+    def __init__(self, path=None, max_bytes=None, buffer_size=None, epoch=None):
+        self.path = path or config.TRACE_FILE
+        self.max_bytes = max_bytes or config.TRACE_MAX_BYTES
+        self.buffer_size = buffer_size or config.TRACE_BUFFER
+        self.buf = bytearray()
+        self.file = open(self.path, "wb")
+        self.file.write(TRACE_MAGIC + struct.pack("<I", int(time.time() if epoch is None else epoch)))
+        self.size = len(TRACE_MAGIC) + 4
+        self.last = ticks_us()
+        self.full = False
+        self.counts = {}
+
+    def write(self, kind, payload):
+        if self.full:
+            return
+        now = ticks_us()
+        buf = self.buf
+        start = len(buf)
+        buf.append(kind)
+        _varint(buf, max(0, ticks_diff(now, self.last)))
+        _varint(buf, len(payload))
+        buf.extend(payload)
+        self.last = now
+        if self.size + len(buf) > self.max_bytes:
+            # Bản ghi này không còn chỗ: bỏ nó và ngừng ghi
+            del buf[start:]
+            self.full = True
+            self.flush()
+            logger.warning("Trace đầy (%d byte), ngừng ghi", self.size)
+            return
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if len(buf) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.file.write(self.buf)
+            self.size += len(self.buf)
+            self.buf = bytearray()
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_trace(path):
+    """Đọc toàn bộ trace, trả về (epoch, [(t_us, loại, dữ liệu)]) với t_us tính từ đầu trace"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != TRACE_MAGIC:
+        raise ValueError("không phải file trace")
+    epoch = struct.unpack("<I", data[4:8])[0]
+    records = []
+    pos = 8
+    t = 0
+    while pos < len(data):
+        try:
+            kind = data[pos]
+            dt, pos = _read_varint(data, pos + 1)
+            length, pos = _read_varint(data, pos)
+        except IndexError:
+            break  # Bản ghi cuối ghi dở
+        if pos + length > len(data):
+            break
+        t += dt
+        records.append((t, kind, bytes(data[pos:pos + length])))
+        pos += length
+    return epoch, records
+
+
+# --- Ghi: các lớp bọc đặt giữa firmware và driver phần cứng ---
+
+class RecordingTransport:
+    """Bọc BitBangTransport/SPITransport, ghi khung thô của từng MAX31855"""
+
+    def __init__(self, transport, trace, devices):
+        self.transport = transport
+        self.trace = trace
+        self.devices = devices  # {id(chân cs): số thứ tự cảm biến}
+
+    def read_frame(self, cs):
+        raw = self.transport.read_frame(cs)
+        self.trace.write(MAX31855, struct.pack("<BI", self.devices.get(id(cs), 255), raw))
+        return raw
+
+
+class RecordingDHT:
+    """Bọc dht.DHT22, ghi 5 byte đọc được hoặc mã lỗi"""
+
+    def __init__(self, sensor, trace):
+        self.sensor = sensor
+        self.trace = trace
+
+    def measure(self):
+        try:
+            self.sensor.measure()
+        except OSError as e:
+            code = e.args[0] if e.args and isinstance(e.args[0], int) else 255
+            self.trace.write(DHT22, bytes([min(code, 255) or 255]))
+            raise
+        buf = getattr(self.sensor, "buf", None)
+        if buf is None:
+            # Driver không có buf: dựng lại 5 byte từ giá trị đã đổi
+            humidity = int(round(self.sensor.humidity() * 10))
+            temp = int(round(self.sensor.temperature() * 10))
+            raw = abs(temp) | (0x8000 if temp < 0 else 0)
+            buf = bytes([humidity >> 8, humidity & 0xFF, raw >> 8, raw & 0xFF, 0])
+        self.trace.write(DHT22, b"\x00" + bytes(buf[:5]))
+
+    def __getattr__(self, name):
+        return getattr(self.sensor, name)
+
+
+class RecordingUART:
+    """Bọc machine.UART của Modbus, ghi frame gửi và từng đoạn byte nhận"""
+
+    def __init__(self, uart, trace):
+        self.uart = uart
+        self.trace = trace
+
+    def write(self, frame):
+        self.trace.write(MODBUS_TX, bytes(frame))
+        return self.uart.write(frame)
+
+    def read(self, n=None):
+        data = self.uart.read() if n is None else self.uart.read(n)
+        if data:
+            self.trace.write(MODBUS_RX, data)
+        return data
+
+    def any(self):
+        return self.uart.any()
+
+    def __getattr__(self, name):
+        return getattr(self.uart, name)
+
+
+def _http_request_payload(method, path, body, content_type):
+    return "{} {} {}\n".format(method, path, content_type or "-").encode() + (body or b"")
+
+
+class RecordingHTTP:
+    """Bọc HTTPConnection đến IRIV, ghi request và response (hoặc lỗi)"""
+
+    def __init__(self, http, trace):
+        self.http = http
+        self.trace = trace
+
+    async def request(self, method, path, body=None, content_type=None):
+        self.trace.write(HTTP_REQUEST, _http_request_payload(method, path, body, content_type))
+        try:
+            status, headers, reply = await self.http.request(method, path, body, content_type)
+        except Exception as e:
+            self.trace.write(HTTP_RESPONSE, struct.pack("<H", 0) + str(e).encode())
+            raise
+        self.trace.write(HTTP_RESPONSE, struct.pack("<H", status) + reply)
+        return status, headers, reply
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+def _transports(sensor_manager):
+    """[(transport, [MAX31855])] theo transport (bus dùng chung hoặc từng cảm biến)"""
+    groups = []
+    for sensor in (sensor_manager.max1, sensor_manager.max2):
+        for transport, sensors in groups:
+            if transport is sensor.transport:
+                sensors.append(sensor)
+                break
+        else:
+            groups.append((sensor.transport, [sensor]))
+    return groups
+
+
+def _install_transport(sensor_manager, transport, sensors, wrapper):
+    for sensor in sensors:
+        sensor.transport = wrapper
+    bus = sensor_manager.tc_bus
+    if bus is not None and bus.transport is transport:
+        bus.transport = wrapper
+
+
+def record(sensor_manager, path=None):
+    """Bắt đầu ghi trace phần cứng của sensor_manager, trả về TraceWriter"""
+    global active
+    trace = active = TraceWriter(path)
+    devices = {id(sensor_manager.max1.cs): 0, id(sensor_manager.max2.cs): 1}
+    for transport, sensors in _transports(sensor_manager):
+        _install_transport(sensor_manager, transport, sensors, RecordingTransport(transport, trace, devices))
+    sensor_manager.dht = RecordingDHT(sensor_manager.dht, trace)
+    iriv = sensor_manager.iriv
+    iriv.modbus.uart = RecordingUART(iriv.modbus.uart, trace)
+    iriv.http = RecordingHTTP(iriv.http, trace)
+    return trace
+
+
+# --- Phát lại: nguồn dữ liệu lấy từ trace thay cho phần cứng ---
+
+class Replay:
+    """
+    Các hàng đợi dữ liệu theo thiết bị dựng từ một trace
+
+    Mỗi thiết bị lấy lần lượt bản ghi của riêng nó, nên thứ tự đọc giữa các
+    kênh không cần khớp tuyệt đối với lúc ghi. exhausted = True khi firmware
+    đọc một thiết bị đã hết dữ liệu (lúc đó phát lại kết thúc).
+    """
+
+    def __init__(self, records):
+        self.frames = {}   # số thứ tự MAX31855 -> [khung]
+        self.dht = []      # [bytes hoặc mã lỗi]
+        self.modbus = []   # [(frame request, [(offset_us, bytes)])]
+        self.http = []     # [(request payload, status, thân)]
+        self.total = len(records)
+        self.exhausted = False
+        self.consumed = {}
+        tx = None
+        request = None
+        for t, kind, data in records:
+            if kind == MAX31855:
+                index, raw = struct.unpack("<BI", data)
+                self.frames.setdefault(index, []).append(raw)
+            elif kind == DHT22:
+                self.dht.append(data[1:6] if data[0] == 0 else data[0])
+            elif kind == MODBUS_TX:
+                tx = (t, data, [])
+                self.modbus.append((data, tx[2]))
+            elif kind == MODBUS_RX and tx is not None:
+                tx[2].append((t - tx[0], data))
+            elif kind == HTTP_REQUEST:
+                request = data
+            elif kind == HTTP_RESPONSE and request is not None:
+                self.http.append((request, struct.unpack("<H", data[:2])[0], data[2:]))
+                request = None
+        for queue in [self.dht, self.modbus, self.http] + list(self.frames.values()):
+            queue.reverse()  # pop() từ cuối
+
+    def take(self, name, queue):
+        if not queue:
+            self.exhausted = True
+            return None
+        self.consumed[name] = self.consumed.get(name, 0) + 1
+        return queue.pop()
+
+    def remaining(self):
+        return (sum(len(q) for q in self.frames.values()) + len(self.dht) +
+                len(self.modbus) + len(self.http))
+
+
+class ReplayTransport:
+    """Thay transport MAX31855: trả khung đã ghi của cảm biến được chọn bằng cs"""
+
+    def __init__(self, replay, devices):
+        self.replay = replay
+        self.devices = devices
+
+    def read_frame(self, cs):
+        index = self.devices.get(id(cs), 255)
+        raw = self.replay.take("max31855", self.replay.frames.get(index, []))
+        return 0x10001 if raw is None else raw  # Hết dữ liệu: cờ lỗi OC
+
+
+class ReplayDHT:
+    """Thay dht.DHT22: buf lấy từ trace, lỗi đã ghi được ném lại"""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.buf = bytearray(5)
+
+    def measure(self):
+        item = self.replay.take("dht22", self.replay.dht)
+        if item is None:
+            raise OSError(110)
+        if isinstance(item, int):
+            raise OSError(item)
+        self.buf[:] = item
+
+    def humidity(self):
+        return (self.buf[0] << 8 | self.buf[1]) * 0.1
+
+    def temperature(self):
+        t = ((self.buf[2] & 0x7F) << 8 | self.buf[3]) * 0.1
+        return -t if self.buf[2] & 0x80 else t
+
+
+class ReplayUART:
+    """
+    Thay UART Modbus: mỗi write() lấy giao dịch kế tiếp trong trace, các đoạn
+    byte trả lời xuất hiện đúng khoảng thời gian đã ghi sau lúc gửi
+    """
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.chunks = []
+        self.sent = 0
+        self.pending = b""
+        self.mismatches = 0  # Frame gửi khác frame trong trace
+
+    def write(self, frame):
+        exchange = self.replay.take("modbus", self.replay.modbus)
+        self.sent = ticks_us()
+        self.pending = b""
+        self.chunks = []
+        if exchange is not None:
+            request, chunks = exchange
+            if bytes(frame) != request:
+                self.mismatches += 1
+            self.chunks = list(chunks)
+        return len(frame)
+
+    def _arrive(self):
+        elapsed = ticks_diff(ticks_us(), self.sent)
+        while self.chunks and self.chunks[0][0] <= elapsed:
+            self.pending += self.chunks.pop(0)[1]
+
+    def any(self):
+        self._arrive()
+        return len(self.pending)
+
+    def read(self, n=None):
+        self._arrive()
+        if not self.pending:
+            return None
+        n = len(self.pending) if n is None else n
+        data, self.pending = self.pending[:n], self.pending[n:]
+        return data
+
+    def flush(self):
+        pass
+
+
+class ReplayHTTP:
+    """Thay HTTPConnection đến IRIV: trả status/thân đã ghi, lỗi kết nối được ném lại"""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.stats = {"requests": 0, "reused": 0, "connects": 0, "stale": 0, "errors": 0}
+
+    async def request(self, method, path, body=None, content_type=None):
+        self.stats["requests"] += 1
+        item = self.replay.take("http", self.replay.http)
+        if item is None or item[1] == 0:
+            self.stats["errors"] += 1
+            raise OSError(item[2].decode() if item else "trace đã hết")
+        return item[1], {}, item[2]
+
+    def close(self):
+        pass
+
+
+def replay(sensor_manager, records):
+    """Thay phần cứng của sensor_manager bằng dữ liệu trong records, trả về Replay"""
+    source = Replay(records)
+    devices = {id(sensor_manager.max1.cs): 0, id(sensor_manager.max2.cs): 1}
+    for transport, sensors in _transports(sensor_manager):
+        _install_transport(sensor_manager, transport, sensors, ReplayTransport(source, devices))
+    sensor_manager.dht = ReplayDHT(source)
+    iriv = sensor_manager.iriv
+    iriv.modbus.uart = ReplayUART(source)
+    iriv.http = ReplayHTTP(source)
+    return source
@@ -1,10 +1,110 @@
-import socket
 import json
 import time
 import config
+import logger
 import machine
-import struct
+import wire
+import profiler
+from fixedpoint import to_fixed
+from jsonwriter import SnapshotWriter
+from runtime import ticks_ms, ticks_diff, ticks_add, format_time, run_steps, run_steps_async
+from http_client import HTTPConnection
+from modbus import ModbusMaster, ModbusException, BusLock, crc16, plan_reads, read_request
 
+
+class LevelSensor:
+    """
+    Một cảm biến mức QDY30A-B trên bus RS485 (một bể)
+
+    Các frame request được tạo sẵn một lần khi khởi tạo; slave không trả lời
+    bị bỏ qua một khoảng backoff tăng dần để không chiếm bus của slave khác.
+    """
+
+    def __init__(self, name, address, registers, tank_height, tank_capacity, max_gap=4):
+        self.name = name
+        self.address = address
+        self.registers = registers
+        self.tank_height = tank_height
+        self.tank_capacity = tank_capacity
+        # Kích thước bể dạng số nguyên để tính thể tích không dùng float
+        self.height_mm = to_fixed("water_level", tank_height)
+        self.capacity_dl = to_fixed("tank_volume", tank_capacity)
+        # (start, count, frame) cho từng khối thanh ghi liền nhau
+        self.blocks = [(start, count, read_request(address, start, count))
+                       for start, count in plan_reads(registers.values(), max_gap)]
+        # Khối dự phòng khi slave không có các thanh ghi phụ: chỉ WATER_LEVEL
+        level = registers["WATER_LEVEL"]
+        self.level_block = (level, 1, read_request(address, level, 1))
+        self.values = {}      # Giá trị thô gần nhất {tên thanh ghi: giá trị}
+        self.level = None     # Mực nước (mm), None nếu lần đọc gần nhất lỗi
+        self.volume = None    # Thể tích (decilít)
+        self.failures = 0     # Số lần lỗi liên tiếp
+        self.retry_at = 0     # ticks_ms được phép đọc lại (khi failures > 0)
+        self.stats = {"polls": 0, "errors": 0, "skipped": 0}
+
+    @classmethod
+    def from_config(cls, entry):
+        return cls(
+            entry.get("name", "slave{}".format(entry["address"])),
+            entry["address"],
+            entry.get("registers", config.MODBUS_REGISTERS),
+            entry.get("tank_height", config.TANK_HEIGHT),
+            entry.get("tank_capacity", config.TANK_CAPACITY),
+            config.MODBUS_MAX_GAP,
+        )
+
+    def ready(self, now):
+        """Slave không trong thời gian backoff"""
+        return not self.failures or ticks_diff(now, self.retry_at) >= 0
+
+    def store(self, start, count, block):
+        """Lưu giá trị một khối thanh ghi vừa đọc vào self.values"""
+        for name in self.registers:
+            offset = self.registers[name] - start
+            if 0 <= offset < count:
+                self.values[name] = block[offset]
+
+    def volume_for(self, level):
+        """Thể tích (decilít, làm tròn) ứng với mực nước level (mm)"""
+        return (2 * level * self.capacity_dl + self.height_mm) // (2 * self.height_mm)
+
+    def succeed(self):
+        """
+        Lấy mực nước (thanh ghi đã là mm) và tính thể tích sau một lần đọc thành công
+
+        Ném ValueError nếu thanh ghi ngoài khoảng hợp lệ (0xFFFF, số âm dạng
+        bù 2...) để lần đọc bị tính là lỗi thay vì đưa giá trị rác vào dữ liệu.
+        """
+        level = self.values["WATER_LEVEL"]
+        if level > config.MODBUS_LEVEL_MAX:
+            raise ValueError("thanh ghi WATER_LEVEL ngoài khoảng: 0x{:04X}".format(level))
+        self.failures = 0
+        self.level = level
+        self.volume = self.volume_for(level)
+
+    def fail(self, now):
+        """Ghi nhận lỗi và đặt thời gian backoff (gấp đôi sau mỗi lần lỗi liên tiếp)"""
+        self.stats["errors"] += 1
+        self.failures += 1
+        self.level = self.volume = None
+        delay = min(config.MODBUS_BACKOFF_MIN << (self.failures - 1), config.MODBUS_BACKOFF_MAX)
+        self.retry_at = ticks_add(now, delay * 1000)
+        return delay
+
+    def status(self):
+        return {
+            "name": self.name,
+            "address": self.address,
+            "level_mm": self.level,
+            "volume_dl": self.volume,
+            "failures": self.failures,
+            "polls": self.stats["polls"],
+            "errors": self.stats["errors"],
+            "skipped": self.stats["skipped"],
+        }
+
+
+@profiler.traced("read_level_sensor", "begin_poll", "finish_poll", "finish_poll_async")
 class IRIVController:
     def __init__(self, ip_address=None, port=None, uart_id=None, tx_pin=None, rx_pin=None, de_pin=None):
         # Network connection details
@@ -13,6 +113,10 @@ class IRIVController:
         self.connected = False
         self.last_connect_attempt = 0
         self.reconnect_interval = 30  # Thử kết nối lại sau 30 giây nếu mất kết nối
+        # Một kết nối HTTP/1.1 keep-alive dùng chung cho /api/data và /api/status
+        self.http = HTTPConnection(self.ip_address, self.port)
+        self.wire_format = config.IRIV_WIRE_FORMAT
+        self.writer = SnapshotWriter()  # Serialize bản ghi JSON gửi lên IRIV
         
         # UART for RS485 communication with level sensor
         self.uart_id = uart_id if uart_id is not None else config.UART_ID
@@ -35,197 +139,218 @@ class IRIVController:
         if self.de_pin is not None:
             self.de = machine.Pin(self.de_pin, machine.Pin.OUT)
             self.de.value(0)  # Set to receive mode by default
+        else:
+            self.de = None
         
-        print(f"IRIVController khởi tạo: UART{self.uart_id}, TX:{self.tx_pin}, RX:{self.rx_pin}, DE/RE:{self.de_pin}")
-        print(f"Kết nối IRIV: {self.ip_address}:{self.port}")
+        # Modbus RTU master trên RS485
+        self.modbus = ModbusMaster(self.uart, baudrate=9600, de=self.de, timeout_ms=config.MODBUS_TIMEOUT_MS)
+        self.bus_lock = BusLock()
         
-    def connect(self):
-        """Kiểm tra kết nối với IRIV IO Controller"""
-        try:
-            # Tạo socket TCP và thử kết nối
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(3)  # Timeout 3 giây
-            sock.connect((self.ip_address, self.port))
-            sock.close()
-            
-            print(f"Đã kết nối thành công với IRIV IO Controller tại {self.ip_address}")
-            self.connected = True
-            return True
-        except Exception as e:
-            print(f"Không thể kết nối đến IRIV IO Controller: {e}")
-            self.connected = False
-            return False
-    
-    def send_data(self, data):
-        """Gửi dữ liệu đến IRIV IO Controller"""
-        if not self.connected:
-            current_time = time.time()
-            if current_time - self.last_connect_attempt > self.reconnect_interval:
-                self.connect()
-                self.last_connect_attempt = current_time
-            
-            if not self.connected:
-                return False
+        # Các cảm biến mức trên bus, đọc lần lượt theo vòng
+        self.level_sensors = [LevelSensor.from_config(entry) for entry in config.MODBUS_SLAVES]
+        self.next_sensor = 0
         
+        logger.info("IRIVController khởi tạo: UART%d, TX:%s, RX:%s, DE/RE:%s, IRIV: %s:%d",
+                    self.uart_id, self.tx_pin, self.rx_pin, self.de_pin, self.ip_address, self.port)
+        
+    async def request_async(self, method, path, body=None, content_type=None):
+        """
+        Gửi request trên kết nối keep-alive đến IRIV, trả về (status, body)
+        hoặc (None, None) nếu lỗi kết nối
+        """
         try:
-            # Chuyển dữ liệu thành JSON
-            json_data = json.dumps(data)
-            
-            # Tạo socket và gửi dữ liệu
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(5)
-            sock.connect((self.ip_address, self.port))
-            
-            # Tạo HTTP request
-            request = f"POST /api/data HTTP/1.1\r\n"
-            request += f"Host: {self.ip_address}\r\n"
-            request += "Content-Type: application/json\r\n"
-            request += f"Content-Length: {len(json_data)}\r\n"
-            request += "Connection: close\r\n\r\n"
-            request += json_data
-            
-            # Gửi request
-            sock.sendall(request.encode())
-            
-            # Nhận phản hồi
-            response = sock.recv(1024).decode()
-            sock.close()
-            
-            # Kiểm tra phản hồi
-            if "200 OK" in response:
-                print("Dữ liệu đã gửi thành công đến IRIV IO Controller")
-                return True
-            else:
-                print(f"Lỗi khi gửi dữ liệu: {response}")
-                return False
+            status, headers, body = await self.http.request(method, path, body, content_type)
         except Exception as e:
-            print(f"Lỗi khi gửi dữ liệu đến IRIV IO Controller: {e}")
+            logger.warning("Lỗi kết nối IRIV IO Controller (%s %s): %s", method, path, e, every=60)
             self.connected = False
+            return None, None
+        self.connected = True
+        return status, body
+
+    async def send_data_async(self, data):
+        """Gửi dữ liệu đến IRIV IO Controller mà không chặn vòng lặp asyncio"""
+        current_time = time.time()
+        if not self.connected and current_time - self.last_connect_attempt <= self.reconnect_interval:
             return False
-    
-    def get_status(self):
-        """Lấy trạng thái từ IRIV IO Controller"""
-        if not self.connected:
-            current_time = time.time()
-            if current_time - self.last_connect_attempt > self.reconnect_interval:
-                self.connect()
-                self.last_connect_attempt = current_time
-            
-            if not self.connected:
-                return None
+        self.last_connect_attempt = current_time
+        return await self._post_async(self.writer.dumps(data, alerts=False), "application/json") == 200
+
+    async def send_batch_async(self, items):
+        """
+        Gửi một lô bản ghi [(t, data)] trong một lần POST /api/data
+
+        Định dạng theo self.wire_format: "json" gửi mảng JSON (lô một bản ghi
+        giữ nguyên định dạng object như send_data_async()), "binary" gửi
+        application/octet-stream (wire.py). Nếu IRIV trả 415 cho định dạng nhị
+        phân thì chuyển hẳn về JSON. Việc thử lại do bên gọi quyết định; lô
+        không mã hóa được thì ném ValueError (wire.encode) để bên gọi bỏ lô.
+        """
+        if not items:
+            return True  # Không có gì để gửi (ví dụ segment outbox hỏng vừa bị bỏ)
+        if self.wire_format == "binary":
+            status = await self._post_async(wire.encode(items), wire.CONTENT_TYPE)
+            if status != 415:
+                return status == 200
+            logger.warning("IRIV không nhận định dạng nhị phân, chuyển sang JSON")
+            self.wire_format = "json"
         
+        # Giá trị fixed-point được ghi thành số thập phân bởi SnapshotWriter
+        readings = []
+        for t, data in items:
+            readings.append(self.writer.dumps(data, alerts=False, timestamp=format_time(t)))
+        body = readings[0] if len(readings) == 1 else b"[" + b", ".join(readings) + b"]"
+        return await self._post_async(body, "application/json") == 200
+
+    async def _post_async(self, body, content_type):
+        """POST /api/data, trả về mã HTTP (2xx được coi là 200) hoặc None nếu lỗi kết nối"""
+        status, reply = await self.request_async("POST", "/api/data", body, content_type)
+        if status is None:
+            return None
+        if 200 <= status < 300:
+            logger.debug("Dữ liệu đã gửi thành công đến IRIV IO Controller (%d byte)", len(body))
+            return 200
+        logger.warning("Lỗi khi gửi dữ liệu: HTTP %d %s", status, reply, every=60)
+        return status
+
+    async def get_status_async(self):
+        """Lấy trạng thái từ IRIV IO Controller (dict), None nếu lỗi"""
+        status, body = await self.request_async("GET", "/api/status")
+        if status is None:
+            return None
+        if status != 200:
+            logger.warning("Lỗi khi nhận trạng thái: HTTP %d %s", status, body)
+            return None
         try:
-            # Tạo socket và gửi request
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(5)
-            sock.connect((self.ip_address, self.port))
-            
-            # Tạo HTTP request
-            request = f"GET /api/status HTTP/1.1\r\n"
-            request += f"Host: {self.ip_address}\r\n"
-            request += "Connection: close\r\n\r\n"
-            
-            # Gửi request
-            sock.sendall(request.encode())
-            
-            # Nhận phản hồi
-            response = b""
-            while True:
-                data = sock.recv(1024)
-                if not data:
-                    break
-                response += data
-            
-            sock.close()
-            
-            # Xử lý phản hồi
-            response_str = response.decode()
-            if "200 OK" in response_str:
-                # Tìm phần JSON trong phản hồi
-                json_start = response_str.find('{')
-                if json_start != -1:
-                    json_data = response_str[json_start:]
-                    return json.loads(json_data)
-                else:
-                    print("Không tìm thấy dữ liệu JSON trong phản hồi")
-                    return None
-            else:
-                print(f"Lỗi khi nhận trạng thái: {response_str}")
-                return None
-        except Exception as e:
-            print(f"Lỗi khi nhận trạng thái từ IRIV IO Controller: {e}")
-            self.connected = False
+            return json.loads(body)
+        except ValueError:
+            logger.warning("Phản hồi trạng thái không phải JSON")
             return None
 
     def calculate_crc(self, data):
         """Tính CRC16 Modbus"""
-        return config.calculate_crc(data)
+        return crc16(data)
 
-    def read_level_sensor(self):
-        """Đọc dữ liệu từ cảm biến mức chất lỏng QDY30A-B qua RS485/Modbus RTU"""
+    @property
+    def level_registers(self):
+        """Giá trị thô gần nhất của các thanh ghi trên cảm biến mức chính"""
+        return self.level_sensors[0].values
+
+    def begin_poll(self, sensor):
+        """
+        Pha 1 của lần đọc cảm biến mức: lấy khóa bus và gửi request khối đầu
+
+        Trả về True nếu đã gửi; khi đó bắt buộc gọi finish_poll() để nhận
+        phản hồi và nhả khóa bus.
+        """
+        if not self.bus_lock.acquire(sensor):
+            return False
+        sensor.stats["polls"] += 1
+        try:
+            self.modbus.send(sensor.blocks[0][2])
+        except Exception as e:
+            self._poll_failed(sensor, e)
+            self.bus_lock.release(sensor)
+            return False
+        return True
+
+    def finish_poll(self, sensor):
+        """
+        Pha 2: nhận phản hồi khối đầu, đọc các khối còn lại bằng frame tạo sẵn
+        rồi nhả khóa bus. Trả về mực nước (mm, số nguyên), hoặc None nếu slave lỗi.
+        """
+        return run_steps(self.finish_poll_steps(sensor))
+
+    async def finish_poll_async(self, sensor):
+        """
+        finish_poll() nhường event loop trong lúc chờ phản hồi của từng khối
+
+        Khóa bus vẫn được giữ đến khi xong nên task khác không chen giao dịch
+        vào giữa; chỉ pha gửi (send) còn chạy đồng bộ để nhả DE đúng lúc.
+        """
+        return await run_steps_async(self.finish_poll_steps(sensor))
+
+    def finish_poll_steps(self, sensor):
+        """finish_poll() dạng generator các bước chờ (runtime.run_steps)"""
+        modbus = self.modbus
         try:
-            # Nếu sử dụng pin DE/RE cho điều khiển hướng RS485
-            if self.de_pin is not None:
-                self.de.value(1)  # Chế độ gửi dữ liệu
-                time.sleep(0.01)  # Delay nhỏ để chuyển chế độ
-            
-            # Lấy lệnh Modbus từ config
-            cmd_data = bytearray(config.MODBUS_WATER_LEVEL_CMD)
-            
-            # Xóa bộ đệm trước khi gửi
-            self.uart.read()
-            
-            # Gửi lệnh Modbus qua UART
-            self.uart.write(cmd_data)
-            
-            # Chuyển sang chế độ nhận nếu sử dụng DE/RE pin
-            if self.de_pin is not None:
-                self.de.value(0)  # Chế độ nhận dữ liệu
-            
-            # Đợi phản hồi (timeout 500ms)
-            time.sleep(0.1)
-            
-            # Đọc phản hồi
-            response = self.uart.read()
-            
-            if not response or len(response) < 5:  # Tối thiểu: addr(1) + func(1) + len(1) + data(1) + CRC(2)
-                print(f"Không đủ dữ liệu từ cảm biến: Nhận được {len(response) if response else 0} bytes")
-                return None
-                
-            # Kiểm tra địa chỉ slave và mã hàm
-            if response[0] != config.MODBUS_SLAVE_ADDRESS or response[1] != 0x03:
-                print(f"Phản hồi không hợp lệ: Slave={response[0]}, Function={response[1]}")
-                return None
-                
-            # Kiểm tra độ dài dữ liệu
-            byte_count = response[2]
-            if len(response) < byte_count + 5:  # addr + func + len + data + CRC (2)
-                print(f"Dữ liệu không đủ: Cần {byte_count + 5} byte, nhận được {len(response)} byte")
-                return None
-                
-            # Kiểm tra CRC
-            received_data = response[:-2]
-            received_crc = (response[-1] << 8) | response[-2]
-            calculated_crc = self.calculate_crc(received_data)
-            
-            if calculated_crc != received_crc:
-                print(f"Lỗi CRC: Nhận được 0x{received_crc:04X}, tính được 0x{calculated_crc:04X}")
-                return None
-                
-            # Đọc giá trị mức nước từ dữ liệu
-            if byte_count >= 2:
-                # Big Endian (mặc định cho Modbus RTU)
-                level_value = (response[3] << 8) | response[4]
-                
-                # Chuyển sang đơn vị đo thực tế (mm -> m)
-                level_meters = level_value / 1000.0
-                
-                print(f"Mức chất lỏng: {level_value} mm ({level_meters:.3f} m)")
-                return level_meters
-            else:
-                print(f"Không đủ dữ liệu cho giá trị mức nước")
-                return None
-            
+            try:
+                start, count, frame = sensor.blocks[0]
+                sensor.store(start, count, (yield from modbus.collect_registers_steps(sensor.address, count)))
+                for start, count, frame in sensor.blocks[1:]:
+                    sensor.store(start, count, (yield from modbus.read_registers_steps(sensor.address, start, count, frame)))
+            except ModbusException as e:
+                # Cảm biến không có các thanh ghi phụ: chỉ đọc mực nước
+                logger.warning("%s: không đọc được khối thanh ghi (%s), chỉ đọc WATER_LEVEL", sensor.name, e)
+                start, count, frame = sensor.level_block
+                sensor.store(start, count, (yield from modbus.read_registers_steps(sensor.address, start, count, frame)))
+            sensor.succeed()
         except Exception as e:
-            print(f"Lỗi khi đọc cảm biến mức chất lỏng: {e}")
-            return None 
\ No newline at end of file
+            self._poll_failed(sensor, e)
+            return None
+        finally:
+            # Cả khi task bị hủy giữa chừng (run_steps_async đóng generator)
+            self.bus_lock.release(sensor)
+        
+        logger.debug("%s: mức chất lỏng %d mm", sensor.name, sensor.level)
+        return sensor.level
+
+    def _poll_failed(self, sensor, error):
+        delay = sensor.fail(ticks_ms())
+        logger.warning("Lỗi khi đọc cảm biến mức %s (slave %d): %s, bỏ qua %d giây",
+                       sensor.name, sensor.address, error, delay)
+
+    def poll_level_sensor(self, sensor):
+        """
+        Đọc một cảm biến mức, giữ khóa bus suốt giao dịch
+
+        Trả về mực nước (mm, số nguyên), hoặc None nếu bus đang bận hay slave không trả lời.
+        """
+        if not self.begin_poll(sensor):
+            return None
+        return self.finish_poll(sensor)
+
+    def begin_next(self):
+        """
+        Gửi request đến cảm biến mức kế tiếp theo vòng, bỏ qua các slave đang backoff
+
+        Lượt của slave đang backoff được nhường cho slave khỏe kế tiếp.
+        Trả về LevelSensor đang chờ phản hồi (cần finish_poll), hoặc None.
+        """
+        sensors = self.level_sensors
+        now = ticks_ms()
+        for _ in range(len(sensors)):
+            sensor = sensors[self.next_sensor]
+            self.next_sensor = (self.next_sensor + 1) % len(sensors)
+            if sensor.ready(now):
+                return sensor if self.begin_poll(sensor) else None
+            sensor.stats["skipped"] += 1
+        return None
+
+    def poll_next(self):
+        """Đọc trọn một lượt cảm biến mức kế tiếp theo vòng, trả về LevelSensor hoặc None"""
+        return run_steps(self.poll_next_steps())
+
+    async def poll_next_async(self):
+        """poll_next() không chặn event loop trong lúc chờ phản hồi"""
+        return await run_steps_async(self.poll_next_steps())
+
+    def poll_next_steps(self):
+        """poll_next() dạng generator các bước chờ"""
+        sensor = self.begin_next()
+        if sensor is not None:
+            yield from self.finish_poll_steps(sensor)
+        return sensor
+
+    def bus_status(self):
+        """Thống kê bus RS485 và trạng thái từng cảm biến mức"""
+        stats = dict(self.modbus.stats)
+        stats["contended"] = self.bus_lock.contended
+        stats["slaves"] = [sensor.status() for sensor in self.level_sensors]
+        return stats
+
+    def read_level_sensor(self):
+        """
+        Đọc dữ liệu từ cảm biến mức chất lỏng chính (slave đầu tiên của
+        config.MODBUS_SLAVES) qua RS485/Modbus RTU. Trả về mực nước (mm).
+        """
+        return self.poll_level_sensor(self.level_sensors[0])
@@ -0,0 +1,114 @@
+from schema import FIELDS, CHANNELS, ALERTS, ALERT_BITS
+from fixedpoint import decimals
+
+# Các giá trị số của snapshot theo thứ tự xuất hiện trong JSON
+NUMBER_KEYS = FIELDS
+ALERT_KEYS = ALERTS
+
+
+class SnapshotWriter:
+    """
+    Serialize snapshot (schema cố định) thẳng vào một bytearray cấp sẵn
+
+    data là Reading hoặc dict có get() (delta của SSE): giá trị là số nguyên
+    fixed-point (xem fixedpoint.py), "alerts" là bitmask ALERT_BITS. Tên khóa
+    là các đoạn bytes tạo một lần; số được ghi từng chữ số với số chữ số thập
+    phân theo hệ số trong schema.CHANNELS, không qua json.dumps/str/float nên
+    không tạo chuỗi trung gian. Giá trị None được ghi là 0.
+    """
+
+    def __init__(self, size=320):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.numbers = [(key, ('"' + key + '": ').encode(), decimals(CHANNELS[key][0]))
+                        for key in NUMBER_KEYS]
+        self.alerts = [(ALERT_BITS[key], ('"' + key + '": ').encode()) for key in ALERT_KEYS]
+
+    def _put(self, pos, fragment):
+        end = pos + len(fragment)
+        self.buf[pos:end] = fragment
+        return end
+
+    def _put_fixed(self, pos, value, decimals):
+        """Ghi số nguyên fixed-point value (có decimals chữ số thập phân)"""
+        buf = self.buf
+        if value < 0:
+            buf[pos] = 45  # '-'
+            pos += 1
+            value = -value
+        # Ghi ngược từ chữ số cuối, rồi đảo lại
+        start = pos
+        digits = 0
+        while True:
+            buf[pos] = 48 + value % 10
+            value //= 10
+            pos += 1
+            digits += 1
+            if digits == decimals:
+                buf[pos] = 46  # '.'
+                pos += 1
+            elif digits > decimals and not value:
+                break
+        i, j = start, pos - 1
+        while i < j:
+            buf[i], buf[j] = buf[j], buf[i]
+            i += 1
+            j -= 1
+        return pos
+
+    def _put_str(self, pos, s):
+        """Ghi chuỗi ASCII không cần escape (timestamp)"""
+        buf = self.buf
+        buf[pos] = 34  # '"'
+        pos += 1
+        for i in range(len(s)):
+            buf[pos] = ord(s[i])
+            pos += 1
+        buf[pos] = 34
+        return pos + 1
+
+    def write(self, data, alerts=True, partial=False, timestamp=None):
+        """
+        Serialize snapshot vào self.buf, trả về số byte đã ghi
+
+        - alerts: ghi object "alerts" (False cho bản ghi gửi IRIV)
+        - partial: chỉ ghi các khóa có trong data (delta của SSE)
+        - timestamp: chuỗi thay cho timestamp của data (thời điểm vào outbox)
+        """
+        buf = self.buf
+        buf[0] = 123  # '{'
+        pos = 1
+        for key, name, places in self.numbers:
+            if partial and key not in data:
+                continue
+            if pos > 1:
+                pos = self._put(pos, b", ")
+            pos = self._put(pos, name)
+            value = data.get(key)
+            pos = self._put_fixed(pos, 0 if value is None else value, places)
+
+        if alerts and not partial:
+            pos = self._put(pos, b', "alerts": {')
+            bits = data.get("alerts") or 0
+            for i, (bit, name) in enumerate(self.alerts):
+                if i:
+                    pos = self._put(pos, b", ")
+                pos = self._put(pos, name)
+                pos = self._put(pos, b"true" if bits & bit else b"false")
+            pos = self._put(pos, b"}")
+
+        if timestamp is not None or not partial or "timestamp" in data:
+            if timestamp is None:
+                timestamp = data.get("timestamp")
+            if pos > 1:
+                pos = self._put(pos, b", ")
+            pos = self._put(pos, b'"timestamp": ')
+            if timestamp is None:
+                pos = self._put(pos, b"null")
+            else:
+                pos = self._put_str(pos, timestamp)
+        return self._put(pos, b"}")
+
+    def dumps(self, data, alerts=True, partial=False, timestamp=None):
+        """bytes JSON của data (một lần cấp phát cho kết quả)"""
+        return bytes(self.view[:self.write(data, alerts, partial, timestamp)])
@@ -0,0 +1,161 @@
+"""
+Nhật ký có mức (level) thay cho print() trên đường nóng
+
+    import logger
+    logger.info("Web server đang chạy tại http://%s:%d/", ip, port)
+    logger.warning("Lỗi đọc DHT22: %s", e, every=60)
+    if logger.enabled(logger.DEBUG):
+        logger.debug("DHT22: %s°C", format_channel("room_temp", temp))
+
+Mức được so ngay đầu lời gọi: bản ghi dưới mức hiện tại (config.LOG_LEVEL,
+đổi lúc chạy bằng set_level() hoặc /logs?set=) không tốn gì ngoài một phép
+so sánh. Tham số nào tốn công tạo (format_channel...) thì bên gọi tự kiểm
+tra enabled() trước.
+
+Chuỗi message không được định dạng khi ghi: bộ đệm vòng trong RAM
+(config.LOG_BUFFER bản ghi) chỉ giữ tham chiếu đến message (hằng chuỗi) và
+tuple tham số, cùng thời gian, mức và số lần lặp bị bỏ. Message % tham số
+chỉ được tính khi đọc (/logs) hoặc khi bản ghi đủ mức để in ra console
+(config.LOG_CONSOLE_LEVEL; trên Pico print() ghi đồng bộ qua USB-CDC).
+
+every=giây: message lặp lại (cùng chuỗi message) trong khoảng này bị bỏ,
+số lần bị bỏ được ghi kèm bản ghi kế tiếp của message đó.
+"""
+import time
+from array import array
+import config
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+_LETTERS = {DEBUG: "D", INFO: "I", WARNING: "W", ERROR: "E"}
+
+# Mức hiện tại: ghi vào bộ đệm / in ra console
+_level = [LEVELS[config.LOG_LEVEL]]
+_console = [LEVELS[config.LOG_CONSOLE_LEVEL]]
+
+# Bộ đệm vòng cố định, bản ghi thứ seq nằm ở ô seq % size
+_size = config.LOG_BUFFER
+_times = array("l", [0] * _size)
+_levels = bytearray(_size)
+_repeats = array("H", [0] * _size)
+_messages = [None] * _size
+_args = [None] * _size
+_next = [0]       # seq của bản ghi kế tiếp
+
+# Giới hạn lặp: message -> [thời điểm ghi gần nhất, số lần đã bỏ]
+_limits = {}
+
+
+def enabled(level):
+    """Bản ghi ở mức level có được ghi không (kiểm tra trước khi tạo tham số tốn công)"""
+    return level >= _level[0]
+
+
+def set_level(name, console=None):
+    """Đổi mức ghi (và mức in console nếu có) theo tên: debug/info/warning/error"""
+    _level[0] = LEVELS[name]
+    if console is not None:
+        _console[0] = LEVELS[console]
+
+
+def level_name(level=None):
+    level = _level[0] if level is None else level
+    for name, value in LEVELS.items():
+        if value == level:
+            return name
+    return str(level)
+
+
+def log(level, msg, args, every=0):
+    """Ghi một bản ghi (message chưa định dạng) vào bộ đệm vòng"""
+    if level < _level[0]:
+        return
+    repeats = 0
+    if every:
+        now = int(time.time())
+        state = _limits.get(msg)
+        if state is None:
+            _limits[msg] = [now, 0]
+        elif now - state[0] < every:
+            state[1] += 1
+            return
+        else:
+            repeats = min(state[1], 0xFFFF)
+            state[0] = now
+            state[1] = 0
+    seq = _next[0]
+    i = seq % _size
+    _times[i] = int(time.time())
+    _levels[i] = level
+    _repeats[i] = repeats
+    _messages[i] = msg
+    _args[i] = args or None
+    _next[0] = seq + 1
+    if level >= _console[0]:
+        print(_format(i))
+
+
+def debug(msg, *args, every=0):
+    log(DEBUG, msg, args, every)
+
+
+def info(msg, *args, every=0):
+    log(INFO, msg, args, every)
+
+
+def warning(msg, *args, every=0):
+    log(WARNING, msg, args, every)
+
+
+def error(msg, *args, every=0):
+    log(ERROR, msg, args, every)
+
+
+def _format(i):
+    """Định dạng bản ghi ở ô i thành một dòng (không kèm seq)"""
+    lt = time.localtime(_times[i])
+    msg = _messages[i]
+    args = _args[i]
+    if args:
+        try:
+            msg = msg % args
+        except Exception:
+            msg = "{} {}".format(msg, args)
+    line = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d} {} {}".format(
+        lt[0], lt[1], lt[2], lt[3], lt[4], lt[5], _LETTERS.get(_levels[i], "?"), msg)
+    if _repeats[i]:
+        line += " (bỏ qua {} lần lặp)".format(_repeats[i])
+    return line
+
+
+def next_seq():
+    """seq của bản ghi kế tiếp (dùng làm since= cho lần đọc sau)"""
+    return _next[0]
+
+
+def records(since=0, level=DEBUG, until=None):
+    """Các dòng "seq thời-gian mức message" còn trong bộ đệm có since <= seq < until"""
+    if until is None:
+        until = _next[0]
+    seq = max(since, _next[0] - _size)
+    while seq < until:
+        # Bản ghi có thể bị ghi đè trong lúc bên gọi đang chờ (drain)
+        if seq >= _next[0] - _size:
+            i = seq % _size
+            if _levels[i] >= level:
+                yield "{} {}\n".format(seq, _format(i))
+        else:
+            seq = _next[0] - _size
+            continue
+        seq += 1
+
+
+async def send(stream, since=0, level=DEBUG, until=None):
+    """Ghi các bản ghi ra stream (StreamWriter), drain sau mỗi dòng"""
+    for line in records(since, level, until):
+        stream.write(line.encode())
+        await stream.drain()
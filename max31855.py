@@ -1,30 +1,22 @@
 import time
+import profiler
 from machine import Pin, SPI
 
-class MAX31855:
-    def __init__(self, sck, cs, so):
-        """
-        Khởi tạo cảm biến MAX31855
-        
-        Tham số:
-        - sck: Chân SCK (Serial Clock)
-        - cs: Chân CS (Chip Select)  
-        - so: Chân SO/DO (Serial/Data Output - MISO)
-        """
-        self.cs = cs
-        self.cs.init(Pin.OUT, value=1)
-        
-        # Sử dụng giao tiếp SPI tự cài đặt (bit-bang)
+
+class BitBangTransport:
+    """Đọc khung 32-bit bằng cách tự tạo xung clock (bit-bang) trên SCK/SO"""
+
+    def __init__(self, sck, so):
         self.sck = sck
         self.sck.init(Pin.OUT, value=0)
         self.so = so
         self.so.init(Pin.IN)
-        
-    def read_raw(self):
-        """Đọc giá trị thô từ MAX31855 (32-bit)"""
-        self.cs.value(0)  # Kích hoạt CS (active low)
+
+    def read_frame(self, cs):
+        """Đọc giá trị thô 32-bit từ thiết bị được chọn bởi chân cs"""
+        cs.value(0)  # Kích hoạt CS (active low)
         time.sleep_us(10)
-        
+
         value = 0
         for i in range(32):
             self.sck.value(1)  # xung clock lên
@@ -32,30 +24,103 @@ class MAX31855:
             value = (value << 1) | self.so.value()  # đọc bit từ SO
             self.sck.value(0)  # xung clock xuống
             time.sleep_us(10)
-            
-        self.cs.value(1)  # vô hiệu hóa CS
+
+        cs.value(1)  # vô hiệu hóa CS
         return value
-    
+
+
+class SPITransport:
+    """Đọc khung 32-bit bằng machine.SPI phần cứng vào bộ đệm cấp phát sẵn"""
+
+    def __init__(self, spi):
+        self.spi = spi
+        self.buf = bytearray(4)
+
+    def read_frame(self, cs):
+        """Đọc giá trị thô 32-bit từ thiết bị được chọn bởi chân cs"""
+        buf = self.buf
+        cs.value(0)
+        self.spi.readinto(buf)
+        cs.value(1)
+        return (buf[0] << 24) | (buf[1] << 16) | (buf[2] << 8) | buf[3]
+
+
+def make_spi(spi_id, sck, so, baudrate=5000000):
+    """Tạo machine.SPI chỉ đọc (MISO) cho MAX31855, tối đa 5 MHz, mode 0"""
+    return SPI(spi_id, baudrate=baudrate, polarity=0, phase=0, sck=sck, miso=so)
+
+
+def decode_quarters(raw_value):
+    """Chuyển khung thô 32-bit thành số bước 0.25 °C (int), None nếu có lỗi"""
+    # Kiểm tra các bit cờ lỗi (D16, D2, D1, D0)
+    if raw_value & 0x10004:  # Kiểm tra lỗi
+        return None
+
+    # Nhiệt độ là 14 bit đầu tiên (D31:D18) với bit dấu
+    temp_data = (raw_value >> 18) & 0x3FFF
+
+    # Nếu bit dấu (D31) = 1, đó là nhiệt độ âm
+    if raw_value & 0x80000000:
+        # Chuyển 2's complement sang giá trị âm
+        temp_data = -(~temp_data & 0x1FFF)
+
+    return temp_data
+
+
+def decode(raw_value):
+    """Chuyển khung thô 32-bit thành nhiệt độ (°C), None nếu có lỗi"""
+    quarters = decode_quarters(raw_value)
+    return None if quarters is None else quarters * 0.25
+
+
+@profiler.traced("read_raw")
+class MAX31855:
+    def __init__(self, sck=None, cs=None, so=None, transport=None):
+        """
+        Khởi tạo cảm biến MAX31855
+
+        Tham số:
+        - sck: Chân SCK (Serial Clock)
+        - cs: Chân CS (Chip Select)
+        - so: Chân SO/DO (Serial/Data Output - MISO)
+        - transport: BitBangTransport/SPITransport dùng chung (bỏ qua sck/so)
+        """
+        self.cs = cs
+        self.cs.init(Pin.OUT, value=1)
+
+        # Mặc định sử dụng giao tiếp SPI tự cài đặt (bit-bang)
+        if transport is None:
+            transport = BitBangTransport(sck, so)
+        self.transport = transport
+
+    def read_raw(self):
+        """Đọc giá trị thô từ MAX31855 (32-bit)"""
+        return self.transport.read_frame(self.cs)
+
     def read(self):
         """
         Đọc nhiệt độ từ cảm biến MAX31855 (°C)
         Trả về None nếu có lỗi
         """
-        raw_value = self.read_raw()
-        
-        # Kiểm tra các bit cờ lỗi (D16, D2, D1, D0)
-        if raw_value & 0x10004:  # Kiểm tra lỗi
-            return None
-            
-        # Nhiệt độ là 14 bit đầu tiên (D31:D18) với bit dấu
-        temp_data = (raw_value >> 18) & 0x3FFF
-        
-        # Nếu bit dấu (D31) = 1, đó là nhiệt độ âm
-        if raw_value & 0x80000000:
-            # Chuyển 2's complement sang giá trị âm
-            temp_data = ~temp_data & 0x1FFF
-            temp = -temp_data * 0.25
-        else:
-            temp = temp_data * 0.25
-            
-        return temp
\ No newline at end of file
+        return decode(self.read_raw())
+
+    def read_centi(self):
+        """Đọc nhiệt độ theo 0.01 °C (int, không dùng float), None nếu có lỗi"""
+        quarters = decode_quarters(self.read_raw())
+        return None if quarters is None else quarters * 25
+
+
+class MAX31855Bus:
+    """
+    Nhiều MAX31855 dùng chung SCK/MISO, chỉ khác chân CS
+
+    Một lần quét (read_all) đọc lần lượt tất cả thiết bị trên bus.
+    """
+
+    def __init__(self, transport, cs_pins):
+        self.transport = transport
+        self.devices = [MAX31855(cs=cs, transport=transport) for cs in cs_pins]
+
+    def read_all(self):
+        """Đọc nhiệt độ tất cả thiết bị, trả về list (None cho thiết bị lỗi)"""
+        return [decode(self.transport.read_frame(dev.cs)) for dev in self.devices]
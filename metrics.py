@@ -0,0 +1,147 @@
+"""
+Đo đạc nhẹ cho /metrics: counter, gauge và histogram thời gian (ticks_us)
+
+Các metric được khai báo một lần ở cấp module nơi dùng, ví dụ:
+
+    MODBUS_TRANSACTION = metrics.histogram("modbus_transaction_seconds", "...")
+    ...
+    start = ticks_us()
+    ...
+    MODBUS_TRANSACTION.observe(ticks_diff(ticks_us(), start))
+
+Các series cùng tên (khác nhãn) thuộc một nhóm, HELP lấy từ series khai
+báo đầu tiên. Histogram giữ số đếm theo các bucket cố định (us) trong một
+array, không cấp phát khi observe(). Khi xuất, mọi đoạn cố định (HELP/TYPE,
+tên kèm nhãn, le) đã là bytes tạo sẵn; chỉ các con số được chuyển thành
+chuỗi, ghi thẳng ra stream theo định dạng văn bản Prometheus.
+"""
+from array import array
+
+# Biên trên các bucket (us): 100 us .. 1 s
+BUCKETS_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000,
+              100000, 250000, 500000, 1000000)
+
+CONTENT_TYPE = b"text/plain; version=0.0.4; charset=utf-8"
+
+# [(header bytes, [series])] theo thứ tự khai báo
+_families = []
+_index = {}
+
+
+def _seconds(us):
+    """us (int) -> chuỗi giây không qua float"""
+    text = "{}.{:06d}".format(us // 1000000, us % 1000000).rstrip("0")
+    return text + "0" if text.endswith(".") else text
+
+
+def _family(name, help, kind):
+    family = _index.get(name)
+    if family is None:
+        header = "# HELP {} {}\n# TYPE {} {}\n".format(name, help, name, kind).encode()
+        family = (header, [])
+        _index[name] = family
+        _families.append(family)
+    return family[1]
+
+
+def _labels(labels, extra=None):
+    """dict nhãn -> chuỗi {k="v",...} (rỗng nếu không có nhãn)"""
+    items = ['{}="{}"'.format(k, v) for k, v in (labels or {}).items()]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+class Counter:
+    """Bộ đếm tăng dần; fn (nếu có) đọc giá trị từ nơi khác, ví dụ dict stats"""
+    __slots__ = ("value", "fn", "prefix")
+
+    def __init__(self, prefix, fn=None):
+        self.value = 0
+        self.fn = fn
+        self.prefix = prefix
+
+    def inc(self, n=1):
+        self.value += n
+
+    def write(self, stream):
+        value = self.value if self.fn is None else self.fn()
+        if value is None:
+            return
+        stream.write(self.prefix)
+        stream.write(str(value).encode())
+        stream.write(b"\n")
+
+
+class Gauge(Counter):
+    """Giá trị tức thời đọc qua fn (None = bỏ qua, ví dụ không có gc.mem_free)"""
+    __slots__ = ()
+
+
+class Histogram:
+    """Histogram thời gian với bucket cố định theo us, xuất theo giây"""
+    __slots__ = ("buckets", "counts", "sum", "count", "lines", "sum_prefix", "count_prefix")
+
+    def __init__(self, name, labels, buckets):
+        self.buckets = buckets
+        self.counts = array("L", [0] * (len(buckets) + 1))
+        self.sum = 0
+        self.count = 0
+        self.lines = [(name + "_bucket" + _labels(labels, 'le="{}"'.format(_seconds(b))) + " ").encode()
+                      for b in buckets]
+        self.lines.append((name + "_bucket" + _labels(labels, 'le="+Inf"') + " ").encode())
+        self.sum_prefix = (name + "_sum" + _labels(labels) + " ").encode()
+        self.count_prefix = (name + "_count" + _labels(labels) + " ").encode()
+
+    def observe(self, us):
+        """Ghi nhận một khoảng thời gian us (từ ticks_diff của ticks_us)"""
+        buckets = self.buckets
+        i = 0
+        n = len(buckets)
+        while i < n and us > buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += us
+        self.count += 1
+
+    def write(self, stream):
+        total = 0
+        counts = self.counts
+        for i in range(len(counts)):
+            total += counts[i]
+            stream.write(self.lines[i])
+            stream.write(str(total).encode())
+            stream.write(b"\n")
+        stream.write(self.sum_prefix)
+        stream.write(_seconds(self.sum).encode())
+        stream.write(b"\n")
+        stream.write(self.count_prefix)
+        stream.write(str(self.count).encode())
+        stream.write(b"\n")
+
+
+def counter(name, help, labels=None, fn=None):
+    metric = Counter((name + _labels(labels) + " ").encode(), fn)
+    _family(name, help, "counter").append(metric)
+    return metric
+
+
+def gauge(name, help, fn, labels=None):
+    metric = Gauge((name + _labels(labels) + " ").encode(), fn)
+    _family(name, help, "gauge").append(metric)
+    return metric
+
+
+def histogram(name, help, labels=None, buckets=BUCKETS_US):
+    metric = Histogram(name, labels, buckets)
+    _family(name, help, "histogram").append(metric)
+    return metric
+
+
+async def send(stream):
+    """Ghi toàn bộ metric ra stream (StreamWriter), drain sau mỗi nhóm"""
+    for header, series in _families:
+        stream.write(header)
+        for metric in series:
+            metric.write(stream)
+        await stream.drain()
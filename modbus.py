@@ -0,0 +1,289 @@
+from array import array
+import metrics
+from runtime import ticks_us, ticks_diff, sleep_us, run_steps, run_steps_async
+
+# Bảng CRC16 Modbus (đa thức 0xA001) 256 mục, tạo một lần khi import
+CRC_TABLE = array("H", [0] * 256)
+for _i in range(256):
+    _crc = _i
+    for _ in range(8):
+        _crc = (_crc >> 1) ^ 0xA001 if _crc & 1 else _crc >> 1
+    CRC_TABLE[_i] = _crc
+del _i, _crc
+
+
+def crc16(data, end=None):
+    """Tính CRC16 Modbus bằng bảng tra (một phép tra cho mỗi byte)"""
+    crc = 0xFFFF
+    table = CRC_TABLE
+    for i in range(len(data) if end is None else end):
+        crc = (crc >> 8) ^ table[(crc ^ data[i]) & 0xFF]
+    return crc
+
+
+def append_crc(frame):
+    """Thêm CRC (byte thấp trước) vào cuối frame (bytearray)"""
+    crc = crc16(frame)
+    frame.append(crc & 0xFF)
+    frame.append(crc >> 8)
+    return frame
+
+
+def read_request(slave, start, count):
+    """Tạo frame hàm 0x03 (Read Holding Registers) đã có CRC"""
+    return append_crc(bytearray([slave, 0x03, start >> 8, start & 0xFF, count >> 8, count & 0xFF]))
+
+
+TRANSACTION_TIME = metrics.histogram(
+    "modbus_transaction_seconds", "Thời gian từ lúc gửi request đến khi nhận xong phản hồi")
+TIMEOUTS = metrics.counter("modbus_timeouts_total", "Số giao dịch Modbus không nhận đủ phản hồi")
+CRC_ERRORS = metrics.counter("modbus_crc_errors_total", "Số phản hồi Modbus sai CRC")
+EXCEPTIONS = metrics.counter("modbus_exceptions_total", "Số exception response từ slave")
+
+
+# Mã exception chuẩn Modbus
+EXCEPTION_NAMES = {
+    1: "ILLEGAL FUNCTION",
+    2: "ILLEGAL DATA ADDRESS",
+    3: "ILLEGAL DATA VALUE",
+    4: "SLAVE DEVICE FAILURE",
+    5: "ACKNOWLEDGE",
+    6: "SLAVE DEVICE BUSY",
+    8: "MEMORY PARITY ERROR",
+    10: "GATEWAY PATH UNAVAILABLE",
+    11: "GATEWAY TARGET FAILED TO RESPOND",
+}
+
+
+class ModbusError(Exception):
+    """Lỗi giao dịch Modbus"""
+
+
+class ModbusTimeout(ModbusError):
+    """Slave không trả lời (hoặc trả lời thiếu) trong thời gian chờ"""
+
+
+class ModbusCRCError(ModbusError):
+    """Frame trả về sai CRC"""
+
+
+class ModbusException(ModbusError):
+    """Slave trả về exception response (function | 0x80)"""
+
+    def __init__(self, slave, function, code):
+        self.slave = slave
+        self.function = function
+        self.code = code
+        super().__init__("slave {} function 0x{:02X}: exception {} ({})".format(
+            slave, function, code, EXCEPTION_NAMES.get(code, "UNKNOWN")))
+
+
+def plan_reads(addresses, max_gap=4, max_count=125):
+    """
+    Gộp các thanh ghi gần nhau thành các khối đọc 0x03
+
+    Các thanh ghi cách nhau không quá max_gap thanh ghi được đọc chung một
+    giao dịch (đọc dư vài thanh ghi rẻ hơn một giao dịch mới). Trả về list
+    (start, count).
+    """
+    blocks = []
+    for addr in sorted(set(addresses)):
+        if blocks:
+            start, count = blocks[-1]
+            if addr - (start + count) <= max_gap and addr - start + 1 <= max_count:
+                blocks[-1] = (start, addr - start + 1)
+                continue
+        blocks.append((addr, 1))
+    return blocks
+
+
+class ModbusMaster:
+    """
+    Modbus RTU master trên UART (RS485)
+
+    Phát hiện kết thúc frame trả lời theo độ dài mong đợi, hoặc theo khoảng
+    lặng 3.5 ký tự giữa các frame, thay vì ngủ một khoảng cố định.
+    """
+
+    def __init__(self, uart, baudrate=9600, de=None, timeout_ms=200):
+        self.uart = uart
+        self.de = de
+        self.timeout_ms = timeout_ms
+        # Modbus tính 11 bit mỗi ký tự; trên 19200 baud dùng giá trị cố định
+        self.char_us = 11 * 1000000 // baudrate
+        self.gap_us = 1750 if baudrate > 19200 else self.char_us * 7 // 2
+        # Khoảng chờ giữa các lần kiểm tra bộ đệm nhận (receive_steps)
+        self.poll_us = self.gap_us
+        self.rx = bytearray(256)
+        self.sent_us = 0  # ticks_us lúc gửi request gần nhất
+        self.stats = {"transactions": 0, "timeouts": 0, "crc_errors": 0, "exceptions": 0}
+
+    def send(self, frame):
+        """Gửi frame request (bật DE khi phát, trả về chế độ nhận ngay khi phát xong)"""
+        uart = self.uart
+        self.sent_us = ticks_us()
+        # Xóa bộ đệm nhận trước khi gửi
+        while uart.any():
+            uart.read()
+        if self.de is not None:
+            self.de.value(1)
+        uart.write(frame)
+        if self.de is not None:
+            # Chờ byte cuối rời khỏi thanh ghi dịch rồi mới nhả bus
+            if hasattr(uart, "flush"):
+                uart.flush()
+            else:
+                sleep_us(self.char_us * len(frame))
+            self.de.value(0)
+        self.stats["transactions"] += 1
+
+    def receive(self, expected_len, timeout_ms=None):
+        """Nhận frame trả lời (receive_steps), ngủ chặn trong lúc chờ"""
+        return run_steps(self.receive_steps(expected_len, timeout_ms))
+
+    async def receive_async(self, expected_len, timeout_ms=None):
+        """Như receive() nhưng nhường event loop giữa các lần kiểm tra bộ đệm nhận"""
+        return await run_steps_async(self.receive_steps(expected_len, timeout_ms))
+
+    def receive_steps(self, expected_len, timeout_ms=None):
+        """
+        Nhận frame trả lời vào self.rx (generator, xem runtime.run_steps),
+        trả về memoryview của frame
+
+        Dừng khi đủ expected_len byte, khi gặp exception response (5 byte),
+        hoặc khi đã có dữ liệu và bus im lặng quá 3.5 ký tự. Các byte đến
+        trong lúc chờ nằm trong bộ đệm của UART; khoảng lặng cuối frame vẫn
+        được xác nhận bằng any() nên chờ lố chỉ làm chậm, không cắt cụt frame.
+        """
+        uart = self.uart
+        n = 0
+        timeout_us = (self.timeout_ms if timeout_ms is None else timeout_ms) * 1000
+        start = last = ticks_us()
+        while True:
+            available = uart.any()
+            if available:
+                n = self._fill(n, available)
+                last = ticks_us()
+                if self._complete(n, expected_len):
+                    break
+            elif n:
+                # Kiểm tra lại any(): task có thể bị dừng (GC, ngắt) ngay sau lần
+                # kiểm tra trên trong khi các byte tiếp theo đã nằm trong bộ đệm
+                if ticks_diff(ticks_us(), last) > self.gap_us and not uart.any():
+                    break
+            elif ticks_diff(ticks_us(), start) > timeout_us:
+                break
+            yield self.poll_us
+        return memoryview(self.rx)[:n]
+
+    def _fill(self, n, available):
+        """Chép available byte đang có trong bộ đệm UART vào self.rx từ vị trí n, trả về n mới"""
+        rx = self.rx
+        chunk = self.uart.read(min(available, len(rx) - n))
+        if chunk:
+            rx[n:n + len(chunk)] = chunk
+            n += len(chunk)
+        return n
+
+    def _complete(self, n, expected_len):
+        """Đã đủ frame: đủ độ dài mong đợi, exception response, hoặc đầy bộ đệm"""
+        return n >= expected_len or (n >= 5 and self.rx[1] & 0x80) or n >= len(self.rx)
+
+    def check(self, frame, slave, function):
+        """Kiểm tra CRC, địa chỉ, mã hàm; ném ModbusError tương ứng"""
+        n = len(frame)
+        if n < 5:
+            self.stats["timeouts"] += 1
+            TIMEOUTS.inc()
+            raise ModbusTimeout("slave {}: nhận được {} byte".format(slave, n))
+        if crc16(frame, n - 2) != frame[n - 2] | (frame[n - 1] << 8):
+            self.stats["crc_errors"] += 1
+            CRC_ERRORS.inc()
+            raise ModbusCRCError("slave {}: sai CRC".format(slave))
+        if frame[0] != slave or frame[1] & 0x7F != function:
+            raise ModbusError("phản hồi không hợp lệ: slave={}, function={}".format(frame[0], frame[1]))
+        if frame[1] & 0x80:
+            self.stats["exceptions"] += 1
+            EXCEPTIONS.inc()
+            raise ModbusException(slave, function, frame[2])
+
+    def read_registers(self, slave, start, count, frame=None):
+        """Đọc count holding register (hàm 0x03) từ start, trả về list giá trị 16-bit"""
+        return run_steps(self.read_registers_steps(slave, start, count, frame))
+
+    def collect_registers(self, slave, count):
+        """
+        Nhận và kiểm tra phản hồi của request 0x03 đã gửi bằng send()
+
+        Tách khỏi send() để bên gọi làm việc khác trong lúc slave xử lý;
+        các byte đến trong lúc đó nằm chờ trong bộ đệm nhận của UART.
+        """
+        return run_steps(self.collect_registers_steps(slave, count))
+
+    async def read_registers_async(self, slave, start, count, frame=None):
+        """read_registers() không chặn event loop trong lúc chờ phản hồi"""
+        return await run_steps_async(self.read_registers_steps(slave, start, count, frame))
+
+    async def collect_registers_async(self, slave, count):
+        """collect_registers() không chặn event loop trong lúc chờ phản hồi"""
+        return await run_steps_async(self.collect_registers_steps(slave, count))
+
+    def read_registers_steps(self, slave, start, count, frame=None):
+        """read_registers() dạng generator các bước chờ"""
+        self.send(frame or read_request(slave, start, count))
+        return (yield from self.collect_registers_steps(slave, count))
+
+    def collect_registers_steps(self, slave, count):
+        """collect_registers() dạng generator các bước chờ"""
+        reply = yield from self.receive_steps(5 + 2 * count)
+        return self._registers(reply, slave, count)
+
+    def _registers(self, reply, slave, count):
+        """Kiểm tra phản hồi 0x03, trả về list giá trị 16-bit"""
+        TRANSACTION_TIME.observe(ticks_diff(ticks_us(), self.sent_us))
+        self.check(reply, slave, 0x03)
+        if reply[2] != 2 * count or len(reply) < 5 + 2 * count:
+            raise ModbusError("slave {}: sai số byte dữ liệu {}".format(slave, reply[2]))
+        return [(reply[3 + 2 * i] << 8) | reply[4 + 2 * i] for i in range(count)]
+
+    def read_map(self, slave, registers, max_gap=4):
+        """
+        Đọc nhiều thanh ghi theo tên {tên: địa chỉ} với số giao dịch ít nhất
+
+        Trả về dict {tên: giá trị}.
+        """
+        values = {}
+        for start, count in plan_reads(registers.values(), max_gap):
+            block = self.read_registers(slave, start, count)
+            for name in registers:
+                offset = registers[name] - start
+                if 0 <= offset < count:
+                    values[name] = block[offset]
+        return values
+
+
+class BusLock:
+    """
+    Khóa bus RS485 không chặn
+
+    Mỗi thời điểm chỉ một giao dịch được giữ bus (kể cả khi request đã gửi
+    và đang chờ phản hồi); bên không lấy được khóa bỏ lượt thay vì chờ.
+    """
+
+    def __init__(self):
+        self.owner = None
+        self.contended = 0  # Số lần lấy khóa thất bại
+
+    def acquire(self, owner):
+        if self.owner is not None:
+            self.contended += 1
+            return False
+        self.owner = owner
+        return True
+
+    def release(self, owner):
+        if self.owner is owner:
+            self.owner = None
+
+    def locked(self):
+        return self.owner is not None
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import config
+import logger
+from runtime import asyncio
+from reading import Reading
+
+try:
+    import random
+except ImportError:
+    import urandom as random
+
+
+class Outbox:
+    """
+    Hàng đợi store-and-forward cho dữ liệu gửi lên IRIV Controller
+
+    Bản ghi mới vào hàng đợi RAM dung lượng cố định. Khi đầy, bản ghi cũ nhất
+    được chuyển xuống các file segment trên flash (nếu bật spill), hoặc bị bỏ.
+    Số segment cũng có giới hạn: segment cũ nhất bị xóa (drop-oldest).
+    Task upload lấy lô cũ nhất bằng peek(), gửi xong mới commit(). Bản ghi
+    của lô đang gửi bị đẩy khỏi RAM trong lúc chờ được giữ riêng: gửi thành
+    công thì tính là đã gửi, thất bại thì mới spill/bỏ ở lần peek() kế tiếp.
+    Bản ghi là (t, Reading); trên flash mỗi dòng là JSON [t, [giá trị FIELDS]].
+    """
+
+    def __init__(self, capacity=None, batch=None, spill_dir=None,
+                 segment_records=None, segments=None):
+        self.capacity = capacity or config.OUTBOX_CAPACITY
+        self.batch = batch or config.OUTBOX_BATCH
+        self.spill_dir = spill_dir if spill_dir is not None else \
+            (config.OUTBOX_DIR if config.OUTBOX_SPILL else None)
+        self.segment_records = segment_records or config.OUTBOX_SPILL_SEGMENT
+        self.max_segments = segments or config.OUTBOX_SPILL_SEGMENTS
+
+        self.queue = []        # [(t, data)] trong RAM, cũ nhất trước
+        self.spilled = []      # [[seq, số bản ghi, t bản ghi chưa gửi đầu tiên]], cũ nhất trước
+        self.spill_sent = 0    # Số bản ghi đầu segment cũ nhất đã gửi
+        self.spill_next_t = None  # t của bản ghi ngay sau lô "spill" đang gửi (None: hết segment)
+        self.pending = None    # Nguồn của lô đang peek: "ram" hoặc "spill"
+        self.inflight = 0      # Số bản ghi đầu self.queue thuộc lô "ram" đang gửi
+        self.evicted = []      # Bản ghi của lô đang gửi đã bị đẩy khỏi self.queue
+        self.available = asyncio.Event()
+        self.stats = {"queued": 0, "sent": 0, "dropped": 0, "spilled": 0, "batches": 0, "failures": 0}
+
+        if self.spill_dir:
+            self._load_spill()
+
+    def _path(self, seq):
+        return "{}/{:08d}.jsonl".format(self.spill_dir, seq)
+
+    def _load_spill(self):
+        """Nhận lại các segment còn trên flash sau khi khởi động lại"""
+        try:
+            os.mkdir(self.spill_dir)
+        except OSError:
+            pass  # Thư mục đã tồn tại
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not name.endswith(".jsonl"):
+                continue
+            seq = int(name[:-6])
+            count = 0
+            first_t = None
+            with open(self._path(seq)) as f:
+                for line in f:
+                    if first_t is None:
+                        try:
+                            first_t = json.loads(line)[0]
+                        except ValueError:
+                            logger.warning("Bỏ segment outbox hỏng: %s", name)
+                            break
+                    count += 1
+            if count:
+                self.spilled.append([seq, count, first_t])
+            else:
+                os.remove(self._path(seq))
+        if self.spilled:
+            self.available.set()
+
+    def _spill(self, item):
+        """Ghi bản ghi xuống segment mới nhất; trả về False nếu không spill được"""
+        if not self.spill_dir:
+            return False
+        try:
+            if not self.spilled or self.spilled[-1][1] >= self.segment_records:
+                seq = self.spilled[-1][0] + 1 if self.spilled else 1
+                if len(self.spilled) >= self.max_segments:
+                    self._drop_segment()
+                self.spilled.append([seq, 0, item[0]])
+            segment = self.spilled[-1]
+            with open(self._path(segment[0]), "a") as f:
+                f.write(json.dumps([item[0], item[1].values()]))
+                f.write("\n")
+            segment[1] += 1
+            self.stats["spilled"] += 1
+            return True
+        except OSError as e:
+            logger.error("Lỗi ghi outbox xuống flash: %s", e, every=60)
+            return False
+
+    def _drop_segment(self):
+        """Xóa segment cũ nhất (kể cả phần đang gửi dở)"""
+        seq, count, first_t = self.spilled.pop(0)
+        self.stats["dropped"] += count - self.spill_sent
+        self.spill_sent = 0
+        if self.pending == "spill":
+            self.pending = None
+        try:
+            os.remove(self._path(seq))
+        except OSError:
+            pass
+
+    def put(self, data, t=None):
+        """Thêm một bản ghi; hàng đợi RAM đầy thì đẩy bản cũ nhất xuống flash hoặc bỏ"""
+        if len(self.queue) >= self.capacity:
+            item = self.queue.pop(0)
+            if self.pending == "ram" and self.inflight:
+                # Thuộc lô đang gửi: chờ kết quả thay vì spill rồi gửi trùng
+                self.inflight -= 1
+                self.evicted.append(item)
+            elif not self._spill(item):
+                self.stats["dropped"] += 1
+        self.queue.append((int(time.time()) if t is None else t, data))
+        self.stats["queued"] += 1
+        self.available.set()
+
+    def depth(self):
+        """Số bản ghi chưa gửi (RAM + flash)"""
+        return len(self.queue) + len(self.evicted) + sum(seg[1] for seg in self.spilled) - self.spill_sent
+
+    def lag(self, now=None):
+        """Tuổi (giây) của bản ghi chưa gửi cũ nhất, 0 nếu hàng đợi rỗng"""
+        if self.spilled:
+            oldest = self.spilled[0][2]
+        elif self.evicted:
+            oldest = self.evicted[0][0]
+        elif self.queue:
+            oldest = self.queue[0][0]
+        else:
+            return 0
+        return (int(time.time()) if now is None else now) - oldest
+
+    def peek(self):
+        """Lô cũ nhất (tối đa self.batch bản ghi) dạng [(t, data)], chưa xóa khỏi hàng đợi"""
+        # Lô trước không được commit: bản ghi bị đẩy khỏi RAM lúc đó mới spill/bỏ
+        for item in self.evicted:
+            if not self._spill(item):
+                self.stats["dropped"] += 1
+        self.evicted = []
+        self.inflight = 0
+        while self.spilled:
+            items = self._read_spill(self.batch)
+            if items:
+                self.pending = "spill"
+                return items
+            # Segment hỏng hoặc ngắn hơn số bản ghi đã đếm: không còn gì để gửi
+            logger.warning("Bỏ segment outbox %d không đọc được", self.spilled[0][0])
+            self._drop_segment()
+        self.pending = "ram"
+        items = self.queue[:self.batch]
+        self.inflight = len(items)
+        return items
+
+    def _read_spill(self, limit):
+        """
+        Đọc tối đa limit bản ghi chưa gửi của segment cũ nhất, ghi t của bản
+        ghi ngay sau chúng vào self.spill_next_t (None nếu hết segment); dừng ở
+        dòng hỏng đầu tiên (phần sau bị bỏ khi commit)
+        """
+        items = []
+        self.spill_next_t = None
+        try:
+            with open(self._path(self.spilled[0][0])) as f:
+                for n, line in enumerate(f):
+                    if n < self.spill_sent:
+                        continue
+                    t, values = json.loads(line)
+                    if len(items) >= limit:
+                        self.spill_next_t = t
+                        break
+                    items.append((t, Reading(values)))
+        except (OSError, ValueError) as e:
+            logger.error("Lỗi đọc outbox từ flash: %s", e, every=60)
+        return items
+
+    def commit(self, items, dropped=False):
+        """
+        Xóa lô vừa gửi thành công (trả về bởi peek()) khỏi hàng đợi
+
+        dropped=True: lô bị bỏ vì không thể gửi (tính vào dropped thay vì sent).
+        """
+        n = len(items)
+        if self.pending == "spill":
+            segment = self.spilled[0]
+            self.spill_sent += n
+            if self.spill_sent < segment[1] and self.spill_next_t is None:
+                # Segment nhận thêm bản ghi trong lúc gửi (peek đã đọc đến cuối file)
+                self._read_spill(0)
+            if self.spill_sent >= segment[1] or self.spill_next_t is None:
+                # Đã gửi hết (không tính vào dropped), hoặc phần còn lại hỏng
+                self._drop_segment()
+            else:
+                # lag() tính từ bản ghi chưa gửi đầu tiên
+                segment[2] = self.spill_next_t
+        elif self.pending == "ram":
+            # Phần lô đã bị đẩy khỏi RAM nằm trong self.evicted, chỉ xóa phần còn lại
+            del self.queue[:self.inflight]
+            self.evicted = []
+            self.inflight = 0
+        else:
+            return  # Lô đã bị thay thế trong lúc gửi (drop-oldest)
+        self.pending = None
+        if dropped:
+            self.stats["dropped"] += n
+        else:
+            self.stats["sent"] += n
+            self.stats["batches"] += 1
+        if not self.depth():
+            self.available.clear()
+
+    def backoff(self, failures):
+        """Thời gian chờ (giây) trước lần thử lại: lũy thừa 2, jitter trong [1/2, 1]"""
+        delay = min(config.UPLOAD_BACKOFF_MIN * (1 << min(failures - 1, 16)), config.UPLOAD_BACKOFF_MAX)
+        return delay * (128 + random.getrandbits(7)) / 255
+
+    def metrics(self):
+        stats = dict(self.stats)
+        stats["depth"] = self.depth()
+        stats["ram"] = len(self.queue)
+        stats["segments"] = len(self.spilled)
+        stats["lag"] = self.lag()
+        return stats
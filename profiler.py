@@ -0,0 +1,217 @@
+"""
+Profiler bật/tắt lúc chạy cho các hàm trên đường nóng
+
+Đánh dấu method cần đo bằng class decorator:
+
+    @profiler.traced("read_raw")
+    class MAX31855:
+        ...
+
+hoặc đo một đoạn code bằng context manager:
+
+    with profiler.span("ten_doan"):
+        ...
+
+Khi tắt, traced() không thay đổi gì trên class: method gốc được gọi trực tiếp,
+không tốn thêm lời gọi nào. enable() mới thay các method đã đánh dấu bằng bản
+bọc đo ticks_us, disable() trả lại method gốc. span() khi tắt chỉ trả về một
+object rỗng dùng chung.
+
+Kết quả nằm trong bảng kích thước cố định (config.PROFILE_SLOTS mục): số lần
+gọi, thời gian inclusive và exclusive (trừ thời gian các mục con đồng bộ).
+Với coroutine (các WebServer.serve_*), thời gian tính từ lúc gọi đến lúc
+hoàn tất, kể cả lúc chờ I/O, và không trừ vào mục cha.
+"""
+import config
+from runtime import ticks_us, ticks_diff
+
+_targets = []     # [(class, tên method)] đã đánh dấu bằng traced()
+_originals = []   # [(class, tên, method gốc)] đang bị thay khi bật
+_enabled = [False]
+
+# Bảng cố định: tên và ba cột số đếm theo slot
+_names = []
+_slot_of = {}
+_calls = [0] * config.PROFILE_SLOTS
+_incl = [0] * config.PROFILE_SLOTS
+_excl = [0] * config.PROFILE_SLOTS
+_dropped = [0]    # Số lần đo bị bỏ vì bảng đầy
+
+# Thời gian con tích lũy của các frame đồng bộ đang chạy (để tính exclusive)
+_stack = []
+
+
+def _slot(name):
+    slot = _slot_of.get(name)
+    if slot is None:
+        if len(_names) >= len(_calls):
+            return None
+        slot = len(_names)
+        _names.append(name)
+        _slot_of[name] = slot
+    return slot
+
+
+def _record(slot, elapsed, child):
+    _calls[slot] += 1
+    _incl[slot] += elapsed
+    _excl[slot] += elapsed - child
+
+
+def traced(*names):
+    """Class decorator: đánh dấu các method names để đo khi profiler bật"""
+    def mark(cls):
+        for name in names:
+            _targets.append((cls, name))
+        if _enabled[0]:
+            for name in names:
+                _patch(cls, name)
+        return cls
+    return mark
+
+
+async def _timed_coro(coro, slot, start):
+    try:
+        return await coro
+    finally:
+        _record(slot, ticks_diff(ticks_us(), start), 0)
+
+
+def _wrap(fn, slot):
+    def wrapper(*args, **kwargs):
+        start = ticks_us()
+        _stack.append(0)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            elapsed = ticks_diff(ticks_us(), start)
+            _record(slot, elapsed, _stack.pop())
+            if _stack:
+                _stack[-1] += elapsed
+            raise
+        if hasattr(result, "send"):
+            # Coroutine: đo đến khi hoàn tất, không tính vào frame đồng bộ cha
+            _stack.pop()
+            return _timed_coro(result, slot, start)
+        elapsed = ticks_diff(ticks_us(), start)
+        _record(slot, elapsed, _stack.pop())
+        if _stack:
+            _stack[-1] += elapsed
+        return result
+    return wrapper
+
+
+def _patch(cls, name):
+    slot = _slot(cls.__name__ + "." + name)
+    if slot is None:
+        _dropped[0] += 1
+        return
+    original = getattr(cls, name)
+    _originals.append((cls, name, original))
+    setattr(cls, name, _wrap(original, slot))
+
+
+def enable():
+    """Bật profiler: thay các method đã đánh dấu bằng bản bọc đo thời gian"""
+    if _enabled[0]:
+        return
+    _enabled[0] = True
+    for cls, name in _targets:
+        _patch(cls, name)
+
+
+def disable():
+    """Tắt profiler: trả lại method gốc (không còn chi phí đo)"""
+    if not _enabled[0]:
+        return
+    _enabled[0] = False
+    while _originals:
+        cls, name, original = _originals.pop()
+        setattr(cls, name, original)
+    _stack[:] = []
+
+
+def enabled():
+    return _enabled[0]
+
+
+class _Span:
+    __slots__ = ("slot", "start")
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.start = 0
+
+    def __enter__(self):
+        self.start = ticks_us()
+        _stack.append(0)
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = ticks_diff(ticks_us(), self.start)
+        _record(self.slot, elapsed, _stack.pop())
+        if _stack:
+            _stack[-1] += elapsed
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """Context manager đo một đoạn code; khi tắt (hoặc bảng đầy) không làm gì"""
+    if not _enabled[0]:
+        return _NULL_SPAN
+    slot = _slot(name)
+    if slot is None:
+        _dropped[0] += 1
+        return _NULL_SPAN
+    return _Span(slot)
+
+
+def top(n=10, key="excl"):
+    """n mục tốn thời gian nhất theo key ("excl", "incl" hoặc "calls"), bỏ mục chưa được gọi"""
+    column = {"excl": _excl, "incl": _incl, "calls": _calls}[key]
+    order = [i for i in range(len(_names)) if _calls[i]]
+    order = sorted(order, key=lambda i: column[i], reverse=True)[:n]
+    entries = []
+    for i in order:
+        calls = _calls[i]
+        entries.append({
+            "name": _names[i],
+            "calls": calls,
+            "incl_us": _incl[i],
+            "excl_us": _excl[i],
+            "avg_us": _incl[i] // calls if calls else 0,
+        })
+    return entries
+
+
+def reset():
+    """Xóa số đếm (giữ slot của các method đang được đo)"""
+    for i in range(len(_calls)):
+        _calls[i] = _incl[i] = _excl[i] = 0
+    _dropped[0] = 0
+
+
+def report(n=10, key="excl"):
+    """Kết quả cho /debug/profile: top n mục rồi reset bảng"""
+    result = {"enabled": _enabled[0], "slots": len(_calls), "used": len(_names),
+              "dropped": _dropped[0], "top": top(n, key)}
+    reset()
+    return result
+
+
+# Bật sẵn từ config: các class được đánh dấu sau đó được thay ngay trong traced()
+if config.PROFILE_ENABLED:
+    enable()
@@ -0,0 +1,49 @@
+from schema import FIELDS, ALERT_BITS
+
+# Vị trí của từng kênh trong dãy giá trị theo FIELDS
+TEMP1, TEMP2, ROOM_TEMP, HUMIDITY, WATER_LEVEL, TANK_VOLUME = range(len(FIELDS))
+
+
+class Reading:
+    """
+    Một bộ giá trị cảm biến đã công bố (không được sửa sau khi tạo)
+
+    Giá trị là số nguyên fixed-point theo FIELDS (xem fixedpoint.py), cảnh báo
+    là bitmask theo ALERT_BITS. Web server, uploader, lịch sử và nhật ký đều đọc
+    chung một instance thay vì mỗi nơi một bản sao dict. get() cho phép dùng
+    thay dict ở các chỗ đọc theo tên kênh.
+    """
+    __slots__ = FIELDS + ("alerts", "timestamp")
+
+    def __init__(self, values, alerts=0, timestamp=None):
+        """values: dãy giá trị theo thứ tự FIELDS"""
+        (self.temp1, self.temp2, self.room_temp, self.humidity,
+         self.water_level, self.tank_volume) = values
+        self.alerts = alerts
+        self.timestamp = timestamp
+
+    def get(self, name, default=None):
+        value = getattr(self, name, default)
+        return default if value is None else value
+
+    def values(self):
+        """Tuple giá trị theo thứ tự FIELDS"""
+        return (self.temp1, self.temp2, self.room_temp, self.humidity,
+                self.water_level, self.tank_volume)
+
+    def alert(self, name):
+        """Trạng thái cảnh báo của kênh name"""
+        return bool(self.alerts & ALERT_BITS.get(name, 0))
+
+    def alert_states(self):
+        """dict {kênh: bool} cho JSON sự kiện alert"""
+        return {name: bool(self.alerts & bit) for name, bit in ALERT_BITS.items()}
+
+    def diff(self, prev):
+        """dict các trường khác so với Reading prev (giá trị của bản này)"""
+        changed = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if getattr(prev, name) != value:
+                changed[name] = value
+        return changed
@@ -0,0 +1,187 @@
+import gc
+import time
+import config
+import logger
+import metrics
+from fixedpoint import format_channel
+
+# uasyncio trên thiết bị, asyncio trên CPython (để kiểm thử trên Linux)
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+# Đồng hồ ticks: MicroPython có sẵn trong time, CPython thì dùng monotonic
+try:
+    ticks_ms = time.ticks_ms
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+    ticks_add = time.ticks_add
+except AttributeError:
+    def ticks_ms():
+        return time.monotonic_ns() // 1000000
+
+    def ticks_us():
+        return time.monotonic_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def ticks_add(a, b):
+        return a + b
+
+
+LOOP_TIME = metrics.histogram("loop_iteration_seconds", "Thời gian một lượt vòng đọc cảm biến (đọc + công bố)")
+GC_TIME = metrics.histogram("gc_collect_seconds", "Thời gian gc.collect() chủ động")
+if hasattr(gc, "mem_free"):
+    metrics.gauge("heap_free_bytes", "Heap còn trống", gc.mem_free)
+    metrics.gauge("heap_alloc_bytes", "Heap đang cấp phát", gc.mem_alloc)
+
+
+def format_time(t=None):
+    """Định dạng thời gian dạng YYYY-MM-DD HH:MM:SS"""
+    lt = time.localtime(time.time() if t is None else t)
+    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
+        lt[0], lt[1], lt[2], lt[3], lt[4], lt[5]
+    )
+
+
+def sleep_us(us):
+    """Ngủ chặn us micro giây (CPython không có time.sleep_us)"""
+    if hasattr(time, "sleep_us"):
+        time.sleep_us(us)
+    else:
+        time.sleep(us / 1000000)
+
+
+# Thao tác phải chờ phần cứng (Modbus...) được viết một lần dạng generator:
+# mỗi yield là một điểm chờ kèm số us gợi ý (0 = chỉ nhường lượt), giá trị
+# return của generator là kết quả. Bản đồng bộ và bản async chỉ khác cách chờ.
+
+def run_steps(steps):
+    """Chạy generator các bước chờ bằng cách ngủ chặn, trả về giá trị return của nó"""
+    try:
+        while True:
+            us = next(steps)
+            if us:
+                sleep_us(us)
+    except StopIteration as e:
+        return e.value
+    finally:
+        steps.close()
+
+
+async def run_steps_async(steps):
+    """Như run_steps() nhưng nhường event loop ở mỗi điểm chờ"""
+    try:
+        while True:
+            us = next(steps)
+            await asyncio.sleep(us / 1000000)
+    except StopIteration as e:
+        return e.value
+    finally:
+        # Task bị hủy giữa chừng: chạy các finally của generator (nhả khóa bus)
+        steps.close()
+
+
+async def sleep_until(deadline_ms):
+    """Ngủ đến mốc ticks_ms cho trước (trả về ngay nếu đã trễ)"""
+    delay = ticks_diff(deadline_ms, ticks_ms())
+    await asyncio.sleep(delay / 1000 if delay > 0 else 0)
+
+
+def collect_garbage():
+    """gc.collect() có đo thời gian (metric gc_collect_seconds)"""
+    start = ticks_us()
+    gc.collect()
+    GC_TIME.observe(ticks_diff(ticks_us(), start))
+
+
+async def acquisition_task(sensor_manager):
+    """Task chạy bộ lập lịch theo kênh của SensorManager và công bố snapshot"""
+    # Mọi kênh có deadline đầu tiên là 0 nên lần chạy đầu đọc đủ tất cả
+    last_gc = ticks_ms()
+    while True:
+        start = ticks_us()
+        try:
+            updated = await sensor_manager.run_due_async()
+            if updated:
+                snapshot = sensor_manager.publish(updated)
+                if logger.enabled(logger.DEBUG):
+                    data = snapshot.data
+                    logger.debug("Cập nhật %s: %s°C, %s°C, phòng %s°C, %s%%, %sm, %sL",
+                                 ",".join(updated),
+                                 format_channel("temp1", data.temp1), format_channel("temp2", data.temp2),
+                                 format_channel("room_temp", data.room_temp),
+                                 format_channel("humidity", data.humidity),
+                                 format_channel("water_level", data.water_level),
+                                 format_channel("tank_volume", data.tank_volume))
+        except Exception as e:
+            logger.error("Lỗi trong task đọc cảm biến: %s", e)
+        LOOP_TIME.observe(ticks_diff(ticks_us(), start))
+        
+        # Thu gom rác ngay sau lượt đọc, trước khi đến deadline kế tiếp
+        if config.GC_COLLECT_INTERVAL and \
+                ticks_diff(ticks_ms(), last_gc) >= config.GC_COLLECT_INTERVAL * 1000:
+            collect_garbage()
+            last_gc = ticks_ms()
+        await asyncio.sleep(sensor_manager.next_delay_ms() / 1000)
+
+
+async def sampler_task(sensor_manager):
+    """Task đưa giá trị hiện tại vào outbox mỗi SENSOR_READ_INTERVAL"""
+    next_run = ticks_ms()
+    while True:
+        next_run = ticks_add(next_run, int(config.SENSOR_READ_INTERVAL * 1000))
+        await sleep_until(next_run)
+        sensor_manager.outbox.put(sensor_manager.get_upload_data())
+
+
+async def uploader_task(sensor_manager):
+    """
+    Task gửi outbox lên IRIV Controller theo lô
+
+    Lô cũ nhất chỉ bị xóa khỏi outbox khi gửi thành công; lỗi thì thử lại
+    sau thời gian backoff tăng dần có jitter. Lô không mã hóa được (ValueError)
+    bị bỏ ngay vì gửi lại sẽ lỗi y như cũ và chặn mọi bản ghi phía sau.
+    """
+    outbox = sensor_manager.outbox
+    failures = 0
+    while True:
+        if not outbox.depth():
+            await outbox.available.wait()
+        items = outbox.peek()
+        try:
+            ok = await sensor_manager.iriv.send_batch_async(items)
+        except ValueError as e:
+            logger.error("Bỏ lô %d bản ghi không gửi được: %s", len(items), e)
+            outbox.commit(items, dropped=True)
+            continue
+        except Exception as e:
+            logger.error("Lỗi khi gửi dữ liệu đến IRIV Controller: %s", e)
+            ok = False
+        if ok:
+            outbox.commit(items)
+            failures = 0
+        else:
+            failures += 1
+            outbox.stats["failures"] += 1
+            delay = outbox.backoff(failures)
+            logger.debug("Gửi outbox thất bại (%d bản ghi chờ), thử lại sau %.1f giây", outbox.depth(), delay)
+            await asyncio.sleep(delay)
+
+
+async def run(sensor_manager, web_server):
+    """Khởi động web server và các task nền, chạy mãi mãi"""
+    if not await web_server.start():
+        logger.error("Không thể khởi động web server.")
+        return
+
+    try:
+        await asyncio.gather(
+            acquisition_task(sensor_manager),
+            sampler_task(sensor_manager),
+            uploader_task(sensor_manager),
+        )
+    finally:
+        web_server.stop()
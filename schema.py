@@ -0,0 +1,28 @@
+"""
+Lược đồ giá trị cảm biến dùng chung cho mọi định dạng
+
+Reading, jsonwriter (JSON), wire (nhị phân gửi IRIV), fixedpoint, history
+(RAM) và telemetry_log (flash) đều lấy thứ tự kênh, hệ số fixed-point,
+typecode và bit cảnh báo từ đây; thêm hay đổi một kênh chỉ sửa một chỗ.
+"""
+
+# Thứ tự cố định các giá trị (Reading, bản ghi telemetry, mẫu wire, JSON)
+FIELDS = ("temp1", "temp2", "room_temp", "humidity", "water_level", "tank_volume")
+
+# Mỗi kênh: (hệ số fixed-point, typecode của array/struct)
+# Giá trị lưu = round(giá trị thực * hệ số)
+CHANNELS = {
+    "temp1": (100, "i"),        # centi-°C, thermocouple có thể vượt 327 °C
+    "temp2": (100, "i"),
+    "room_temp": (100, "h"),    # centi-°C
+    "humidity": (100, "h"),     # centi-%
+    "water_level": (1000, "H"), # mm, không âm (thanh ghi 16 bit không dấu)
+    "tank_volume": (10, "i"),   # decilít
+}
+
+# Các kênh có cảnh báo, theo thứ tự trong JSON
+ALERTS = ("temp1", "temp2", "water_level")
+
+# Bit của từng giá trị trong channel bitmap, bit của từng cảnh báo trong alert bits
+FIELD_BITS = {name: 1 << i for i, name in enumerate(FIELDS)}
+ALERT_BITS = {name: 1 << i for i, name in enumerate(ALERTS)}
@@ -1,25 +1,79 @@
 import machine
 import time
 import dht
+from array import array
 import config
+import logger
 import max31855
+import metrics
+import profiler
+import hwtrace
 from iriv_controller import IRIVController
+from snapshot import SnapshotCache
+from history import History
+from telemetry_log import TelemetryLog
+from schema import FIELDS, FIELD_BITS, ALERT_BITS
+from reading import Reading, TEMP1, TEMP2, ROOM_TEMP, HUMIDITY, WATER_LEVEL, TANK_VOLUME
+from outbox import Outbox
+from fixedpoint import to_fixed, format_channel
+from runtime import ticks_ms, ticks_us, ticks_diff, format_time, run_steps, run_steps_async
 
+try:
+    import heapq
+except ImportError:
+    import uheapq as heapq
+
+MAX31855_READ_TIME = metrics.histogram("max31855_read_seconds", "Thời gian đọc một khung MAX31855")
+MAX31855_ERRORS = metrics.counter("max31855_errors_total", "Số lần đọc MAX31855 lỗi (cờ lỗi hoặc ngoại lệ)")
+DHT22_MEASURE_TIME = metrics.histogram("dht22_measure_seconds", "Thời gian DHT22.measure()")
+DHT22_ERRORS = metrics.counter("dht22_errors_total", "Số lần đo DHT22 lỗi")
+
+@profiler.traced("read_all", "read_channels", "read_channels_async", "publish")
 class SensorManager:
-    def __init__(self, max1_clk, max1_do, max1_cs, max2_clk, max2_do, max2_cs, dht_pin, iriv_ip=None, uart_id=None, tx_pin=None, rx_pin=None, de_pin=None):
-        # Khởi tạo cảm biến MAX31855 #1
-        self.max1 = max31855.MAX31855(
-            sck=machine.Pin(max1_clk),
-            cs=machine.Pin(max1_cs),
-            so=machine.Pin(max1_do)
-        )
+    # Các kênh đọc độc lập, mỗi kênh có chu kỳ riêng (config.CHANNEL_PERIODS)
+    CHANNELS = ("temp1", "temp2", "dht22", "water_level")
+    
+    # Các giá trị được cập nhật bởi mỗi kênh
+    CHANNEL_VALUES = {
+        "temp1": ("temp1",),
+        "temp2": ("temp2",),
+        "dht22": ("room_temp", "humidity"),
+        "water_level": ("water_level", "tank_volume"),
+    }
+    
+    def __init__(self, max1_clk, max1_do, max1_cs, max2_clk, max2_do, max2_cs, dht_pin, iriv_ip=None, uart_id=None, tx_pin=None, rx_pin=None, de_pin=None, spi_id=None):
+        if spi_id is None:
+            spi_id = config.MAX31855_SPI_ID
         
-        # Khởi tạo cảm biến MAX31855 #2
-        self.max2 = max31855.MAX31855(
-            sck=machine.Pin(max2_clk),
-            cs=machine.Pin(max2_cs),
-            so=machine.Pin(max2_do)
-        )
+        if max1_clk == max2_clk and max1_do == max2_do:
+            # Hai MAX31855 dùng chung SCK/SO, chỉ khác CS: một bus cho cả hai
+            sck = machine.Pin(max1_clk)
+            so = machine.Pin(max1_do)
+            if spi_id is not None:
+                transport = max31855.SPITransport(
+                    max31855.make_spi(spi_id, sck, so, config.MAX31855_BAUDRATE))
+            else:
+                transport = max31855.BitBangTransport(sck, so)
+            self.tc_bus = max31855.MAX31855Bus(
+                transport, [machine.Pin(max1_cs), machine.Pin(max2_cs)])
+            self.max1, self.max2 = self.tc_bus.devices
+        else:
+            # Chân riêng cho từng cảm biến: dùng bit-bang
+            self.tc_bus = None
+            
+            # Khởi tạo cảm biến MAX31855 #1
+            self.max1 = max31855.MAX31855(
+                sck=machine.Pin(max1_clk),
+                cs=machine.Pin(max1_cs),
+                so=machine.Pin(max1_do)
+            )
+            
+            # Khởi tạo cảm biến MAX31855 #2
+            self.max2 = max31855.MAX31855(
+                sck=machine.Pin(max2_clk),
+                cs=machine.Pin(max2_cs),
+                so=machine.Pin(max2_do)
+            )
         
         # Khởi tạo cảm biến DHT22
         self.dht = dht.DHT22(machine.Pin(dht_pin))
@@ -33,199 +87,502 @@ class SensorManager:
             de_pin=de_pin
         )
         
-        # Các biến lưu giá trị cảm biến
-        self.temp1 = 0.0  # Nhiệt độ từ MAX31855 #1
-        self.temp2 = 0.0  # Nhiệt độ từ MAX31855 #2
-        self.humidity = 0.0  # Độ ẩm từ DHT22
-        self.room_temp = 0.0  # Nhiệt độ phòng từ DHT22
-        self.water_level = 0.0  # Mực nước (từ cảm biến QDY30A-B)
-        self.tank_volume = 0.0  # Thể tích nước trong bể
+        # Giá trị hiện tại của các kênh, số nguyên fixed-point theo thứ tự FIELDS:
+        # temp1, temp2 (MAX31855), room_temp, humidity (DHT22) theo 0.01 °C/0.01 %,
+        # water_level (QDY30A-B) theo mm, tank_volume theo dl
+        self.values = array("i", [0] * len(FIELDS))
+        self.timestamp = None  # Thời gian cập nhật gần nhất
+        self.last_dht_read = None  # ticks_ms của lần đo DHT22 gần nhất
+        self.current = None  # Reading công bố gần nhất
+        
+        # Ngưỡng cảnh báo đổi sang fixed-point một lần (mực nước, temp1, temp2)
+        self.thresholds = (
+            to_fixed("water_level", config.WATER_THRESHOLD),
+            to_fixed("temp1", config.TEMP1_THRESHOLD),
+            to_fixed("temp2", config.TEMP2_THRESHOLD)
+        )
+        
+        # Trạng thái cảnh báo (bitmask ALERT_BITS)
+        self.alert_bits = 0
+        
+        # Snapshot dữ liệu mới nhất cho web server / uploader
+        self.cache = SnapshotCache(self.acquire)
         
-        # Cấu hình tank từ config
-        self.tank_height = config.TANK_HEIGHT  # Chiều cao bể nước (m)
-        self.tank_capacity = config.TANK_CAPACITY  # Dung tích tối đa (lít)
+        # Lịch sử trong RAM cho /history
+        self.history = History()
         
-        # Trạng thái cảnh báo
-        self.alerts = {
-            "temp1": False,
-            "temp2": False,
-            "water_level": False
-        }
+        # Nhật ký telemetry trên flash (giữ dữ liệu qua các lần khởi động lại)
+        self.telemetry = None
+        self.telemetry_bits = 0  # Các kênh cập nhật kể từ bản ghi trước
+        self.last_telemetry_time = None
+        if config.TELEMETRY_LOG_ENABLED:
+            try:
+                self.telemetry = TelemetryLog()
+            except Exception as e:
+                logger.error("Không mở được nhật ký telemetry: %s", e)
         
-        print(f"SensorManager khởi tạo: Tank height={self.tank_height}m, capacity={self.tank_capacity}L")
+        # Hàng đợi dữ liệu chờ gửi lên IRIV Controller (task upload nền xử lý)
+        self.outbox = Outbox()
+        
+        # Trace thô của phần cứng để phát lại trên máy host (hwtrace.py)
+        self.trace = None
+        if config.TRACE_ENABLED:
+            try:
+                self.trace = hwtrace.record(self)
+            except Exception as e:
+                logger.error("Không mở được file trace: %s", e)
+        
+        # Bộ lập lịch đọc theo từng kênh
+        self._init_schedule()
+        self.acquisition_trace = {}
+        
+        for tank in self.iriv.level_sensors:
+            logger.info("SensorManager khởi tạo: %s (slave %d), Tank height=%sm, capacity=%sL",
+                        tank.name, tank.address, tank.tank_height, tank.tank_capacity)
     
     def read_max31855(self, sensor, name):
-        """Đọc dữ liệu từ cảm biến MAX31855"""
+        """Đọc dữ liệu từ cảm biến MAX31855 (0.01 °C)"""
         try:
-            temp = sensor.read()
-            if config.DEBUG:
-                print(f"{name} Temp: {temp}°C")
+            start = ticks_us()
+            temp = sensor.read_centi()
+            MAX31855_READ_TIME.observe(ticks_diff(ticks_us(), start))
+            if temp is None:
+                MAX31855_ERRORS.inc()
+            if logger.enabled(logger.DEBUG):
+                logger.debug("%s Temp: %s°C", name, format_channel("temp1", temp))
             return temp
         except Exception as e:
-            print(f"Lỗi đọc {name}:", e)
+            MAX31855_ERRORS.inc()
+            logger.warning("Lỗi đọc %s: %s", name, e)
             return None
     
     def read_dht22(self):
-        """Đọc dữ liệu từ cảm biến DHT22"""
+        """Đọc dữ liệu từ cảm biến DHT22 (0.01 °C, 0.01 %)"""
         try:
+            start = ticks_us()
             self.dht.measure()
-            temp = self.dht.temperature()
-            humidity = self.dht.humidity()
-            if config.DEBUG:
-                print(f"DHT22 - Nhiệt độ: {temp}°C, Độ ẩm: {humidity}%")
+            DHT22_MEASURE_TIME.observe(ticks_diff(ticks_us(), start))
+            buf = getattr(self.dht, "buf", None)
+            if buf is not None:
+                # Dữ liệu thô của DHT22 là số nguyên theo 0.1 đơn vị: lấy thẳng từ buf
+                humidity = ((buf[0] << 8) | buf[1]) * 10
+                temp = (((buf[2] & 0x7F) << 8) | buf[3]) * 10
+                if buf[2] & 0x80:
+                    temp = -temp
+            else:
+                temp = to_fixed("room_temp", self.dht.temperature())
+                humidity = to_fixed("humidity", self.dht.humidity())
+            if logger.enabled(logger.DEBUG):
+                logger.debug("DHT22 - Nhiệt độ: %s°C, Độ ẩm: %s%%",
+                             format_channel("room_temp", temp), format_channel("humidity", humidity))
             return temp, humidity
         except Exception as e:
-            print("Lỗi đọc DHT22:", e)
+            DHT22_ERRORS.inc()
+            logger.warning("Lỗi đọc DHT22: %s", e, every=60)
             return None, None
     
-    def read_water_level(self):
+    def read_water_level(self, pending=None, poll=True):
         """
-        Đọc mực nước từ cảm biến QDY30A-B qua IRIV Controller
+        Đọc cảm biến mức kế tiếp trên bus RS485 (theo vòng), trả về mực nước
+        (mm) và thể tích (dl) của bể chính
+        
+        Tham số:
+        - pending: LevelSensor đã gửi request bằng iriv.begin_next() (đọc tách pha),
+          None = gửi và nhận ngay tại đây
+        - poll: False khi begin_next() đã chạy và chủ ý không gửi (mọi slave
+          đang backoff hoặc bus bận): chỉ lấy giá trị hiện có, không thử lại
+        """
+        return run_steps(self.read_water_level_steps(pending, poll))
+    
+    async def read_water_level_async(self, pending=None, poll=True):
+        """read_water_level() nhường event loop trong lúc chờ phản hồi Modbus"""
+        return await run_steps_async(self.read_water_level_steps(pending, poll))
+    
+    def read_water_level_steps(self, pending=None, poll=True):
+        """read_water_level() dạng generator các bước chờ (runtime.run_steps)"""
+        yield from self._poll_level_steps(pending, poll)
+        return self._tank_values()
+    
+    def _poll_level_steps(self, pending, poll):
+        """
+        Pha nhận của lượt đọc mực nước (generator), trả về LevelSensor vừa
+        đọc (kể cả khi slave lỗi), None nếu lượt này không đọc slave nào
         """
         try:
-            # Đọc dữ liệu từ cảm biến thực tế qua RS485/Modbus
-            level = self.iriv.read_level_sensor()
-            
-            if level is None:
-                # Nếu đọc thất bại, sử dụng giá trị mẫu
-                print("Không đọc được dữ liệu từ cảm biến mức. Sử dụng giá trị mẫu.")
-                level = 1.5  # Mực nước mẫu (m)
-                
-            # Tính thể tích dựa trên mực nước
-            volume_percentage = min(100, max(0, (level / self.tank_height) * 100))
-            volume = (level / self.tank_height) * self.tank_capacity
-            
-            if config.DEBUG:
-                print(f"Mực nước: {level}m ({volume_percentage:.1f}%), Thể tích: {volume:.1f}L")
-            
-            return level, volume
+            # Mỗi lượt đọc một slave; slave đang backoff nhường lượt cho slave khác
+            if pending is not None:
+                yield from self.iriv.finish_poll_steps(pending)
+                return pending
+            if poll:
+                return (yield from self.iriv.poll_next_steps())
         except Exception as e:
-            print(f"Lỗi đọc mực nước: {e}")
-            return 0.0, 0.0
+            logger.error("Lỗi đọc mực nước: %s", e)
+        return None
+    
+    def _store_water_level(self, sensor):
+        """
+        Cập nhật mực nước/thể tích sau lượt đọc sensor (LevelSensor hoặc None)
+        
+        Chỉ lượt đọc bể chính mới đổi giá trị; trả về True nếu đó là giá trị
+        mới (slave trả lời), False nếu bỏ lượt, đọc bể khác hoặc slave lỗi.
+        """
+        if sensor is None or sensor is not self.iriv.level_sensors[0]:
+            return False
+        self.values[WATER_LEVEL], self.values[TANK_VOLUME] = self._tank_values()
+        return sensor.level is not None
+    
+    def _tank_values(self):
+        """Mực nước (mm) và thể tích (dl) của bể chính sau lượt đọc gần nhất"""
+        tank = self.iriv.level_sensors[0]
+        level, volume = tank.level, tank.volume
+        if level is None:
+            # Nếu đọc thất bại, sử dụng giá trị mẫu
+            logger.warning("Không đọc được dữ liệu từ cảm biến mức. Sử dụng giá trị mẫu.", every=60)
+            level = 1500  # Mực nước mẫu (mm)
+            volume = tank.volume_for(level)
+        
+        if logger.enabled(logger.DEBUG):
+            volume_percentage = min(100, max(0, level * 100 // tank.height_mm))
+            logger.debug("Mực nước: %sm (%d%%), Thể tích: %sL", format_channel("water_level", level),
+                         volume_percentage, format_channel("tank_volume", volume))
+        
+        return level, volume
+    
+    def reading(self):
+        """Tạo Reading bất biến từ giá trị hiện tại, trở thành self.current"""
+        self.current = Reading(self.values, self.alert_bits, self.timestamp)
+        return self.current
     
-    def read_all(self):
-        """Đọc dữ liệu từ tất cả cảm biến"""
+    def get_upload_data(self):
+        """Reading gửi đến IRIV Controller: dùng chung bản đã công bố gần nhất"""
+        return self.current if self.current is not None else self.reading()
+    
+    def read_channel(self, name):
+        """
+        Đọc một kênh cảm biến và cập nhật giá trị của riêng kênh đó
+        
+        Trả về False nếu kênh chủ ý không được đọc lần này (DHT22 chưa đủ
+        DHT22_MIN_INTERVAL) hoặc không có giá trị mực nước mới (slave backoff,
+        lỗi, hay lượt thuộc bể khác), True nếu giá trị đã cập nhật.
+        """
+        values = self.values
+        if name == "temp1":
+            temp = self.read_max31855(self.max1, "MAX31855 #1")
+            if temp is None:
+                temp = 2500  # Giá trị mẫu (25.00 °C)
+                logger.warning("Sử dụng giá trị mẫu cho temp1", every=60)
+            values[TEMP1] = temp
+        elif name == "temp2":
+            temp = self.read_max31855(self.max2, "MAX31855 #2")
+            if temp is None:
+                temp = 3000  # Giá trị mẫu (30.00 °C)
+                logger.warning("Sử dụng giá trị mẫu cho temp2", every=60)
+            values[TEMP2] = temp
+        elif name == "dht22":
+            # DHT22 không được đọc nhanh hơn DHT22_MIN_INTERVAL, giữ giá trị cũ
+            now = ticks_ms()
+            if self.last_dht_read is not None and \
+                    ticks_diff(now, self.last_dht_read) < config.DHT22_MIN_INTERVAL * 1000:
+                return False
+            self.last_dht_read = now
+            room_temp, humidity = self.read_dht22()
+            if room_temp is None:
+                room_temp = 2800  # Giá trị mẫu (28.00 °C)
+                logger.warning("Sử dụng giá trị mẫu cho room_temp", every=60)
+            if humidity is None:
+                humidity = 6500  # Giá trị mẫu (65.00 %)
+                logger.warning("Sử dụng giá trị mẫu cho humidity", every=60)
+            values[ROOM_TEMP] = room_temp
+            values[HUMIDITY] = humidity
+        elif name == "water_level":
+            if not self._store_water_level(run_steps(self._poll_level_steps(None, True))):
+                return False
+        self.timestamp = format_time()
+        return True
+    
+    def read_channels(self, names):
+        """
+        Đọc nhiều kênh trong một lượt, trả về danh sách kênh đã cập nhật
+        
+        Giao dịch Modbus được tách pha: gửi request mực nước trước, đọc
+        MAX31855/DHT22 trong lúc slave xử lý, rồi mới nhận và kiểm tra phản hồi.
+        Thời gian từng pha của lượt gần nhất lưu trong self.acquisition_trace (us).
+        """
+        return run_steps(self.read_channels_steps(names))
+    
+    async def read_channels_async(self, names):
+        """
+        read_channels() cho task đọc cảm biến: nhường event loop giữa các kênh
+        và trong suốt thời gian chờ phản hồi Modbus
+        
+        Mỗi lần đọc cục bộ vẫn chạy liền một mạch: MAX31855 < 1 ms, DHT22
+        khoảng 25 ms (xung start 18 ms và khung 40 bit nằm trong driver C).
+        """
+        return await run_steps_async(self.read_channels_steps(names))
+    
+    def read_channels_steps(self, names):
+        """read_channels() dạng generator các bước chờ"""
+        t0 = ticks_us()
+        pending, begun = self._begin_water_level(names)
+        t1 = ticks_us()
+        
+        updated = []
+        for name in names:
+            if name != "water_level":
+                yield 0  # Nhường lượt giữa các kênh (bản async)
+                self._read_local(name, updated)
+        t2 = ticks_us()
+        
+        # begin_next() chủ ý bỏ lượt hay slave lỗi: kênh không được tính là vừa cập nhật
+        if "water_level" in names and \
+                self._store_water_level((yield from self._poll_level_steps(pending, not begun))):
+            self.timestamp = format_time()
+            updated.append("water_level")
+        self._trace_phases(t0, t1, t2, ticks_us())
+        return updated
+    
+    def _begin_water_level(self, names):
+        """
+        Pha gửi của lượt đọc: gửi request mực nước nếu có trong names
+        
+        Trả về (LevelSensor đang chờ phản hồi hoặc None, begin_next() đã chạy
+        xong). None sau khi begin_next() chạy xong là chủ ý bỏ lượt (slave
+        backoff, bus bận); chỉ khi begin_next() lỗi mới gửi lại ở pha nhận.
+        """
+        if "water_level" not in names:
+            return None, True
         try:
-            # Đọc nhiệt độ từ MAX31855
-            self.temp1 = self.read_max31855(self.max1, "MAX31855 #1")
-            self.temp2 = self.read_max31855(self.max2, "MAX31855 #2")
-            
-            # Đọc nhiệt độ và độ ẩm từ DHT22
-            self.room_temp, self.humidity = self.read_dht22()
-            
-            # Đọc mực nước và tính thể tích
-            self.water_level, self.tank_volume = self.read_water_level()
-            
-            # Lấy thời gian hiện tại
-            current_time = time.localtime(time.time())
-            current_time_str = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
-                current_time[0], current_time[1], current_time[2],
-                current_time[3], current_time[4], current_time[5]
-            )
-            
-            # Trong trường hợp đọc thất bại, đảm bảo có giá trị mặc định
-            if self.temp1 is None:
-                self.temp1 = 25.0  # Giá trị mẫu
-                print("Sử dụng giá trị mẫu cho temp1")
-                
-            if self.temp2 is None:
-                self.temp2 = 30.0  # Giá trị mẫu
-                print("Sử dụng giá trị mẫu cho temp2")
-                
-            if self.room_temp is None:
-                self.room_temp = 28.0  # Giá trị mẫu
-                print("Sử dụng giá trị mẫu cho room_temp")
-                
-            if self.humidity is None:
-                self.humidity = 65.0  # Giá trị mẫu
-                print("Sử dụng giá trị mẫu cho humidity")
+            return self.iriv.begin_next(), True
+        except Exception as e:
+            logger.error("Lỗi gửi request mực nước: %s", e)
+            return None, False
+    
+    def _read_local(self, name, updated):
+        """Đọc một kênh không qua Modbus, thêm vào updated nếu giá trị đã cập nhật"""
+        try:
+            if self.read_channel(name):
+                updated.append(name)
+        except Exception as e:
+            logger.error("Lỗi đọc kênh %s: %s", name, e)
+    
+    def _trace_phases(self, t0, t1, t2, t3):
+        trace = self.acquisition_trace
+        trace["modbus_send_us"] = ticks_diff(t1, t0)
+        trace["local_us"] = ticks_diff(t2, t1)
+        trace["modbus_collect_us"] = ticks_diff(t3, t2)
+        trace["total_us"] = ticks_diff(t3, t0)
+    
+    def read_all(self, upload=True):
+        """
+        Đọc dữ liệu từ tất cả cảm biến
+        
+        Tham số:
+        - upload: đưa dữ liệu vào outbox để gửi đến IRIV Controller
+        """
+        updated = []
+        try:
+            updated = self.read_channels(self.CHANNELS)
         
         except Exception as e:
-            print(f"Lỗi khi đọc cảm biến: {e}")
-            # Đảm bảo có giá trị mẫu trong trường hợp xảy ra lỗi
-            if not hasattr(self, 'temp1') or self.temp1 is None:
-                self.temp1 = 25.0
-            if not hasattr(self, 'temp2') or self.temp2 is None:
-                self.temp2 = 30.0
-            if not hasattr(self, 'room_temp') or self.room_temp is None:
-                self.room_temp = 28.0
-            if not hasattr(self, 'humidity') or self.humidity is None:
-                self.humidity = 65.0
-            if not hasattr(self, 'water_level') or self.water_level is None:
-                self.water_level = 1.5
-            if not hasattr(self, 'tank_volume') or self.tank_volume is None:
-                self.tank_volume = 500.0
-            
-        # Gửi dữ liệu đến IRIV Controller qua HTTP (nếu kết nối được)
+            # Kênh lỗi giữ giá trị trước đó (mỗi kênh đã tự dùng giá trị mẫu khi đọc lỗi)
+            logger.error("Lỗi khi đọc cảm biến: %s", e)
+        
+        reading = self.reading()
+        # Lịch sử và nhật ký flash ghi như lượt đọc của task nền (publish)
+        if updated:
+            self.record(reading, self._value_keys(updated))
+        # Đưa vào hàng đợi gửi đến IRIV Controller (task upload nền gửi theo lô)
+        if upload:
+            self.outbox.put(reading)
+        return reading
+    
+    async def acquire(self):
+        """Đọc tất cả cảm biến và kiểm tra ngưỡng, trả về Reading để công bố snapshot"""
+        updated = []
         try:
-            data_to_send = {
-                "temp1": self.temp1,
-                "temp2": self.temp2,
-                "room_temp": self.room_temp,
-                "humidity": self.humidity,
-                "water_level": self.water_level,
-                "tank_volume": self.tank_volume
-            }
-            self.iriv.send_data(data_to_send)
+            updated = await self.read_channels_async(self.CHANNELS)
         except Exception as e:
-            print(f"Lỗi khi gửi dữ liệu đến IRIV Controller: {e}")
+            logger.error("Lỗi khi đọc cảm biến: %s", e)
+        self.check_thresholds(*self.thresholds)
+        reading = self.reading()
+        if updated:
+            self.record(reading, self._value_keys(updated))
+        return reading
+    
+    def publish(self, updated=None):
+        """
+        Kiểm tra ngưỡng và công bố snapshot từ giá trị hiện tại của các kênh
+        
+        Tham số:
+        - updated: danh sách kênh vừa đọc (ghi vào lịch sử), None = tất cả
+        """
+        self.check_thresholds(*self.thresholds)
+        reading = self.reading()
+        
+        self.record(reading, None if updated is None else self._value_keys(updated))
+        return self.cache.publish(reading)
+    
+    def _value_keys(self, updated):
+        """Danh sách kênh vừa đọc -> các khóa giá trị tương ứng (dht22 -> room_temp, humidity)"""
+        keys = []
+        for name in updated:
+            keys.extend(self.CHANNEL_VALUES[name])
+        return keys
+    
+    def record(self, data, keys=None):
+        """
+        Ghi các giá trị vừa cập nhật (keys, mặc định tất cả) vào lịch sử RAM
+        và nhật ký flash (tối đa một bản ghi mỗi TELEMETRY_LOG_INTERVAL giây)
+        """
+        now = int(time.time())
+        self.history.record(now, data, keys)
+        
+        if self.telemetry is None:
+            return
+        for name in keys or FIELD_BITS:
+            self.telemetry_bits |= FIELD_BITS.get(name, 0)
+        if self.last_telemetry_time is not None and \
+                now - self.last_telemetry_time < config.TELEMETRY_LOG_INTERVAL:
+            return
+        try:
+            self.telemetry.append(now, data, self.telemetry_bits, data.alerts)
+            self.telemetry_bits = 0
+            self.last_telemetry_time = now
+        except Exception as e:
+            logger.error("Lỗi ghi nhật ký telemetry: %s", e, every=60)
+    
+    # ---- Bộ lập lịch đọc theo từng kênh ----
+    
+    def _clock(self):
+        """Đồng hồ ms tăng đơn điệu, không bị ảnh hưởng khi ticks_ms quay vòng"""
+        now = ticks_ms()
+        self._clock_ms += ticks_diff(now, self._clock_ticks)
+        self._clock_ticks = now
+        return self._clock_ms
+    
+    def _init_schedule(self):
+        """Tạo hàng đợi ưu tiên (deadline, kênh) với chu kỳ riêng cho từng kênh"""
+        self._clock_ticks = ticks_ms()
+        self._clock_ms = 0
+        self._schedule = []
+        self.periods_ms = {}
+        self.schedule_stats = {}
+        for name in self.CHANNELS:
+            period = config.CHANNEL_PERIODS.get(name, config.SENSOR_READ_INTERVAL)
+            if name == "dht22":
+                period = max(period, config.DHT22_MIN_INTERVAL)
+            elif name == "water_level":
+                # Chu kỳ cho từng bể: chia bus cho các slave đọc theo vòng
+                period = period / len(self.iriv.level_sensors)
+            self.periods_ms[name] = int(period * 1000)
+            self.schedule_stats[name] = {"runs": 0, "missed": 0, "max_late_ms": 0}
+            heapq.heappush(self._schedule, (0, name))
+    
+    def run_due(self):
+        """
+        Đọc các kênh đã đến hạn, trả về danh sách tên kênh vừa cập nhật
+        
+        Deadline kế tiếp = deadline cũ + chu kỳ (không trôi). Nếu một kênh trễ
+        quá một chu kỳ, các mốc bị lỡ được đếm vào schedule_stats và bỏ qua.
+        """
+        return run_steps(self.run_due_steps())
+    
+    async def run_due_async(self):
+        """run_due() không chặn event loop trong lúc chờ phản hồi Modbus"""
+        return await run_steps_async(self.run_due_steps())
+    
+    def run_due_steps(self):
+        """run_due() dạng generator các bước chờ"""
+        start = self._clock()
+        due = self._pop_due(start)
+        if not due:
+            return []
+        
+        # Các kênh đến hạn cùng lúc được đọc chung một lượt (tách pha Modbus)
+        updated = yield from self.read_channels_steps([name for deadline, name in due])
+        self._reschedule(due, start)
+        return updated
+    
+    def _pop_due(self, start):
+        """Lấy các mục (deadline, kênh) đã đến hạn tại start khỏi hàng đợi"""
+        due = []
+        while self._schedule and self._schedule[0][0] <= start:
+            due.append(heapq.heappop(self._schedule))
+        return due
+    
+    def _reschedule(self, due, start):
+        """Đưa các kênh vừa đọc trở lại hàng đợi với deadline kế tiếp"""
+        for deadline, name in due:
+            period = self.periods_ms[name]
+            stats = self.schedule_stats[name]
+            stats["runs"] += 1
+            late = start - deadline
+            if late > stats["max_late_ms"]:
+                stats["max_late_ms"] = late
             
-        # Trả về tất cả dữ liệu dưới dạng dict
-        return {
-            "temp1": self.temp1,
-            "temp2": self.temp2,
-            "room_temp": self.room_temp,
-            "humidity": self.humidity,
-            "water_level": self.water_level,
-            "tank_volume": self.tank_volume,
-            "alerts": self.alerts,
-            "timestamp": current_time_str  # Thêm thời gian cập nhật
-        }
+            deadline += period
+            now = self._clock()
+            if deadline <= now:
+                missed = (now - deadline) // period + 1
+                stats["missed"] += missed
+                deadline += missed * period
+                logger.warning("Kênh %s lỡ %d deadline (trễ %d ms)", name, missed, late)
+            heapq.heappush(self._schedule, (deadline, name))
+    
+    def next_delay_ms(self):
+        """Số ms còn lại đến deadline gần nhất"""
+        if not self._schedule:
+            return 1000
+        return max(0, self._schedule[0][0] - self._clock())
     
     def check_thresholds(self, water_threshold, temp1_threshold, temp2_threshold):
-        """Kiểm tra các ngưỡng cảnh báo"""
+        """Kiểm tra các ngưỡng cảnh báo (ngưỡng fixed-point, xem self.thresholds)"""
+        values = self.values
         # Kiểm tra ngưỡng nhiệt độ
-        if self.temp1 is not None and self.temp1 > temp1_threshold:
-            if not self.alerts["temp1"]:
-                print(f"CẢNH BÁO: Nhiệt độ cảm biến 1 ({self.temp1}°C) vượt ngưỡng ({temp1_threshold}°C)")
-                self.alerts["temp1"] = True
-                self.send_alert("Cảnh báo nhiệt độ", f"Nhiệt độ cảm biến 1 đạt {self.temp1}°C, vượt ngưỡng {temp1_threshold}°C")
+        if values[TEMP1] > temp1_threshold:
+            if not self.alert_bits & ALERT_BITS["temp1"]:
+                temp, limit = format_channel("temp1", values[TEMP1]), format_channel("temp1", temp1_threshold)
+                logger.warning("CẢNH BÁO: Nhiệt độ cảm biến 1 (%s°C) vượt ngưỡng (%s°C)", temp, limit)
+                self.alert_bits |= ALERT_BITS["temp1"]
+                self.send_alert("Cảnh báo nhiệt độ", f"Nhiệt độ cảm biến 1 đạt {temp}°C, vượt ngưỡng {limit}°C")
         else:
-            self.alerts["temp1"] = False
+            self.alert_bits &= ~ALERT_BITS["temp1"]
         
-        if self.temp2 is not None and self.temp2 > temp2_threshold:
-            if not self.alerts["temp2"]:
-                print(f"CẢNH BÁO: Nhiệt độ cảm biến 2 ({self.temp2}°C) vượt ngưỡng ({temp2_threshold}°C)")
-                self.alerts["temp2"] = True
-                self.send_alert("Cảnh báo nhiệt độ", f"Nhiệt độ cảm biến 2 đạt {self.temp2}°C, vượt ngưỡng {temp2_threshold}°C")
+        if values[TEMP2] > temp2_threshold:
+            if not self.alert_bits & ALERT_BITS["temp2"]:
+                temp, limit = format_channel("temp2", values[TEMP2]), format_channel("temp2", temp2_threshold)
+                logger.warning("CẢNH BÁO: Nhiệt độ cảm biến 2 (%s°C) vượt ngưỡng (%s°C)", temp, limit)
+                self.alert_bits |= ALERT_BITS["temp2"]
+                self.send_alert("Cảnh báo nhiệt độ", f"Nhiệt độ cảm biến 2 đạt {temp}°C, vượt ngưỡng {limit}°C")
         else:
-            self.alerts["temp2"] = False
+            self.alert_bits &= ~ALERT_BITS["temp2"]
         
         # Kiểm tra ngưỡng mực nước
-        if self.water_level > water_threshold:
-            if not self.alerts["water_level"]:
-                print(f"CẢNH BÁO: Mực nước ({self.water_level}m) vượt ngưỡng ({water_threshold}m)")
-                self.alerts["water_level"] = True
-                self.send_alert("Cảnh báo mực nước", f"Mực nước đạt {self.water_level}m, vượt ngưỡng {water_threshold}m")
+        if values[WATER_LEVEL] > water_threshold:
+            if not self.alert_bits & ALERT_BITS["water_level"]:
+                level, limit = format_channel("water_level", values[WATER_LEVEL]), format_channel("water_level", water_threshold)
+                logger.warning("CẢNH BÁO: Mực nước (%sm) vượt ngưỡng (%sm)", level, limit)
+                self.alert_bits |= ALERT_BITS["water_level"]
+                self.send_alert("Cảnh báo mực nước", f"Mực nước đạt {level}m, vượt ngưỡng {limit}m")
         else:
-            self.alerts["water_level"] = False
+            self.alert_bits &= ~ALERT_BITS["water_level"]
     
     def send_alert(self, subject, message):
         """Gửi cảnh báo qua email hoặc SMS"""
         if hasattr(config, 'EMAIL_SENDER') and config.EMAIL_SENDER:
             try:
                 # Gửi email cảnh báo (cần triển khai)
-                print(f"Gửi email cảnh báo: {subject}")
+                logger.info("Gửi email cảnh báo: %s", subject)
                 # import cảm biến mail và gửi mail ở đây
             except Exception as e:
-                print("Lỗi gửi email:", e)
+                logger.error("Lỗi gửi email: %s", e)
         
         if hasattr(config, 'PHONE_NUMBER') and config.PHONE_NUMBER:
             try:
                 # Gửi SMS cảnh báo (cần triển khai)
-                print(f"Gửi SMS cảnh báo đến {config.PHONE_NUMBER}")
+                logger.info("Gửi SMS cảnh báo đến %s", config.PHONE_NUMBER)
                 # import module SMS và gửi SMS ở đây
             except Exception as e:
-                print("Lỗi gửi SMS:", e)
+                logger.error("Lỗi gửi SMS: %s", e)
 
 
@@ -0,0 +1,62 @@
+"""
+Bộ mô phỏng phần cứng để chạy firmware trên CPython (máy host)
+
+    import sim
+    sim.install(speed=60)        # trước khi import bất kỳ module nào của firmware
+    import main
+    main.main()
+
+install() đưa sim/modules (machine, dht, network, ntptime giả lập) lên đầu sys.path,
+thay module time bằng đồng hồ ảo (sim.clock, có thêm ticks_* và sleep_*
+như MicroPython) và đặt event loop policy để asyncio.run() chạy theo thời
+gian ảo (sim.loop). Phần cứng giả lập nằm trong sim.world (sim.devices.World),
+nối dây theo main.py và config.py; các tham số lỗi sửa trực tiếp trên đó.
+
+Xem tools/simulate.py để chạy main.main() từ dòng lệnh.
+"""
+import asyncio
+import os
+import random
+import sys
+
+from sim.clock import SimClock, RealClock, patch_time
+
+MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+
+# Module firmware đọc time/machine lúc import: phải import sau install()
+FIRMWARE_MODULES = ("runtime", "machine", "dht", "network", "sensors", "main")
+
+clock = None
+world = None
+
+
+def install(speed=0, seed=0, epoch=1700000000, stop_after=None, realtime=False):
+    """
+    Cài bộ mô phỏng, trả về World
+
+    Tham số:
+    - speed: hệ số tăng tốc thời gian (0 = nhanh nhất có thể, 1 = thời gian thực)
+    - seed: seed của mọi nguồn ngẫu nhiên (nhiễu cảm biến, lỗi, jitter backoff)
+    - epoch: time.time() lúc bắt đầu mô phỏng
+    - stop_after: dừng asyncio.run() (KeyboardInterrupt) sau số giây ảo này
+    - realtime: dùng thời gian thật (RealClock) và event loop mặc định của
+      asyncio thay cho đồng hồ ảo; bỏ qua speed và stop_after
+    """
+    global clock, world
+    loaded = [name for name in FIRMWARE_MODULES if name in sys.modules]
+    if loaded:
+        raise RuntimeError("sim.install() phải chạy trước khi import: " + ", ".join(loaded))
+    clock = RealClock(epoch) if realtime else SimClock(epoch, speed)
+    patch_time(clock)
+    random.seed(seed)
+    if MODULES_DIR not in sys.path:
+        sys.path.insert(0, MODULES_DIR)
+
+    # devices/loop import modbus_loopback -> runtime: phải sau patch_time()
+    from sim import devices
+    from sim.loop import SimEventLoopPolicy, patch_open_connection
+    world = devices.world = devices.World(clock, seed)
+    if not realtime:
+        asyncio.set_event_loop_policy(SimEventLoopPolicy(clock, stop_after))
+    patch_open_connection(world)
+    return world
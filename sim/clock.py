@@ -0,0 +1,115 @@
+"""
+Đồng hồ ảo của bộ mô phỏng
+
+Thời gian là số nguyên micro giây, chỉ tiến khi code ngủ (time.sleep*,
+asyncio) hoặc đọc ticks: mỗi lần đọc ticks_us/ticks_ms tiến thêm TICK_STEP_US
+để các vòng chờ bận (ví dụ chờ khoảng lặng Modbus) vẫn kết thúc. Cùng một
+chuỗi lời gọi luôn cho cùng một thời gian, không phụ thuộc tốc độ máy host.
+
+speed là hệ số tăng tốc so với thời gian thực khi phải chờ thật (sleep, chờ
+socket trong event loop): 1 = thời gian thực, 60 = một phút ảo mỗi giây,
+0 = không chờ thật, nhảy thẳng đến mốc kế tiếp.
+"""
+import time as _time
+
+TICK_STEP_US = 1
+# ticks_ms/ticks_us quay vòng như MicroPython (2**30)
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+
+# Hàm gốc của CPython, giữ lại trước khi patch_time() thay module time
+_real_sleep = _time.sleep
+_real_monotonic = _time.monotonic
+_gmtime = _time.gmtime
+
+
+class SimClock:
+    def __init__(self, epoch=1700000000, speed=0):
+        """epoch: time.time() lúc bắt đầu; speed: hệ số tăng tốc (0 = nhanh nhất)"""
+        self.epoch = epoch
+        self.speed = speed
+        self.us = 0
+
+    def now_us(self):
+        """Thời gian ảo (us) kể từ lúc bắt đầu, không làm đồng hồ tiến"""
+        return self.us
+
+    def advance(self, us):
+        if us > 0:
+            self.us += int(us)
+
+    def sleep_us(self, us):
+        """Ngủ us micro giây ảo (chờ thật us / speed nếu speed > 0)"""
+        if us <= 0:
+            return
+        if self.speed:
+            _real_sleep(us / 1000000 / self.speed)
+        self.advance(us)
+
+    def time(self):
+        return self.epoch + self.us // 1000000
+
+    def ticks_us(self):
+        self.us += TICK_STEP_US
+        return self.us & TICKS_MAX
+
+    def ticks_ms(self):
+        self.us += TICK_STEP_US
+        return (self.us // 1000) & TICKS_MAX
+
+
+class RealClock(SimClock):
+    """
+    Đồng hồ theo thời gian thật (sim.install(realtime=True))
+
+    Cho benchmark đo độ trễ thật của event loop: ngủ là ngủ thật, ticks đọc
+    monotonic nên cả thời gian CPU của code firmware cũng được tính.
+    """
+
+    def __init__(self, epoch=1700000000):
+        super().__init__(epoch, 1)
+        self.start = _real_monotonic()
+
+    def now_us(self):
+        return int((_real_monotonic() - self.start) * 1000000)
+
+    def advance(self, us):
+        pass
+
+    def sleep_us(self, us):
+        if us > 0:
+            _real_sleep(us / 1000000)
+
+    def time(self):
+        return self.epoch + self.now_us() // 1000000
+
+    def ticks_us(self):
+        return self.now_us() & TICKS_MAX
+
+    def ticks_ms(self):
+        return (self.now_us() // 1000) & TICKS_MAX
+
+
+def ticks_diff(a, b):
+    """Hiệu hai giá trị ticks có tính quay vòng (như time.ticks_diff)"""
+    return ((a - b + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+
+def ticks_add(a, b):
+    return (a + b) & TICKS_MAX
+
+
+def patch_time(clock):
+    """Thay các hàm đọc/ngủ của module time bằng đồng hồ ảo, thêm API ticks của MicroPython"""
+    _time.time = clock.time
+    _time.sleep = lambda seconds: clock.sleep_us(seconds * 1000000)
+    _time.sleep_ms = lambda ms: clock.sleep_us(ms * 1000)
+    _time.sleep_us = clock.sleep_us
+    _time.ticks_us = clock.ticks_us
+    _time.ticks_ms = clock.ticks_ms
+    _time.ticks_diff = ticks_diff
+    _time.ticks_add = ticks_add
+    # Thiết bị không có múi giờ: localtime là giờ của RTC (UTC ở đây)
+    _time.localtime = lambda t=None: _gmtime(clock.time() if t is None else t)
+    _time.gmtime = _time.localtime
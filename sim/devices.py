@@ -0,0 +1,275 @@
+"""
+Mô hình thiết bị của bộ mô phỏng: MAX31855, DHT22, cảm biến mức Modbus, WiFi
+
+Mọi giá trị đo là hàm tất định của thời gian ảo cộng nhiễu từ
+random.Random(seed) riêng của từng thiết bị, nên cùng seed và cùng chuỗi lời
+gọi thì cho cùng kết quả. Các tham số lỗi (tỷ lệ lỗi, độ trễ) là thuộc tính
+thường, có thể sửa lúc chạy: sim.world.thermocouples[0].fault_rate = 0.1
+"""
+import math
+import random
+import config
+from modbus_loopback import RegisterSlave
+
+
+class PinBus:
+    """
+    Mức logic của các chân GPIO theo số chân
+
+    Thiết bị theo dõi (watch) chân vào để nhận cạnh, và lái (drive) chân ra:
+    khi đọc, thiết bị đầu tiên trả về khác None quyết định mức của chân.
+    """
+
+    def __init__(self):
+        self.levels = {}
+        self.watchers = {}
+        self.drivers = {}
+
+    def watch(self, pin_id, device):
+        self.watchers.setdefault(pin_id, []).append(device)
+
+    def drive(self, pin_id, device):
+        self.drivers.setdefault(pin_id, []).append(device)
+
+    def write(self, pin_id, value):
+        value = 1 if value else 0
+        old = self.levels.get(pin_id, 0)
+        self.levels[pin_id] = value
+        if old != value:
+            for device in self.watchers.get(pin_id, ()):
+                device.edge(pin_id, value)
+
+    def read(self, pin_id):
+        for device in self.drivers.get(pin_id, ()):
+            value = device.output(pin_id)
+            if value is not None:
+                return value
+        return self.levels.get(pin_id, 0)
+
+
+def wave(clock, base, swing, period):
+    """Giá trị dao động hình sin quanh base theo thời gian ảo"""
+    return base + swing * math.sin(2 * math.pi * clock.now_us() / 1000000 / period)
+
+
+class Thermocouple:
+    """
+    MAX31855 trên ba chân sck/so/cs
+
+    Cạnh xuống của CS chốt một khung 32-bit và đưa D31 ra SO; mỗi cạnh xuống
+    của SCK dịch sang bit kế tiếp. Khi CS ở mức cao SO thả nổi (không lái).
+    Với xác suất fault_rate khung mang bit lỗi D16 cùng bit fault (OC/SCG/SCV).
+    """
+    FAULTS = {"oc": 0x1, "scg": 0x2, "scv": 0x4}
+
+    def __init__(self, clock, pins, sck, so, cs, base=25.0, swing=2.0, period=600,
+                 noise=0.1, fault_rate=0.0, fault="oc", seed=0):
+        self.clock = clock
+        self.pins = pins
+        self.sck, self.so, self.cs = sck, so, cs
+        self.base, self.swing, self.period, self.noise = base, swing, period, noise
+        self.fault_rate = fault_rate
+        self.fault = fault
+        self.rng = random.Random(seed)
+        self.frame = 0
+        self.bit = -1
+        self.stats = {"frames": 0, "faults": 0}
+        pins.write(cs, 1)
+        pins.watch(cs, self)
+        pins.watch(sck, self)
+        pins.drive(so, self)
+
+    def temperature(self):
+        return wave(self.clock, self.base, self.swing, self.period) + self.rng.uniform(-self.noise, self.noise)
+
+    def encode(self, temp, internal=25.0):
+        """Khung 32-bit theo datasheet: D31..D18 nhiệt độ (0.25 °C), D15..D4 nhiệt độ mối lạnh (0.0625 °C)"""
+        quarters = int(round(temp * 4)) & 0x3FFF
+        cold = int(round(internal * 16)) & 0xFFF
+        return (quarters << 18) | (cold << 4)
+
+    def latch(self):
+        frame = self.encode(self.temperature())
+        self.stats["frames"] += 1
+        if self.fault_rate and self.rng.random() < self.fault_rate:
+            frame |= 0x10000 | self.FAULTS[self.fault]
+            self.stats["faults"] += 1
+        return frame
+
+    def edge(self, pin_id, value):
+        if pin_id == self.cs:
+            if value == 0:
+                self.frame = self.latch()
+                self.bit = 31
+            else:
+                self.bit = -1
+        elif pin_id == self.sck and value == 0 and self.bit >= 0:
+            self.bit -= 1
+
+    def output(self, pin_id):
+        if self.bit < 0 or self.pins.levels.get(self.cs, 1):
+            return None
+        return (self.frame >> self.bit) & 1
+
+
+class DHT22Sensor:
+    """
+    DHT22 trên một chân: mỗi lần đo trả về 5 byte (độ ẩm, nhiệt độ theo 0.1, checksum)
+
+    Đo lại trong vòng min_interval giây thì cảm biến không trả lời, giống
+    DHT22 thật đang bận; fail_rate là xác suất một lần đo không có phản hồi.
+    """
+
+    def __init__(self, clock, base=28.0, swing=1.5, humidity=65.0, humidity_swing=5.0,
+                 period=3600, min_interval=2, measure_ms=5, fail_rate=0.0, seed=0):
+        self.clock = clock
+        self.base, self.swing = base, swing
+        self.humidity, self.humidity_swing = humidity, humidity_swing
+        self.period = period
+        self.min_interval = min_interval
+        self.measure_ms = measure_ms
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.last_us = None
+        self.stats = {"measures": 0, "too_fast": 0, "failures": 0}
+
+    def measure(self, buf):
+        """Điền 5 byte vào buf, trả về False nếu cảm biến không trả lời"""
+        clock = self.clock
+        now = clock.now_us()
+        too_fast = self.last_us is not None and now - self.last_us < self.min_interval * 1000000
+        self.last_us = now
+        clock.sleep_us(self.measure_ms * 1000)
+        if too_fast:
+            self.stats["too_fast"] += 1
+            return False
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            self.stats["failures"] += 1
+            return False
+        self.stats["measures"] += 1
+        temp = int(round(wave(clock, self.base, self.swing, self.period) * 10))
+        humidity = int(round(wave(clock, self.humidity, self.humidity_swing, self.period * 1.7) * 10))
+        humidity = max(0, min(1000, humidity + self.rng.randint(-2, 2)))
+        raw = abs(temp) | (0x8000 if temp < 0 else 0)
+        buf[0], buf[1] = humidity >> 8, humidity & 0xFF
+        buf[2], buf[3] = raw >> 8, raw & 0xFF
+        buf[4] = (buf[0] + buf[1] + buf[2] + buf[3]) & 0xFF
+        return True
+
+
+class LevelSlave(RegisterSlave):
+    """
+    Cảm biến mức QDY30A-B giả lập (Modbus RTU, hàm 0x03)
+
+    Mực nước (mm) dao động theo chu kỳ bơm/xả; các thanh ghi khác lấy từ
+    extra. Mỗi request đã địa chỉ hóa có xác suất timeout_rate không trả lời
+    và crc_rate trả lời sai CRC; độ trễ xử lý là latency_ms cộng jitter_ms ngẫu nhiên.
+    """
+
+    def __init__(self, clock, address, registers, height_mm, latency_ms=20, jitter_ms=5,
+                 period=7200, crc_rate=0.0, timeout_rate=0.0, extra=None, seed=0):
+        super().__init__(address, {}, latency_ms)
+        self.clock = clock
+        self.names = registers
+        self.height_mm = height_mm
+        self.base_latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.period = period
+        self.crc_rate = crc_rate
+        self.timeout_rate = timeout_rate
+        self.extra = extra if extra is not None else {"TEMPERATURE": 215, "BATTERY": 100, "STATUS": 0}
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "timeouts": 0, "crc_errors": 0}
+
+    def level_mm(self):
+        return int(wave(self.clock, self.height_mm * 0.5, self.height_mm * 0.3, self.period))
+
+    def update(self):
+        registers = self.registers
+        if not registers:
+            # Các địa chỉ xen giữa thanh ghi có tên đọc ra 0 (đọc gộp khối không bị exception)
+            for addr in range(max(self.names.values()) + 1):
+                registers[addr] = 0
+        for name, addr in self.names.items():
+            registers[addr] = self.level_mm() if name == "WATER_LEVEL" else self.extra.get(name, 0)
+
+    def respond(self, frame):
+        if len(frame) < 8 or frame[0] != self.address:
+            return None
+        self.stats["requests"] += 1
+        rng = self.rng
+        self.latency_ms = self.base_latency_ms + (rng.randint(0, self.jitter_ms) if self.jitter_ms else 0)
+        if self.timeout_rate and rng.random() < self.timeout_rate:
+            self.stats["timeouts"] += 1
+            return None
+        self.update()
+        reply = super().respond(frame)
+        if reply is not None and self.crc_rate and rng.random() < self.crc_rate:
+            reply[-1] ^= 0xFF
+            self.stats["crc_errors"] += 1
+        return reply
+
+
+class WLANState:
+    """Trạng thái WiFi dùng chung cho mọi network.WLAN cùng interface"""
+
+    def __init__(self, clock, ip="127.0.0.1", connect_delay=2):
+        self.clock = clock
+        self.ip = ip
+        self.connect_delay = connect_delay
+        self.active = False
+        self.ssid = None
+        self.connected_at = None  # Thời gian ảo (us) kết nối xong
+        self.options = {}
+
+    def isconnected(self):
+        return self.connected_at is not None and self.clock.now_us() >= self.connected_at
+
+
+class World:
+    """
+    Toàn bộ phần cứng giả lập, nối dây theo main.py và config.py
+
+    MAX31855 #1 trên SCK 2/SO 1/CS 0, #2 trên SCK 6/SO 5/CS 4, DHT22 trên chân
+    15, các slave trong config.MODBUS_SLAVES trên config.UART_ID.
+    routes: {(host, port): (host, port)} cho mạng LAN giả lập (xem sim.loop).
+    """
+
+    def __init__(self, clock, seed=0):
+        self.clock = clock
+        self.pins = PinBus()
+        self.thermocouples = [
+            Thermocouple(clock, self.pins, 2, 1, 0, base=25.0, seed=seed + 1),
+            Thermocouple(clock, self.pins, 6, 5, 4, base=60.0, swing=25.0, period=1800, seed=seed + 2),
+        ]
+        self.dht = {15: DHT22Sensor(clock, seed=seed + 3)}
+        self.slaves = {config.UART_ID: [
+            LevelSlave(clock, entry["address"], entry.get("registers", config.MODBUS_REGISTERS),
+                       int(entry.get("tank_height", config.TANK_HEIGHT) * 1000), seed=seed + 10 + i)
+            for i, entry in enumerate(config.MODBUS_SLAVES)
+        ]}
+        self.wlan = {}
+        self.routes = {}
+
+    def wlan_state(self, interface):
+        state = self.wlan.get(interface)
+        if state is None:
+            state = self.wlan[interface] = WLANState(self.clock)
+        return state
+
+    def dht_sensor(self, pin_id):
+        sensor = self.dht.get(pin_id)
+        if sensor is None:
+            sensor = self.dht[pin_id] = DHT22Sensor(self.clock)
+        return sensor
+
+    def stats(self):
+        """Số đếm của các thiết bị (để in tóm tắt sau khi chạy)"""
+        return {
+            "thermocouples": [tc.stats for tc in self.thermocouples],
+            "dht22": {pin: sensor.stats for pin, sensor in self.dht.items()},
+            "modbus": {slave.address: slave.stats for slaves in self.slaves.values() for slave in slaves},
+        }
+
+
+world = None  # World đang dùng, tạo bởi sim.install()
@@ -0,0 +1,117 @@
+"""
+Event loop asyncio chạy theo đồng hồ ảo
+
+loop.time() đọc SimClock nên asyncio.sleep, wait_for và các timer đều tính
+theo thời gian ảo. Khi không có việc, selector chỉ chờ socket thật trong
+timeout / speed giây rồi nhảy đồng hồ đến timer kế tiếp; nhờ vậy web server
+vẫn nhận kết nối thật trong khi thời gian ảo chạy nhanh hơn.
+
+Với speed = 0 selector không chờ thật chút nào: server ở process khác coi
+như không bao giờ kịp trả lời trước timeout ảo, nên với speed = 0 hãy chạy
+server giả lập ngay trong event loop (xem patch_open_connection).
+"""
+import asyncio
+import errno
+import math
+import selectors
+from sim.clock import _real_monotonic
+
+
+class SimSelector:
+    """Bọc selector thật: chờ I/O theo thời gian thực đã chia speed, rồi tiến đồng hồ ảo"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.selector = selectors.DefaultSelector()
+        self.stop_at_us = None  # Mốc thời gian ảo ném KeyboardInterrupt (một lần)
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+    def select(self, timeout=None):
+        clock = self.clock
+        if self.stop_at_us is not None and clock.now_us() >= self.stop_at_us:
+            self.stop_at_us = None
+            raise KeyboardInterrupt
+        if timeout is None:
+            # Không có timer nào: chỉ còn chờ I/O thật
+            return self.selector.select(None)
+        if self.stop_at_us is not None:
+            timeout = min(timeout, max(0, (self.stop_at_us - clock.now_us()) / 1000000))
+        if not clock.speed:
+            events = self.selector.select(0)
+            if not events:
+                clock.advance(math.ceil(timeout * 1000000))
+            return events
+        start = _real_monotonic()
+        events = self.selector.select(timeout / clock.speed)
+        if events:
+            elapsed = (_real_monotonic() - start) * clock.speed
+            clock.advance(min(elapsed, timeout) * 1000000)
+        else:
+            # Làm tròn lên: đồng hồ phải đạt tới timer, nếu không loop quay tại chỗ
+            clock.advance(math.ceil(timeout * 1000000))
+        return events
+
+
+class SimEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        self.sim_selector = SimSelector(clock)
+        super().__init__(self.sim_selector)
+        self.clock = clock
+        self._clock_resolution = 1e-6
+
+    def time(self):
+        return self.clock.now_us() / 1000000
+
+    def default_exception_handler(self, context):
+        # Khi dừng (stop_after), task của server giả lập bị hủy giữa chừng:
+        # asyncio 3.11 báo CancelledError này như lỗi trong callback
+        if isinstance(context.get("exception"), asyncio.CancelledError):
+            return
+        super().default_exception_handler(context)
+
+
+class SimEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    """asyncio.run() (và runtime.asyncio.run() trong main) tạo SimEventLoop"""
+
+    def __init__(self, clock, stop_after=None):
+        """stop_after: dừng (KeyboardInterrupt) khi đồng hồ ảo đạt số giây này"""
+        super().__init__()
+        self.clock = clock
+        self.stop_after = stop_after
+
+    def new_event_loop(self):
+        loop = SimEventLoop(self.clock)
+        if self.stop_after is not None:
+            loop.sim_selector.stop_at_us = int(self.stop_after * 1000000)
+        return loop
+
+
+def patch_open_connection(world):
+    """
+    asyncio.open_connection đi qua mạng LAN giả lập
+
+    world.routes ánh xạ (host, port) sang đích thật (host, port), hoặc sang
+    một handler client_connected_cb của asyncio.start_server: handler được
+    chạy làm server trên cổng loopback ngẫu nhiên ngay trong event loop hiện
+    tại (khởi động ở lần kết nối đầu). Địa chỉ LAN khác coi như không tới được.
+    """
+    real_open_connection = asyncio.open_connection
+    servers = {}  # (loop, handler) -> port
+
+    async def open_connection(host=None, port=None, **kwargs):
+        target = world.routes.get((host, port))
+        if callable(target):
+            key = (asyncio.get_running_loop(), target)
+            if key not in servers:
+                server = await asyncio.start_server(target, "127.0.0.1", 0)
+                servers[key] = server.sockets[0].getsockname()[1]
+            host, port = "127.0.0.1", servers[key]
+        elif target is not None:
+            host, port = target
+        elif host not in ("127.0.0.1", "localhost"):
+            raise OSError(errno.EHOSTUNREACH, "không tới được {}:{} trong mạng giả lập".format(host, port))
+        return await real_open_connection(host, port, **kwargs)
+
+    asyncio.open_connection = open_connection
@@ -0,0 +1,99 @@
+"""
+machine giả lập cho CPython: Pin, SPI và UART nối với sim.devices.world
+"""
+from sim import devices
+from modbus_loopback import LoopbackUART
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = None
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if mode != -1:
+            self.mode = mode
+        if value is not None:
+            self.value(value)
+
+    def value(self, v=None):
+        pins = devices.world.pins
+        if v is None:
+            return pins.read(self.id)
+        pins.write(self.id, v)
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def __repr__(self):
+        return "Pin({})".format(self.id)
+
+
+class SPI:
+    """SPI chỉ dùng để đọc: mỗi bit là một xung SCK trên PinBus, đọc MISO trước cạnh xuống"""
+
+    def __init__(self, id, baudrate=1000000, polarity=0, phase=0, bits=8, firstbit=0,
+                 sck=None, mosi=None, miso=None):
+        self.id = id
+        self.baudrate = baudrate
+        self.sck = sck.id
+        self.miso = miso.id
+
+    def readinto(self, buf, write=0):
+        pins = devices.world.pins
+        for i in range(len(buf)):
+            byte = 0
+            for _ in range(8):
+                pins.write(self.sck, 1)
+                byte = (byte << 1) | pins.read(self.miso)
+                pins.write(self.sck, 0)
+            buf[i] = byte
+        devices.world.clock.sleep_us(len(buf) * 8 * 1000000 // self.baudrate)
+
+    def read(self, n, write=0):
+        buf = bytearray(n)
+        self.readinto(buf, write)
+        return bytes(buf)
+
+    def deinit(self):
+        pass
+
+
+class UART(LoopbackUART):
+    """
+    UART nối với các slave Modbus giả lập trên cùng uart id (world.slaves)
+
+    Byte trả lời đến dần theo đồng hồ ảo; flush() chờ đến khi phát xong frame.
+    """
+
+    def __init__(self, id, baudrate=9600, bits=8, parity=None, stop=1, tx=None, rx=None, **kwargs):
+        super().__init__(devices.world.slaves.get(id, []), baudrate)
+        self.id = id
+        self.tx_done = 0
+
+    def init(self, baudrate=9600, **kwargs):
+        self.char_us = 11 * 1000000 // baudrate
+
+    def write(self, frame):
+        n = super().write(frame)
+        self.tx_done = devices.world.clock.now_us() + n * self.char_us
+        return n
+
+    def flush(self):
+        clock = devices.world.clock
+        clock.sleep_us(self.tx_done - clock.now_us())
+
+    def deinit(self):
+        pass
@@ -0,0 +1,54 @@
+"""
+network giả lập cho CPython: WLAN kết nối sau connect_delay giây ảo, IP là máy host
+"""
+from sim import devices
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_GOT_IP = 3
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self.state = devices.world.wlan_state(interface)
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self.state.active
+        self.state.active = bool(is_active)
+        if not is_active:
+            self.state.connected_at = None
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self.state.options.get(args[0])
+        self.state.options.update(kwargs)
+
+    def connect(self, ssid=None, key=None):
+        state = self.state
+        if not state.active:
+            raise OSError("WLAN chưa active")
+        state.ssid = ssid
+        state.connected_at = state.clock.now_us() + int(state.connect_delay * 1000000)
+
+    def disconnect(self):
+        self.state.connected_at = None
+
+    def isconnected(self):
+        return self.state.active and self.state.isconnected()
+
+    def status(self, param=None):
+        if self.isconnected():
+            return STAT_GOT_IP
+        return STAT_CONNECTING if self.state.connected_at is not None else STAT_IDLE
+
+    def ifconfig(self, config=None):
+        if config is not None:
+            self.state.ip = config[0]
+            return
+        ip = self.state.ip if self.isconnected() else "0.0.0.0"
+        return (ip, "255.255.255.0", ip, ip)
@@ -0,0 +1,9 @@
+"""
+ntptime giả lập cho CPython: đồng hồ ảo đã chạy theo epoch của sim.install()
+"""
+host = "pool.ntp.org"
+timeout = 1
+
+
+def settime():
+    pass
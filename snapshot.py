@@ -0,0 +1,117 @@
+import config
+from runtime import asyncio, ticks_ms, ticks_diff
+from jsonwriter import SnapshotWriter
+
+# Bộ đệm serialize dùng chung: mỗi snapshot chỉ serialize một lần khi cần
+_writer = SnapshotWriter()
+
+
+class Snapshot:
+    """
+    Một lần đọc cảm biến đã công bố (không được sửa sau khi tạo)
+
+    - version: số phiên bản tăng dần
+    - data: Reading bất biến (reading.py), dùng chung không sao chép
+    - taken_ms: thời điểm công bố theo ticks_ms
+    - changed: dict các trường khác so với snapshot trước (None nếu là bản đầu)
+    """
+    __slots__ = ("version", "data", "taken_ms", "changed", "_json", "_length", "_delta")
+
+    def __init__(self, version, data, taken_ms, prev=None):
+        self.version = version
+        self.data = data
+        self.taken_ms = taken_ms
+        self.changed = None if prev is None else data.diff(prev.data)
+        self._json = None
+        self._length = None
+        self._delta = None
+
+    def age_ms(self):
+        """Tuổi của snapshot (ms)"""
+        return ticks_diff(ticks_ms(), self.taken_ms)
+
+    def json_bytes(self):
+        """Thân JSON của snapshot, chỉ serialize một lần cho mọi client"""
+        if self._json is None:
+            self._json = _writer.dumps(self.data)
+        return self._json
+
+    def length_line(self):
+        """Giá trị header Content-Length của json_bytes() kèm CRLF, tạo một lần"""
+        if self._length is None:
+            self._length = str(len(self.json_bytes())).encode() + b"\r\n"
+        return self._length
+
+    def alerts_changed(self):
+        """Trạng thái cảnh báo có thay đổi so với snapshot trước không"""
+        return self.changed is not None and "alerts" in self.changed
+
+    def delta_bytes(self):
+        """JSON chỉ gồm các trường (trừ alerts) đã thay đổi, dùng chung cho mọi subscriber"""
+        if self._delta is None:
+            self._delta = _writer.dumps(self.changed or {}, partial=True)
+        return self._delta
+
+
+class SnapshotCache:
+    """
+    Bộ đệm snapshot: task đọc cảm biến công bố, các handler HTTP chỉ đọc
+
+    Nếu snapshot cũ hơn max_age_ms, get() kích hoạt một lần đọc mới; các
+    yêu cầu đến trong lúc đang đọc sẽ chờ chính lần đọc đó (single-flight).
+    """
+
+    def __init__(self, reader, max_age_ms=None):
+        self.reader = reader
+        self.max_age_ms = max_age_ms if max_age_ms is not None else int(config.SNAPSHOT_MAX_AGE * 1000)
+        self.current = None
+        self.version = 0
+        self._inflight = None
+        self._changed = asyncio.Event()
+
+    def publish(self, data):
+        """Công bố Reading mới thành snapshot phiên bản kế tiếp và đánh thức subscriber"""
+        self.version += 1
+        self.current = Snapshot(self.version, data, ticks_ms(), self.current)
+        
+        # Event dùng một lần: set() đánh thức mọi task đang chờ rồi thay bằng event mới
+        changed = self._changed
+        self._changed = asyncio.Event()
+        changed.set()
+        return self.current
+
+    async def wait_newer(self, version, timeout):
+        """Chờ snapshot có phiên bản > version; trả về None nếu hết timeout (giây)"""
+        if self.version <= version:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.current
+
+    def is_fresh(self):
+        """Snapshot hiện tại còn trong giới hạn max_age_ms không"""
+        return self.current is not None and self.current.age_ms() <= self.max_age_ms
+
+    async def refresh(self):
+        """Đọc cảm biến và công bố; nếu đang có lần đọc khác thì chờ lần đó"""
+        if self._inflight is not None:
+            await self._inflight.wait()
+            return self.current
+
+        done = asyncio.Event()
+        self._inflight = done
+        try:
+            data = self.reader()
+            if hasattr(data, "send"):  # reader là coroutine
+                data = await data
+            return self.publish(data)
+        finally:
+            self._inflight = None
+            done.set()
+
+    async def get(self):
+        """Trả về snapshot còn mới, đọc lại nếu đã quá max_age_ms"""
+        if self.is_fresh():
+            return self.current
+        return await self.refresh()
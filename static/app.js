@@ -0,0 +1,156 @@
+// Biến theo dõi trạng thái cập nhật
+let lastUpdateTime = 0;
+let updateInterval = 10000; // 10 giây
+
+// Thêm thông báo trạng thái cập nhật
+let statusContainer = document.createElement('div');
+statusContainer.style.position = 'fixed';
+statusContainer.style.bottom = '20px';
+statusContainer.style.left = '50%';
+statusContainer.style.transform = 'translateX(-50%)';
+statusContainer.style.backgroundColor = 'rgba(0,0,0,0.7)';
+statusContainer.style.color = 'white';
+statusContainer.style.padding = '10px 20px';
+statusContainer.style.borderRadius = '20px';
+statusContainer.style.zIndex = '1000';
+statusContainer.style.fontSize = '14px';
+statusContainer.style.display = 'none';
+document.body.appendChild(statusContainer);
+
+// Hiển thị thông báo
+function showStatus(message, isError = false) {
+    statusContainer.textContent = message;
+    statusContainer.style.backgroundColor = isError ? 'rgba(200,0,0,0.8)' : 'rgba(0,0,0,0.7)';
+    statusContainer.style.display = 'block';
+
+    // Tự động ẩn sau 3 giây
+    setTimeout(() => {
+        statusContainer.style.display = 'none';
+    }, 3000);
+}
+
+// Dữ liệu hiện tại trên trang (được gộp dần từ các sự kiện /stream)
+let sensorData = {};
+
+// Hiển thị dữ liệu cảm biến lên trang
+function renderData(data) {
+    document.getElementById('temp1').textContent = (data.temp1 != null) ? data.temp1.toFixed(1) + '°C' : 'N/A';
+    document.getElementById('temp2').textContent = (data.temp2 != null) ? data.temp2.toFixed(1) + '°C' : 'N/A';
+    document.getElementById('room-temp').textContent = (data.room_temp != null) ? data.room_temp.toFixed(1) + '°C' : 'N/A';
+    document.getElementById('humidity').textContent = (data.humidity != null) ? data.humidity.toFixed(1) + '%' : 'N/A';
+    document.getElementById('water-level').textContent = (data.water_level != null) ? data.water_level.toFixed(2) + 'm' : 'N/A';
+    document.getElementById('tank-volume').textContent = (data.tank_volume != null) ? data.tank_volume.toFixed(1) + 'L' : 'N/A';
+
+    // Cập nhật thời gian cập nhật gần nhất
+    document.getElementById('last-update').textContent = data.timestamp || 'Không có dữ liệu';
+
+    // Hiển thị cảnh báo nếu có
+    if (data.alerts) {
+        document.getElementById('alert-temp1').style.display = data.alerts.temp1 ? 'block' : 'none';
+        document.getElementById('alert-temp2').style.display = data.alerts.temp2 ? 'block' : 'none';
+        document.getElementById('alert-water').style.display = data.alerts.water_level ? 'block' : 'none';
+    }
+
+    lastUpdateTime = Date.now();
+}
+
+// Hàm cập nhật dữ liệu từ server
+function updateData() {
+    showStatus('Đang cập nhật dữ liệu...');
+
+    fetch('/data')
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Lỗi HTTP: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            sensorData = data;
+            renderData(sensorData);
+            showStatus('Đã cập nhật dữ liệu thành công');
+        })
+        .catch(error => {
+            console.error('Lỗi khi lấy dữ liệu:', error);
+            showStatus('Lỗi khi cập nhật dữ liệu', true);
+        });
+}
+
+// Thiết lập cập nhật định kỳ (khi trình duyệt/server không dùng được /stream)
+let pollTimer = null;
+function startPolling() {
+    if (pollTimer === null) {
+        pollTimer = setInterval(updateData, updateInterval);
+    }
+}
+
+// Nhận dữ liệu đẩy từ server qua Server-Sent Events
+function startStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    let source = new EventSource('/stream');
+
+    // Snapshot đầy đủ khi mới kết nối, sau đó chỉ các trường thay đổi
+    source.addEventListener('snapshot', function(e) {
+        sensorData = JSON.parse(e.data);
+        renderData(sensorData);
+    });
+    source.addEventListener('update', function(e) {
+        Object.assign(sensorData, JSON.parse(e.data));
+        renderData(sensorData);
+    });
+    source.addEventListener('alert', function(e) {
+        sensorData.alerts = JSON.parse(e.data);
+        renderData(sensorData);
+        showStatus('Trạng thái cảnh báo đã thay đổi', true);
+    });
+
+    source.onopen = function() {
+        // Đã có stream, không cần hỏi định kỳ nữa
+        if (pollTimer !== null) {
+            clearInterval(pollTimer);
+            pollTimer = null;
+        }
+    };
+    source.onerror = function() {
+        // Server từ chối (quá nhiều subscriber) hoặc stream đóng hẳn: quay về polling
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    };
+}
+
+// Cập nhật dữ liệu ngay khi trang được tải
+window.addEventListener('load', function() {
+    // Kiểm tra nếu initialSensorData đã được cung cấp từ server
+    if (typeof initialSensorData !== 'undefined') {
+        // Cập nhật UI với dữ liệu ban đầu
+        sensorData = initialSensorData;
+        renderData(sensorData);
+        showStatus('Dữ liệu ban đầu đã được tải');
+    } else {
+        // Tải dữ liệu từ API nếu không có dữ liệu ban đầu
+        updateData();
+    }
+
+    // Nhận cập nhật qua /stream, tự quay về polling nếu không được
+    startStream();
+
+    // Thêm nút làm mới thủ công
+    let refreshButton = document.createElement('button');
+    refreshButton.textContent = 'Làm mới dữ liệu';
+    refreshButton.style.display = 'block';
+    refreshButton.style.margin = '20px auto';
+    refreshButton.style.padding = '10px 20px';
+    refreshButton.style.backgroundColor = '#007bff';
+    refreshButton.style.color = 'white';
+    refreshButton.style.border = 'none';
+    refreshButton.style.borderRadius = '5px';
+    refreshButton.style.cursor = 'pointer';
+    refreshButton.onclick = updateData;
+
+    document.querySelector('.container').appendChild(refreshButton);
+});
@@ -0,0 +1,237 @@
+import os
+import struct
+from array import array
+import config
+import logger
+from schema import FIELDS, CHANNELS, ALERT_BITS
+
+# Bản ghi: timestamp (giây), channel bitmap (FIELD_BITS), alert bits, các giá
+# trị fixed-point theo FIELDS với typecode của schema.CHANNELS
+RECORD_FORMAT = "<IBB" + "".join(CHANNELS[name][1] for name in FIELDS)
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+# Header segment: magic + số thứ tự segment (tăng dần qua các lần xoay vòng)
+SEGMENT_MAGIC = b"TLG1"
+HEADER_FORMAT = "<4sI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Mỗi mục index: (timestamp, số thứ tự bản ghi trong segment)
+INDEX_FORMAT = "<II"
+INDEX_SIZE = struct.calcsize(INDEX_FORMAT)
+
+
+def decode(record):
+    """Bản ghi đã unpack -> dict giá trị thực (chỉ các kênh có bit trong bitmap)"""
+    t, bitmap, alert_bits = record[0], record[1], record[2]
+    data = {"timestamp": t}
+    for i, name in enumerate(FIELDS):
+        if bitmap & (1 << i):
+            data[name] = record[3 + i] / CHANNELS[name][0]
+    data["alerts"] = {name: bool(alert_bits & ALERT_BITS[name]) for name in ALERT_BITS}
+    return data
+
+
+class Segment:
+    """Một file segment: bản ghi kích thước cố định + index thưa theo thời gian"""
+
+    def __init__(self, slot, path):
+        self.slot = slot
+        self.path = path
+        self.index_path = path[:-4] + ".idx"
+        self.seq = 0
+        self.count = 0
+        self.first_t = None
+        self.last_t = None
+        self.idx_t = array("I")
+        self.idx_n = array("I")
+
+    def load(self, buf):
+        """Đọc header, số bản ghi, timestamp cuối và index của segment có sẵn"""
+        with open(self.path, "rb") as f:
+            magic, self.seq = struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
+            if magic != SEGMENT_MAGIC:
+                raise ValueError("segment không hợp lệ")
+            # Bỏ qua bản ghi cuối ghi dở (mất điện giữa chừng)
+            self.count = (os.stat(self.path)[6] - HEADER_SIZE) // RECORD_SIZE
+            if self.count:
+                f.readinto(buf)
+                self.first_t = struct.unpack_from("<I", buf)[0]
+                f.seek(HEADER_SIZE + (self.count - 1) * RECORD_SIZE)
+                f.readinto(buf)
+                self.last_t = struct.unpack_from("<I", buf)[0]
+        partial = False
+        try:
+            with open(self.index_path, "rb") as f:
+                while True:
+                    entry = f.read(INDEX_SIZE)
+                    if len(entry) < INDEX_SIZE:
+                        partial = len(entry) > 0
+                        break
+                    t, n = struct.unpack(INDEX_FORMAT, entry)
+                    if n < self.count:
+                        self.idx_t.append(t)
+                        self.idx_n.append(n)
+                    else:
+                        partial = True
+        except OSError:
+            pass
+        if partial:
+            # Index có mục ghi dở hoặc trỏ tới bản ghi đã bỏ: ghi lại phần hợp lệ
+            # để các mục nối thêm sau đó không bị lệch
+            with open(self.index_path, "wb") as f:
+                for t, n in zip(self.idx_t, self.idx_n):
+                    f.write(struct.pack(INDEX_FORMAT, t, n))
+
+    def reset(self, seq):
+        """Xóa nội dung và bắt đầu segment mới với số thứ tự seq"""
+        self.seq = seq
+        self.count = 0
+        self.first_t = self.last_t = None
+        self.idx_t = array("I")
+        self.idx_n = array("I")
+        with open(self.path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, SEGMENT_MAGIC, seq))
+        with open(self.index_path, "wb"):
+            pass
+
+    def start_record(self, t):
+        """Số thứ tự bản ghi để bắt đầu quét tìm timestamp >= t (tìm nhị phân trên index)"""
+        lo, hi = 0, len(self.idx_t)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.idx_t[mid] <= t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self.idx_n[lo - 1] if lo else 0
+
+
+class TelemetryLog:
+    """
+    Nhật ký telemetry nhị phân chỉ ghi nối (append-only) trên flash
+
+    Bản ghi struct kích thước cố định được ghi vào TELEMETRY_SEGMENTS file
+    segment xoay vòng: khi segment hiện tại đầy, segment cũ nhất bị ghi đè,
+    nhờ vậy số lần ghi trải đều trên các file. Mỗi segment có index thưa
+    (mỗi TELEMETRY_INDEX_EVERY bản ghi) để tìm theo thời gian với O(log n).
+
+    Timestamp trong một segment luôn tăng dần: nếu đồng hồ lùi (khởi động
+    lại mà RTC chưa được đồng bộ NTP) thì bản ghi được ghi sang segment mới
+    và time_resets tăng lên.
+    """
+
+    def __init__(self, directory=None, segments=None, segment_records=None, index_every=None):
+        self.directory = directory or config.TELEMETRY_DIR
+        self.segment_records = segment_records or config.TELEMETRY_SEGMENT_RECORDS
+        self.index_every = index_every or config.TELEMETRY_INDEX_EVERY
+        self.buf = bytearray(RECORD_SIZE)
+        self.values = [0] * len(FIELDS)
+        self.file = None
+        self.time_resets = 0  # Số lần timestamp lùi so với bản ghi trước
+
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            pass  # Thư mục đã tồn tại
+
+        self.segments = []
+        for slot in range(segments or config.TELEMETRY_SEGMENTS):
+            segment = Segment(slot, "{}/seg_{:04d}.bin".format(self.directory, slot))
+            try:
+                segment.load(self.buf)
+            except (OSError, ValueError):
+                segment.seq = 0  # Chưa có hoặc hỏng: coi như trống
+                segment.count = 0
+            self.segments.append(segment)
+
+        # Segment có số thứ tự lớn nhất là segment đang ghi
+        self.current = max(self.segments, key=lambda seg: seg.seq)
+        if self.current.seq == 0:
+            self.current.reset(1)
+
+    def _open(self):
+        if self.file is None:
+            # Ghi tiếp ngay sau bản ghi đầy đủ cuối cùng (không dùng "ab"): phần
+            # ghi dở do mất điện bị ghi đè thay vì làm lệch mọi bản ghi sau nó
+            self.file = open(self.current.path, "r+b")
+            self.file.seek(HEADER_SIZE + self.current.count * RECORD_SIZE)
+        return self.file
+
+    def _rotate(self):
+        """Chuyển sang slot kế tiếp (ghi đè segment cũ nhất)"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        seq = self.current.seq + 1
+        self.current = self.segments[(self.current.slot + 1) % len(self.segments)]
+        self.current.reset(seq)
+
+    def append(self, t, data, bitmap, alerts):
+        """
+        Ghi một bản ghi
+
+        - t: timestamp (giây)
+        - data: Reading (hoặc dict) giá trị fixed-point của các kênh
+        - bitmap: các kênh có giá trị mới (FIELD_BITS)
+        - alerts: alert bits (ALERT_BITS)
+        """
+        last_t = self.current.last_t
+        if last_t is not None and t < last_t:
+            # Tìm nhị phân trên index cần timestamp tăng dần trong segment
+            self.time_resets += 1
+            logger.warning("Đồng hồ lùi từ %d về %d giây, ghi nhật ký sang segment mới", last_t, t)
+            self._rotate()
+        elif self.current.count >= self.segment_records:
+            self._rotate()
+        segment = self.current
+
+        values = self.values
+        for i, name in enumerate(FIELDS):
+            value = data.get(name)
+            values[i] = 0 if value is None else value
+        struct.pack_into(RECORD_FORMAT, self.buf, 0, t, bitmap, alerts, *values)
+
+        f = self._open()
+        f.write(self.buf)
+        f.flush()
+
+        if segment.count % self.index_every == 0:
+            with open(segment.index_path, "ab") as idx:
+                idx.write(struct.pack(INDEX_FORMAT, t, segment.count))
+            segment.idx_t.append(t)
+            segment.idx_n.append(segment.count)
+        if segment.first_t is None:
+            segment.first_t = t
+        segment.last_t = t
+        segment.count += 1
+
+    def replay(self, t_from, t_to):
+        """
+        Sinh các bản ghi (tuple đã unpack) có timestamp trong [t_from, t_to]
+
+        Theo thứ tự segment (thứ tự ghi); đọc từng bản ghi vào bộ đệm cấp
+        sẵn, không nạp cả segment vào RAM.
+        """
+        if self.file is not None:
+            self.file.flush()
+        buf = bytearray(RECORD_SIZE)
+        for segment in sorted(self.segments, key=lambda seg: seg.seq):
+            if not segment.count or segment.last_t < t_from or segment.first_t > t_to:
+                continue
+            n = segment.start_record(t_from)
+            with open(segment.path, "rb") as f:
+                f.seek(HEADER_SIZE + n * RECORD_SIZE)
+                while n < segment.count:
+                    if f.readinto(buf) < RECORD_SIZE:
+                        break
+                    n += 1
+                    record = struct.unpack(RECORD_FORMAT, buf)
+                    if record[0] > t_to:
+                        break
+                    if record[0] >= t_from:
+                        yield record
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
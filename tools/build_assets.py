@@ -0,0 +1,48 @@
+"""
+Nén trước tài nguyên tĩnh của dashboard (chạy trên máy host khi build)
+
+    python tools/build_assets.py
+
+Tạo static/<tên>.gz và static/assets.json (đường dẫn URL, file, kiểu nội
+dung, ETag) để WebServer phục vụ trực tiếp từ flash với Content-Encoding: gzip.
+Bản gốc không nén vẫn được giữ cho client không hỗ trợ gzip.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "static")
+
+ASSETS = (
+    ("/app.css", "app.css", "text/css; charset=utf-8"),
+    ("/app.js", "app.js", "application/javascript; charset=utf-8"),
+)
+
+
+def build():
+    manifest = {}
+    for url, name, content_type in ASSETS:
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            raw = f.read()
+        # mtime=0 để file nén (và ETag) ổn định giữa các lần build
+        packed = gzip.compress(raw, compresslevel=9, mtime=0)
+        with open(os.path.join(STATIC_DIR, name + ".gz"), "wb") as f:
+            f.write(packed)
+        # ETag mạnh riêng cho từng biểu diễn (nén / không nén)
+        manifest[url] = {
+            "file": name + ".gz",
+            "etag": '"' + hashlib.sha1(packed).hexdigest()[:16] + '"',
+            "raw": name,
+            "raw_etag": '"' + hashlib.sha1(raw).hexdigest()[:16] + '"',
+            "type": content_type,
+        }
+        print("{:10s} {:6d} -> {:6d} bytes".format(url, len(raw), len(packed)))
+
+    with open(os.path.join(STATIC_DIR, "assets.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,131 @@
+"""
+Server HTTP giả lập IRIV IO Controller để kiểm thử trên máy host
+
+    python tools/iriv_standin.py [--port 8000] [--idle 10] [--fail 0.0] [--json-only]
+
+Hỗ trợ HTTP/1.1 keep-alive, POST /api/data (một object hoặc mảng JSON,
+hoặc lô nhị phân application/octet-stream giải mã bằng wire.decode) và
+GET /api/status.
+
+--idle đóng kết nối rảnh sau số giây cho trước mà không báo trước (giống
+server thật/NAT, để thử phát hiện kết nối nửa mở); --fail trả về 503 ngẫu
+nhiên với tỷ lệ cho trước (để thử backoff); --json-only trả 415 cho định
+dạng nhị phân (để thử chuyển về JSON).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import wire
+
+
+class Standin:
+    def __init__(self, idle, fail, json_only=False, verbose=True):
+        self.idle = idle
+        self.fail = fail
+        self.json_only = json_only
+        self.verbose = verbose
+        self.readings = 0
+        self.bytes = 0
+        self.requests = 0
+        self.connections = 0
+        self.last = None
+
+    def handle(self, method, path, content_type, body):
+        """Trả về (status, object JSON)"""
+        if self.fail and random.random() < self.fail:
+            return 503, {"error": "unavailable"}
+        if method == "POST" and path == "/api/data":
+            if content_type == wire.CONTENT_TYPE:
+                if self.json_only:
+                    return 415, {"error": "unsupported media type"}
+                try:
+                    batch = wire.decode(body)
+                except (ValueError, IndexError, struct.error) as e:
+                    return 400, {"error": "invalid binary batch: {}".format(e)}
+            else:
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    return 400, {"error": "invalid json"}
+                batch = data if isinstance(data, list) else [data]
+            self.readings += len(batch)
+            self.bytes += len(body)
+            self.last = batch[-1]
+            return 200, {"status": "ok", "accepted": len(batch)}
+        if method == "GET" and path == "/api/status":
+            return 200, {
+                "status": "ok",
+                "uptime": int(time.monotonic()),
+                "readings": self.readings,
+                "bytes_per_reading": self.bytes / self.readings if self.readings else 0,
+                "requests": self.requests,
+                "connections": self.connections,
+                "last": self.last,
+            }
+        return 404, {"error": "not found"}
+
+    async def client(self, reader, writer):
+        self.connections += 1
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle)
+                except asyncio.TimeoutError:
+                    break  # Đóng lặng lẽ như server thật hết keep-alive
+                if not line:
+                    break
+                method, path, _ = line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = h.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                self.requests += 1
+                status, obj = self.handle(method, path, headers.get("content-type"), body)
+                payload = json.dumps(obj).encode()
+                close = headers.get("connection", "").lower() == "close"
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n{}\r\n".format(
+                    status, "OK" if status == 200 else "Error", len(payload),
+                    "Connection: close\r\n" if close else "").encode() + payload)
+                await writer.drain()
+                if self.verbose:
+                    print("{} {} {} -> {} ({} bản ghi)".format(peer, method, path, status, self.readings))
+                if close:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--idle", type=float, default=10)
+    parser.add_argument("--fail", type=float, default=0.0)
+    parser.add_argument("--json-only", action="store_true")
+    args = parser.parse_args()
+
+    standin = Standin(args.idle, args.fail, args.json_only)
+    server = await asyncio.start_server(standin.client, "0.0.0.0", args.port)
+    print("IRIV giả lập tại cổng {}".format(args.port))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Phát lại trace phần cứng (hwtrace.py) vào SensorManager/IRIVController trên máy host
+
+    python tools/replay_trace.py trace.bin [--realtime] [--quiet]
+
+Firmware chạy trên bộ mô phỏng (gói sim) với đồng hồ ảo bắt đầu từ epoch
+của trace; MAX31855, DHT22, UART Modbus và kết nối HTTP đến IRIV được thay
+bằng dữ liệu trong trace (frame Modbus đến đúng khoảng thời gian đã ghi sau
+request). Các task đọc cảm biến, lấy mẫu và upload của runtime chạy như
+trên thiết bị cho đến khi trace hết.
+
+Mặc định chạy nhanh nhất có thể và in throughput của đường xử lý (bản ghi
+trace và snapshot mỗi giây thực); --realtime giữ nhịp thời gian như lúc ghi.
+Để tạo trace trên máy host: python tools/simulate.py --trace trace.bin ...
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import sim
+
+
+async def run(runtime, sensor_manager, source):
+    """Chạy các task nền của runtime đến khi trace hết"""
+    asyncio = runtime.asyncio
+    tasks = [
+        asyncio.create_task(runtime.acquisition_task(sensor_manager)),
+        asyncio.create_task(runtime.sampler_task(sensor_manager)),
+        asyncio.create_task(runtime.uploader_task(sensor_manager)),
+    ]
+    while not source.exhausted and source.remaining():
+        await asyncio.sleep(1)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("trace")
+    parser.add_argument("--realtime", action="store_true", help="giữ nhịp thời gian như lúc ghi")
+    parser.add_argument("--quiet", action="store_true", help="chỉ in cảnh báo và lỗi ra console")
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.trace)
+    with open(path, "rb") as f:
+        epoch = struct.unpack("<I", f.read(8)[4:])[0]
+    sim.install(speed=1 if args.realtime else 0, epoch=epoch)
+
+    import config
+    config.TRACE_ENABLED = False
+    config.TELEMETRY_LOG_ENABLED = False
+    if args.quiet:
+        config.LOG_CONSOLE_LEVEL = "warning"
+    import hwtrace
+    import runtime
+    from sensors import SensorManager
+
+    _, records = hwtrace.read_trace(path)
+    os.chdir(ROOT)
+    sensor_manager = SensorManager(2, 1, 0, 6, 5, 4, 15, iriv_ip=config.IRIV_IP)
+    source = hwtrace.replay(sensor_manager, records)
+
+    start = time.monotonic()
+    runtime.asyncio.run(run(runtime, sensor_manager, source))
+    real = time.monotonic() - start
+
+    counts = {}
+    for _, kind, _ in records:
+        name = hwtrace.KIND_NAMES.get(kind, str(kind))
+        counts[name] = counts.get(name, 0) + 1
+    snapshots = sensor_manager.cache.version
+    iriv = sensor_manager.iriv
+    print("Trace: {} bản ghi, {:.0f} giây; phát lại trong {:.2f} giây thực".format(
+        len(records), records[-1][0] / 1000000 if records else 0, real))
+    print("Throughput: {:.0f} bản ghi/giây, {:.0f} snapshot/giây".format(
+        len(records) / real if real else 0, snapshots / real if real else 0))
+    print(json.dumps({
+        "records": counts,
+        "consumed": source.consumed,
+        "snapshots": snapshots,
+        "modbus": iriv.bus_status(),
+        "modbus_frame_mismatches": iriv.modbus.uart.mismatches,
+        "http": iriv.http.stats,
+        "outbox": sensor_manager.outbox.stats,
+    }, indent=1))
+
+
+if __name__ == "__main__":
+    main()
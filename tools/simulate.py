@@ -0,0 +1,96 @@
+"""
+Chạy main.main() trên máy host với phần cứng giả lập (gói sim)
+
+    python tools/simulate.py [--speed 0] [--hours 24] [--port 8080] [--seed 0]
+                             [--iriv local|none|host:port] [--iriv-fail 0.0] [--quiet]
+                             [--latency 20] [--crc-rate 0.0] [--timeout-rate 0.0]
+                             [--tc-fault-rate 0.0] [--dht-fail-rate 0.0] [--trace trace.bin]
+
+--speed là hệ số tăng tốc (0 = nhanh nhất, 1 = thời gian thực; dùng 1..60
+khi muốn mở dashboard trong lúc chạy). --hours dừng sau số giờ ảo (0 = chạy
+mãi). --iriv quyết định địa chỉ IRIV Controller (config.IRIV_IP) đi đâu:
+"local" (mặc định) chạy tools/iriv_standin.py ngay trong event loop giả lập,
+host:port chuyển đến một server thật (ở process khác, cần --speed > 0),
+"none" để IRIV không tới được và dữ liệu nằm lại trong outbox. Các tùy chọn
+lỗi áp dụng cho mọi slave Modbus / MAX31855 / DHT22 giả lập. --trace ghi trace
+phần cứng (hwtrace.py) để phát lại bằng tools/replay_trace.py.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import sim
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--speed", type=float, default=0)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iriv", default="local", help="local, none hoặc host:port của IRIV Controller giả lập")
+    parser.add_argument("--iriv-fail", type=float, default=0.0, help="tỷ lệ 503 của IRIV giả lập (local)")
+    parser.add_argument("--quiet", action="store_true", help="chỉ in cảnh báo và lỗi ra console")
+    parser.add_argument("--latency", type=int, default=20, help="độ trễ slave Modbus (ms)")
+    parser.add_argument("--crc-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--tc-fault-rate", type=float, default=0.0)
+    parser.add_argument("--dht-fail-rate", type=float, default=0.0)
+    parser.add_argument("--trace", default=None, help="ghi trace phần cứng vào file này")
+    args = parser.parse_args()
+
+    world = sim.install(speed=args.speed, seed=args.seed,
+                        stop_after=args.hours * 3600 if args.hours else None)
+    for slaves in world.slaves.values():
+        for slave in slaves:
+            slave.base_latency_ms = args.latency
+            slave.crc_rate = args.crc_rate
+            slave.timeout_rate = args.timeout_rate
+    for tc in world.thermocouples:
+        tc.fault_rate = args.tc_fault_rate
+    for sensor in world.dht.values():
+        sensor.fail_rate = args.dht_fail_rate
+
+    import config
+    config.HTTP_PORT = args.port
+    if args.quiet:
+        config.LOG_CONSOLE_LEVEL = "warning"
+    if args.trace:
+        config.TRACE_ENABLED = True
+        config.TRACE_FILE = os.path.abspath(args.trace)
+        config.TRACE_MAX_BYTES = 1 << 30  # Trên máy host không giới hạn như flash
+    if args.iriv == "local":
+        from iriv_standin import Standin
+        standin = Standin(config.IRIV_IDLE_TIMEOUT * 2, args.iriv_fail, verbose=not args.quiet)
+        world.routes[(config.IRIV_IP, config.IRIV_PORT)] = standin.client
+    elif args.iriv != "none":
+        host, _, port = args.iriv.rpartition(":")
+        world.routes[(config.IRIV_IP, config.IRIV_PORT)] = (host, int(port))
+
+    os.chdir(ROOT)  # static/, log/, outbox/ theo đường dẫn tương đối như trên flash
+    import main as firmware
+    start = time.monotonic()
+    firmware.main()
+    real = time.monotonic() - start
+    if args.trace:
+        import hwtrace
+        if hwtrace.active is not None:
+            hwtrace.active.close()
+
+    simulated = sim.clock.now_us() / 1000000
+    print("Thời gian ảo: {:.0f} giây, thời gian thực: {:.1f} giây ({:.0f}x)".format(
+        simulated, real, simulated / real if real else 0))
+    stats = world.stats()
+    if args.iriv == "local":
+        stats["iriv"] = {"requests": standin.requests, "readings": standin.readings,
+                         "connections": standin.connections}
+    print(json.dumps(stats, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,183 +1,672 @@
-import socket
-import time
 import json
+import os
+import time
 import config
+import logger
+import metrics
+import profiler
+from runtime import asyncio, ticks_us, ticks_diff
+from fixedpoint import format_channel
+from telemetry_log import decode as decode_record
+
+# Các ô giá trị trên trang chính: (id thẻ <p>, khóa dữ liệu, (số chữ số thập phân, đơn vị))
+# Thứ tự phải trùng thứ tự xuất hiện trong template; None = hiển thị nguyên văn
+PAGE_SLOTS = (
+    ("temp1", "temp1", (1, "°C")),
+    ("temp2", "temp2", (1, "°C")),
+    ("room-temp", "room_temp", (1, "°C")),
+    ("humidity", "humidity", (1, "%")),
+    ("water-level", "water_level", (2, "m")),
+    ("tank-volume", "tank_volume", (1, "L")),
+    ("last-update", "timestamp", None),
+)
+
+HTML_HEADER_PREFIX = b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\nContent-Length: "
+JSON_HEADER_PREFIX = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: "
+CONN_CLOSE = b"Connection: close\r\n\r\n"
+SSE_HEADERS = b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n"
+LOGS_HEADER_PREFIX = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+TELEMETRY_HEADERS = b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n" + CONN_CLOSE
+METRICS_HEADERS = b"HTTP/1.1 200 OK\r\nContent-Type: " + metrics.CONTENT_TYPE + b"\r\n" + CONN_CLOSE
+
+# Các pha của một request: đọc header, xử lý (không tính chờ gửi), chờ gửi (drain)
+HTTP_PARSE_TIME = metrics.histogram("http_phase_seconds", "Thời gian từng pha xử lý request HTTP", {"phase": "parse"})
+HTTP_SERVE_TIME = metrics.histogram("http_phase_seconds", "", {"phase": "serve"})
+HTTP_SEND_TIME = metrics.histogram("http_phase_seconds", "", {"phase": "send"})
+HTTP_REQUESTS = metrics.counter("http_requests_total", "Số request HTTP đã nhận")
+
+
+class TimedWriter:
+    """StreamWriter kèm tổng thời gian chờ drain() (pha gửi) của request hiện tại"""
+    __slots__ = ("writer", "send_us")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.send_us = 0
+
+    def write(self, data):
+        self.writer.write(data)
 
+    async def drain(self):
+        start = ticks_us()
+        await self.writer.drain()
+        self.send_us += ticks_diff(ticks_us(), start)
+
+    def close(self):
+        self.writer.close()
+
+
+class CompiledPage:
+    """
+    Template HTML được biên dịch một lần thành các đoạn bytes tĩnh xen kẽ
+    các ô giá trị; mỗi response ghi lần lượt từng đoạn, không dựng cả trang
+    """
+
+    def __init__(self, template, slots, placeholder="Đang tải..."):
+        segments = []
+        self.slots = []
+        rest = template
+        for elem_id, key, fmt in slots:
+            open_tag = '<p id="{}">'.format(elem_id)
+            cut = rest.index(open_tag + placeholder) + len(open_tag)
+            segments.append(rest[:cut].encode())
+            self.slots.append((key, fmt))
+            rest = rest[cut + len(placeholder):]
+        
+        # Dữ liệu cảm biến ban đầu dưới dạng biến JavaScript, chèn trước </body>
+        cut = rest.rfind('</body>')
+        segments.append((rest[:cut] + """
+        <script>
+        // Dữ liệu cảm biến ban đầu từ server
+        const initialSensorData = """).encode())
+        self.slots.append((None, None))
+        segments.append((""";
+        </script>
+        """ + rest[cut:]).encode())
+        
+        self.segments = segments
+        self.static_len = sum(len(seg) for seg in segments)
+    
+    def values(self, snapshot):
+        """Định dạng các ô giá trị từ snapshot thành bytes"""
+        data = snapshot.data
+        out = []
+        for key, fmt in self.slots:
+            if key is None:
+                out.append(snapshot.json_bytes())
+            else:
+                value = data.get(key)
+                if value is None:
+                    text = "N/A"
+                elif fmt is None:
+                    text = str(value)
+                else:
+                    # Giá trị fixed-point: định dạng bằng số nguyên, không qua float
+                    text = format_channel(key, value, fmt[0]) + fmt[1]
+                out.append(text.encode())
+        return out
+    
+    async def send(self, writer, snapshot, conn=CONN_CLOSE):
+        """Ghi response HTTP: header, rồi xen kẽ đoạn tĩnh và giá trị"""
+        values = self.values(snapshot)
+        length = self.static_len
+        for value in values:
+            length += len(value)
+        
+        writer.write(HTML_HEADER_PREFIX)
+        writer.write(str(length).encode())
+        writer.write(b"\r\n")
+        writer.write(conn)
+        segments = self.segments
+        for i in range(len(values)):
+            writer.write(segments[i])
+            await writer.drain()
+            writer.write(values[i])
+        writer.write(segments[-1])
+        await writer.drain()
+
+
+class RequestError(Exception):
+    """Request không hợp lệ hoặc vượt giới hạn: trả về status rồi đóng kết nối"""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+async def read_headers(reader):
+    """
+    Đọc các header đến dòng trống, trả về dict (tên header viết thường)
+
+    Ném RequestError khi vượt HTTP_MAX_HEADERS/HTTP_MAX_LINE (431) hoặc
+    dòng header sai cú pháp (400).
+    """
+    headers = {}
+    count = 0
+    while True:
+        line = await reader.readline()
+        if not line or line == b"\r\n" or line == b"\n":
+            return headers
+        count += 1
+        if len(line) > config.HTTP_MAX_LINE or count > config.HTTP_MAX_HEADERS:
+            raise RequestError(b"431 Request Header Fields Too Large")
+        name, sep, value = line.decode().partition(":")
+        if not sep:
+            raise RequestError(b"400 Bad Request")
+        headers[name.strip().lower()] = value.strip()
+
+
+def parse_query(query):
+    """Tách query string đơn giản (không mã hóa %) thành dict"""
+    params = {}
+    for pair in query.split("&"):
+        key, _, value = pair.partition("=")
+        if key:
+            params[key] = value
+    return params
+
+
+def load_assets(static_dir=None):
+    """Đọc static/assets.json (tạo bởi tools/build_assets.py), trả về {url: asset}"""
+    static_dir = static_dir or config.STATIC_DIR
+    try:
+        with open(static_dir + "/assets.json") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.warning("Không tải được danh sách tài nguyên tĩnh: %s", e)
+        return {}
+    
+    assets = {}
+    for url in manifest:
+        entry = manifest[url]
+        assets[url] = {
+            "file": static_dir + "/" + entry["file"],
+            "etag": entry["etag"],
+            "raw": static_dir + "/" + entry["raw"],
+            "raw_etag": entry["raw_etag"],
+            "type": entry["type"],
+        }
+    return assets
+
+
+# /stream không được đo: một lời gọi kéo dài đến khi client ngắt
+@profiler.traced("serve_html_page", "serve_sensor_data", "serve_asset", "serve_history",
+                 "serve_stats", "serve_metrics", "serve_logs", "serve_404")
 class WebServer:
-    def __init__(self, wifi_manager, sensor_manager, port=80):
+    def __init__(self, wifi_manager, sensor_manager, port=None):
         self.wifi_manager = wifi_manager
         self.sensor_manager = sensor_manager
-        self.port = port
-        self.sock = None
+        self.port = port if port is not None else config.HTTP_PORT
+        self.server = None
+        
+        # Biên dịch template một lần khi khởi động thay vì mỗi request
+        self.page = CompiledPage(self.get_html_template(), PAGE_SLOTS)
         
-    def start(self):
-        """Khởi động web server"""
+        # CSS/JS nén gzip sẵn trong flash
+        self.assets = load_assets()
+        
+        # Keep-alive: header dựng sẵn và thống kê dùng lại kết nối
+        self.conn_keep_alive = "Connection: keep-alive\r\nKeep-Alive: timeout={}, max={}\r\n\r\n".format(
+            config.HTTP_IDLE_TIMEOUT, config.HTTP_MAX_REQUESTS).encode()
+        self.open_connections = 0
+        self.stats = {"connections": 0, "requests": 0, "reused": 0, "idle_timeouts": 0, "bad_requests": 0}
+        
+        # Số client đang nghe /stream
+        self.subscribers = 0
+        
+    async def start(self):
+        """Khởi động web server (asyncio), mỗi client được phục vụ bởi một task riêng"""
         if not self.wifi_manager.wlan.isconnected():
-            print("Không có kết nối WiFi. Không thể khởi động server.")
+            logger.error("Không có kết nối WiFi. Không thể khởi động server.")
             return False
-            
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         
         ip = self.wifi_manager.get_ip()
-        addr = ('0.0.0.0', self.port)  # Binding với '0.0.0.0' để chấp nhận kết nối từ tất cả địa chỉ IP
         
         try:
-            self.sock.bind(addr)
-            self.sock.listen(5)
-            print(f"Web server đang chạy tại http://{ip}:{self.port}/")
-            print(f"Có thể truy cập từ bất kỳ thiết bị nào trong cùng mạng LAN")
+            # Binding với '0.0.0.0' để chấp nhận kết nối từ tất cả địa chỉ IP
+            self.server = await asyncio.start_server(self.handle_client, '0.0.0.0', self.port, backlog=5)
+            logger.info("Web server đang chạy tại http://%s:%d/", ip, self.port)
             return True
         except Exception as e:
-            print(f"Lỗi khởi động web server: {e}")
+            logger.error("Lỗi khởi động web server: %s", e)
             return False
     
-    def handle_client(self):
-        """Xử lý yêu cầu từ client"""
-        # Không bắt ngoại lệ ở đây để ngoại lệ được truyền lên main
-        client, addr = self.sock.accept()
-        print(f"Kết nối từ {addr}")
-        
-        # Nhận yêu cầu
-        request = client.recv(1024).decode()
-        if not request:
-            client.close()
-            return
-        
-        # Phân tích yêu cầu
-        path = request.split()[1]
-        
-        # Xử lý các đường dẫn
-        if path == "/":
-            self.serve_html_page(client)
-        elif path == "/data":
-            self.serve_sensor_data(client)
-        else:
-            self.serve_404(client)
-            
-        client.close()
+    def stop(self):
+        """Dừng web server"""
+        if self.server:
+            self.server.close()
+            self.server = None
     
-    def serve_html_page(self, client):
-        """Phục vụ trang HTML chính với dữ liệu cảm biến được nhúng sẵn"""
-        # Lấy dữ liệu cảm biến
-        data = self.sensor_manager.read_all()
-        
-        # Lấy template HTML cơ bản
-        html_template = self.get_html_template()
-        
-        # Thay thế các phần "Đang tải..." bằng dữ liệu thực tế
-        html = html_template.replace('<p id="temp1">Đang tải...</p>', 
-                                    f'<p id="temp1">{data["temp1"]:.1f}°C</p>')
-        html = html.replace('<p id="temp2">Đang tải...</p>', 
-                                    f'<p id="temp2">{data["temp2"]:.1f}°C</p>')
-        html = html.replace('<p id="room-temp">Đang tải...</p>', 
-                                    f'<p id="room-temp">{data["room_temp"]:.1f}°C</p>')
-        html = html.replace('<p id="humidity">Đang tải...</p>', 
-                                    f'<p id="humidity">{data["humidity"]:.1f}%</p>')
-        html = html.replace('<p id="water-level">Đang tải...</p>', 
-                                    f'<p id="water-level">{data["water_level"]:.2f}m</p>')
-        html = html.replace('<p id="tank-volume">Đang tải...</p>', 
-                                    f'<p id="tank-volume">{data["tank_volume"]:.1f}L</p>')
-        html = html.replace('<p id="last-update">Đang tải...</p>', 
-                                    f'<p id="last-update">{data["timestamp"]}</p>')
-        
-        # Thêm dữ liệu cảm biến dưới dạng biến JavaScript để trang vẫn có thể sử dụng
-        sensor_data_js = f"""
-        <script>
-        // Dữ liệu cảm biến ban đầu từ server
-        const initialSensorData = {json.dumps(data)};
-        </script>
+    async def handle_client(self, reader, writer):
         """
+        Xử lý một kết nối từ client (HTTP/1.1 keep-alive)
         
-        # Chèn vào trước thẻ script cuối cùng
-        html = html.replace('</body>', f'{sensor_data_js}</body>')
-        
-        # Gửi phản hồi HTTP
-        response = "HTTP/1.1 200 OK\r\n"
-        response += "Content-Type: text/html\r\n"
-        response += f"Content-Length: {len(html)}\r\n"
-        response += "Connection: close\r\n\r\n"
-        response += html
+        Các request trên cùng kết nối (kể cả pipelining) được xử lý lần lượt
+        theo thứ tự nhận, response ghi theo đúng thứ tự đó. Kết nối đóng khi
+        client yêu cầu, khi rảnh quá HTTP_IDLE_TIMEOUT, khi đạt
+        HTTP_MAX_REQUESTS hoặc khi số kết nối mở vượt HTTP_MAX_KEEPALIVE.
+        """
+        stats = self.stats
+        stats["connections"] += 1
+        self.open_connections += 1
+        served = 0
+        writer = TimedWriter(writer)
+        try:
+            while True:
+                # Nhận dòng yêu cầu, chờ tối đa HTTP_IDLE_TIMEOUT giữa các request
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), config.HTTP_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    stats["idle_timeouts"] += 1
+                    break
+                if not request_line:
+                    break
+                start = ticks_us()
+                
+                # Header và thân cũng chỉ được chờ tối đa HTTP_IDLE_TIMEOUT: client
+                # gửi nhỏ giọt không giữ được kết nối (và bộ nhớ) mãi
+                try:
+                    parts = request_line.split()
+                    if len(request_line) > config.HTTP_MAX_LINE or len(parts) < 3:
+                        raise RequestError(b"400 Bad Request")
+                    headers = await asyncio.wait_for(read_headers(reader), config.HTTP_IDLE_TIMEOUT)
+                    
+                    # Bỏ qua thân request (nếu có) để không lệch khung request kế tiếp
+                    try:
+                        length = int(headers.get("content-length", 0))
+                    except ValueError:
+                        raise RequestError(b"400 Bad Request")
+                    if length < 0:
+                        raise RequestError(b"400 Bad Request")
+                    if length > config.HTTP_MAX_BODY:
+                        raise RequestError(b"413 Content Too Large")
+                    if length:
+                        await asyncio.wait_for(reader.readexactly(length), config.HTTP_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    stats["idle_timeouts"] += 1
+                    break
+                except RequestError as e:
+                    stats["bad_requests"] += 1
+                    await self.serve_error(writer, e.status)
+                    break
+                
+                # Phân tích yêu cầu
+                path, _, query = parts[1].decode().partition("?")
+                
+                served += 1
+                stats["requests"] += 1
+                HTTP_REQUESTS.inc()
+                if served > 1:
+                    stats["reused"] += 1
+                
+                # Giữ kết nối nếu client cho phép và chưa vượt giới hạn
+                connection = headers.get("connection", "").lower()
+                if parts[2] == b"HTTP/1.1":
+                    keep_alive = connection != "close"
+                else:
+                    keep_alive = connection == "keep-alive"
+                keep_alive = keep_alive and served < config.HTTP_MAX_REQUESTS and \
+                    self.open_connections <= config.HTTP_MAX_KEEPALIVE
+                conn = self.conn_keep_alive if keep_alive else CONN_CLOSE
+                served_at = ticks_us()
+                HTTP_PARSE_TIME.observe(ticks_diff(served_at, start))
+                writer.send_us = 0
+                
+                # Xử lý các đường dẫn
+                if path == "/":
+                    await self.serve_html_page(writer, conn)
+                elif path == "/data":
+                    await self.serve_sensor_data(writer, conn)
+                elif path == "/stats":
+                    await self.serve_stats(writer, conn)
+                elif path == "/history":
+                    await self.serve_history(writer, parse_query(query), conn)
+                elif path == "/debug/profile":
+                    await self.serve_profile(writer, parse_query(query), conn)
+                elif path == "/logs":
+                    # Nhật ký ghi thẳng ra kết nối, kết thúc bằng đóng kết nối
+                    await self.serve_logs(writer, parse_query(query))
+                    break
+                elif path == "/telemetry":
+                    # Nhật ký flash ghi thẳng ra kết nối, kết thúc bằng đóng kết nối
+                    await self.serve_telemetry(writer, parse_query(query))
+                    break
+                elif path == "/metrics":
+                    # Metric ghi thẳng ra kết nối, kết thúc bằng đóng kết nối
+                    await self.serve_metrics(writer)
+                    break
+                elif path == "/stream":
+                    # Stream chiếm kết nối đến khi client ngắt
+                    await self.serve_stream(writer)
+                    break
+                elif path in self.assets:
+                    await self.serve_asset(writer, self.assets[path], headers, conn)
+                else:
+                    await self.serve_404(writer, conn)
+                
+                HTTP_SEND_TIME.observe(writer.send_us)
+                HTTP_SERVE_TIME.observe(ticks_diff(ticks_us(), served_at) - writer.send_us)
+                if not keep_alive:
+                    break
+        except Exception as e:
+            logger.warning("Lỗi xử lý client: %s", e)
+        finally:
+            self.open_connections -= 1
+            writer.close()
+    
+    async def serve_html_page(self, client, conn=CONN_CLOSE):
+        """Phục vụ trang HTML chính với dữ liệu cảm biến được nhúng sẵn"""
+        # Lấy snapshot dữ liệu cảm biến (không đọc lại phần cứng nếu còn mới)
+        snapshot = await self.sensor_manager.cache.get()
         
-        client.send(response.encode())
+        # Ghi lần lượt các đoạn tĩnh đã biên dịch và giá trị mới định dạng
+        await self.page.send(client, snapshot, conn)
     
-    def serve_sensor_data(self, client):
+    async def serve_sensor_data(self, client, conn=CONN_CLOSE):
         """Phục vụ dữ liệu cảm biến dưới dạng JSON"""
-        # Đọc dữ liệu mới mỗi khi có yêu cầu
-        data = self.sensor_manager.read_all()
-        
-        # Thêm thời gian yêu cầu
-        current_time = time.localtime(time.time())
-        current_time_str = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
-            current_time[0], current_time[1], current_time[2],
-            current_time[3], current_time[4], current_time[5]
-        )
-        print(f"[YÊU CẦU DỮ LIỆU WEB] Thời gian: {current_time_str}")
-        
-        # In thông tin debug
-        print("Debug - Dữ liệu cảm biến:")
-        print(f"Nhiệt độ 1: {data['temp1']}°C")
-        print(f"Nhiệt độ 2: {data['temp2']}°C")
-        print(f"Nhiệt độ phòng: {data['room_temp']}°C")
-        print(f"Độ ẩm: {data['humidity']}%")
-        print(f"Mực nước: {data['water_level']}m")
-        print(f"Thể tích: {data['tank_volume']}L")
-        print("-" * 50)
+        # Lấy snapshot dữ liệu cảm biến (không đọc lại phần cứng nếu còn mới)
+        snapshot = await self.sensor_manager.cache.get()
+        
+        # Giá trị đã có trong chính response: chỉ ghi phiên bản snapshot
+        logger.debug("GET /data: snapshot %d (%s)", snapshot.version, snapshot.data.timestamp)
         
         try:
-            # Đảm bảo tất cả các giá trị đều có thể chuyển đổi thành JSON
-            for key in data:
-                if key != 'alerts' and data[key] is None:
-                    data[key] = 0.0
-            
-            # Đảm bảo trường alerts luôn tồn tại
-            if 'alerts' not in data:
-                data['alerts'] = {"temp1": False, "temp2": False, "water_level": False}
-            
-            # Chuyển đổi dữ liệu sang JSON
-            json_data = json.dumps(data)
-            
-            # Chuyển đổi JSON thành bytes trước khi tính toán độ dài
-            json_bytes = json_data.encode()
-            
-            # Tạo response hoàn chỉnh
-            response = "HTTP/1.1 200 OK\r\n"
-            response += "Content-Type: application/json\r\n"
-            response += f"Content-Length: {len(json_bytes)}\r\n"
-            response += "Connection: close\r\n\r\n"
-            
-            # Kết hợp headers và nội dung thành một message duy nhất
-            complete_response = response.encode() + json_bytes
-            
-            # Gửi toàn bộ response trong một lần
-            client.sendall(complete_response)
+            # JSON và Content-Length của snapshot được tạo một lần, dùng lại cho
+            # mọi client; header là hằng bytes nên mỗi request không cấp phát gì
+            client.write(JSON_HEADER_PREFIX)
+            client.write(snapshot.length_line())
+            client.write(conn)
+            client.write(snapshot.json_bytes())
+            await client.drain()
         
         except Exception as e:
-            print(f"Lỗi khi xử lý JSON: {e}")
+            logger.error("Lỗi khi xử lý JSON: %s", e)
             error_message = json.dumps({"error": str(e)}).encode()
             
             response = "HTTP/1.1 500 Internal Server Error\r\n"
             response += "Content-Type: application/json\r\n"
             response += f"Content-Length: {len(error_message)}\r\n"
-            response += "Connection: close\r\n\r\n"
             
-            # Kết hợp headers và nội dung thành một message duy nhất
-            complete_response = response.encode() + error_message
+            client.write(response.encode())
+            client.write(conn)
+            client.write(error_message)
+            await client.drain()
+    
+    async def serve_asset(self, client, asset, headers, conn=CONN_CLOSE):
+        """Phục vụ CSS/JS nén sẵn với ETag, Cache-Control và 304 Not Modified"""
+        # Client không hỗ trợ gzip thì gửi bản gốc
+        if "gzip" in headers.get("accept-encoding", ""):
+            filename, etag, encoding = asset["file"], asset["etag"], "Content-Encoding: gzip\r\n"
+        else:
+            filename, etag, encoding = asset["raw"], asset["raw_etag"], ""
+        
+        common = f"ETag: {etag}\r\nCache-Control: public, max-age={config.ASSET_MAX_AGE}\r\nVary: Accept-Encoding\r\n"
+        
+        if etag in headers.get("if-none-match", ""):
+            client.write(f"HTTP/1.1 304 Not Modified\r\n{common}".encode())
+            client.write(conn)
+            await client.drain()
+            return
+        
+        response = "HTTP/1.1 200 OK\r\n"
+        response += f"Content-Type: {asset['type']}\r\n"
+        response += f"Content-Length: {os.stat(filename)[6]}\r\n"
+        response += encoding + common
+        client.write(response.encode())
+        client.write(conn)
+        
+        # Đọc file từ flash theo từng khối nhỏ thay vì nạp cả file vào RAM
+        with open(filename, "rb") as f:
+            while True:
+                chunk = f.read(512)
+                if not chunk:
+                    break
+                client.write(chunk)
+                await client.drain()
+    
+    async def serve_stream(self, client):
+        """
+        Server-Sent Events: đẩy sự kiện khi có snapshot mới hoặc cảnh báo đổi trạng thái
+        
+        - snapshot: dữ liệu đầy đủ (khi mới kết nối hoặc đã lỡ phiên bản)
+        - update: chỉ các trường thay đổi so với snapshot trước
+        - alert: trạng thái cảnh báo mới
+        Gửi comment heartbeat mỗi SSE_HEARTBEAT giây khi không có dữ liệu mới.
+        """
+        if self.subscribers >= config.SSE_MAX_SUBSCRIBERS:
+            message = b"Too many subscribers"
+            response = "HTTP/1.1 503 Service Unavailable\r\n"
+            response += "Content-Type: text/plain\r\n"
+            response += "Retry-After: 30\r\n"
+            response += f"Content-Length: {len(message)}\r\n"
+            client.write(response.encode())
+            client.write(CONN_CLOSE)
+            client.write(message)
+            await client.drain()
+            return
+        
+        cache = self.sensor_manager.cache
+        self.subscribers += 1
+        try:
+            snapshot = await cache.get()
+            client.write(SSE_HEADERS)
+            client.write(b"retry: 5000\n\n")
+            self._write_event(client, b"snapshot", snapshot.version, snapshot.json_bytes())
+            await client.drain()
+            sent = snapshot.version
             
-            # Gửi toàn bộ response trong một lần
-            client.sendall(complete_response)
+            while True:
+                snapshot = await cache.wait_newer(sent, config.SSE_HEARTBEAT)
+                if snapshot is None:
+                    client.write(b": ping\n\n")
+                elif snapshot.version != sent + 1 or snapshot.changed is None:
+                    self._write_event(client, b"snapshot", snapshot.version, snapshot.json_bytes())
+                else:
+                    if snapshot.alerts_changed():
+                        self._write_event(client, b"alert", snapshot.version,
+                                          json.dumps(snapshot.data.alert_states()).encode())
+                    self._write_event(client, b"update", snapshot.version, snapshot.delta_bytes())
+                if snapshot is not None:
+                    sent = snapshot.version
+                await client.drain()
+        except Exception as e:
+            # Client đóng kết nối
+            logger.debug("Kết thúc /stream: %s", e)
+        finally:
+            self.subscribers -= 1
+    
+    def _write_event(self, client, event, version, data):
+        """Ghi một sự kiện SSE (data là JSON một dòng)"""
+        client.write(b"event: ")
+        client.write(event)
+        client.write(b"\nid: ")
+        client.write(str(version).encode())
+        client.write(b"\ndata: ")
+        client.write(data)
+        client.write(b"\n\n")
+    
+    async def serve_history(self, client, params, conn=CONN_CLOSE):
+        """
+        Phục vụ lịch sử một kênh: /history?channel=&from=&to=&res=
+        
+        from/to là giây theo đồng hồ thiết bị (mặc định 1 giờ gần nhất); res là
+        raw/1m/15m/1h, bỏ trống để tự chọn mức theo độ dài khoảng thời gian.
+        """
+        history = self.sensor_manager.history
+        try:
+            channel = params.get("channel", "temp1")
+            t_to = int(params.get("to") or time.time())
+            t_from = int(params.get("from") or t_to - 3600)
+            res = params.get("res") or None
+            if channel not in history.channels or res not in (None, "raw", "1m", "15m", "1h"):
+                raise ValueError("channel/res không hợp lệ")
+        except ValueError as e:
+            body = json.dumps({"error": str(e)}).encode()
+            response = "HTTP/1.1 400 Bad Request\r\n"
+        else:
+            body = json.dumps(history.query(channel, t_from, t_to, res)).encode()
+            response = "HTTP/1.1 200 OK\r\n"
+        
+        response += "Content-Type: application/json\r\n"
+        response += f"Content-Length: {len(body)}\r\n"
+        client.write(response.encode())
+        client.write(conn)
+        client.write(body)
+        await client.drain()
+    
+    async def serve_stats(self, client, conn=CONN_CLOSE):
+        """Phục vụ thống kê web server dưới dạng JSON"""
+        stats = dict(self.stats)
+        stats["open_connections"] = self.open_connections
+        stats["subscribers"] = self.subscribers
+        # Tỷ lệ request được phục vụ trên kết nối đã dùng lại
+        stats["reuse_rate"] = stats["reused"] / stats["requests"] if stats["requests"] else 0.0
+        # Bus RS485: giao dịch, lỗi, trạng thái từng cảm biến mức
+        stats["modbus"] = self.sensor_manager.iriv.bus_status()
+        # Thời gian các pha của lượt đọc cảm biến gần nhất (us)
+        stats["acquisition"] = self.sensor_manager.acquisition_trace
+        # Hàng đợi gửi IRIV: độ sâu, độ trễ (giây) của bản ghi cũ nhất, số bản bị bỏ
+        stats["outbox"] = self.sensor_manager.outbox.metrics()
+        # Kết nối keep-alive đến IRIV Controller
+        stats["iriv"] = self.sensor_manager.iriv.http.stats
+        # Số lần đồng hồ lùi khi ghi nhật ký telemetry (RTC chưa đồng bộ sau khởi động)
+        telemetry = self.sensor_manager.telemetry
+        if telemetry is not None:
+            stats["telemetry_time_resets"] = telemetry.time_resets
+        body = json.dumps(stats).encode()
+        
+        response = "HTTP/1.1 200 OK\r\n"
+        response += "Content-Type: application/json\r\n"
+        response += f"Content-Length: {len(body)}\r\n"
+        
+        client.write(response.encode())
+        client.write(conn)
+        client.write(body)
+        await client.drain()
+    
+    async def serve_metrics(self, client):
+        """
+        Phục vụ metric dạng văn bản Prometheus (metrics.py)
+        
+        Không có Content-Length: nội dung được ghi từng đoạn nhỏ ra kết nối
+        thay vì dựng cả chuỗi trong RAM, client đọc đến khi kết nối đóng.
+        """
+        client.write(METRICS_HEADERS)
+        await metrics.send(client)
+    
+    async def serve_profile(self, client, params, conn=CONN_CLOSE):
+        """
+        Phục vụ kết quả profiler: /debug/profile?top=&sort=&enable=
+        
+        Trả về top mục (sort: excl/incl/calls) rồi xóa số đếm; enable=1/0 bật
+        hoặc tắt profiler trước khi trả kết quả.
+        """
+        try:
+            sort = params.get("sort", "excl")
+            if sort not in ("excl", "incl", "calls"):
+                raise ValueError("sort không hợp lệ")
+            count = int(params.get("top", 10))
+            enable = params.get("enable")
+            if enable == "1":
+                profiler.enable()
+            elif enable == "0":
+                profiler.disable()
+            body = json.dumps(profiler.report(count, sort)).encode()
+            response = "HTTP/1.1 200 OK\r\n"
+        except ValueError as e:
+            body = json.dumps({"error": str(e)}).encode()
+            response = "HTTP/1.1 400 Bad Request\r\n"
+        
+        response += "Content-Type: application/json\r\n"
+        response += f"Content-Length: {len(body)}\r\n"
+        client.write(response.encode())
+        client.write(conn)
+        client.write(body)
+        await client.drain()
+    
+    async def serve_logs(self, client, params):
+        """
+        Phục vụ bộ đệm nhật ký (logger.py): /logs?since=&level=&set=
+        
+        Mỗi dòng "seq thời-gian mức message", chỉ các bản ghi có seq >= since và
+        mức >= level; header X-Log-Next là since cho lần đọc kế tiếp. set=
+        đổi mức ghi lúc chạy (ví dụ set=debug) trước khi trả kết quả. Như
+        /metrics, không có Content-Length: các dòng được định dạng và ghi lần
+        lượt, client đọc đến khi kết nối đóng.
+        """
+        try:
+            since = int(params.get("since", 0))
+            level = logger.LEVELS[params.get("level", "debug")]
+            if "set" in params:
+                logger.set_level(params["set"])
+        except (ValueError, KeyError):
+            message = "since/level/set không hợp lệ".encode()
+            response = "HTTP/1.1 400 Bad Request\r\n"
+            response += "Content-Type: text/plain; charset=utf-8\r\n"
+            response += f"Content-Length: {len(message)}\r\n"
+            client.write(response.encode())
+            client.write(CONN_CLOSE)
+            client.write(message)
+            await client.drain()
+            return
+        
+        # Chỉ gửi đến bản ghi đã có lúc này: bản ghi mới hơn thuộc lần đọc sau
+        until = logger.next_seq()
+        client.write(LOGS_HEADER_PREFIX)
+        client.write(f"X-Log-Level: {logger.level_name()}\r\nX-Log-Next: {until}\r\n".encode())
+        client.write(CONN_CLOSE)
+        await logger.send(client, since, level, until)
+    
+    async def serve_telemetry(self, client, params):
+        """
+        Phát lại nhật ký telemetry trên flash: /telemetry?from=&to=
+        
+        from/to là giây theo đồng hồ thiết bị (mặc định 24 giờ gần nhất). Mỗi
+        dòng là một bản ghi JSON (telemetry_log.decode), chỉ gồm các kênh có giá
+        trị mới trong bản ghi đó. Như /logs, không có Content-Length: bản ghi
+        được đọc từ flash và ghi lần lượt, client đọc đến khi kết nối đóng.
+        """
+        telemetry = self.sensor_manager.telemetry
+        try:
+            if telemetry is None:
+                raise ValueError("nhật ký telemetry không bật")
+            t_to = int(params.get("to") or time.time())
+            t_from = int(params.get("from") or t_to - 86400)
+        except ValueError as e:
+            body = json.dumps({"error": str(e)}).encode()
+            response = "HTTP/1.1 400 Bad Request\r\n"
+            response += "Content-Type: application/json\r\n"
+            response += f"Content-Length: {len(body)}\r\n"
+            client.write(response.encode())
+            client.write(CONN_CLOSE)
+            client.write(body)
+            await client.drain()
+            return
+        
+        client.write(TELEMETRY_HEADERS)
+        for record in telemetry.replay(t_from, t_to):
+            client.write(json.dumps(decode_record(record)).encode())
+            client.write(b"\n")
+            await client.drain()
+    
+    async def serve_error(self, client, status):
+        """Trả lỗi request (status dạng b"400 Bad Request") rồi đóng kết nối"""
+        client.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain\r\nContent-Length: ")
+        client.write(str(len(status)).encode() + b"\r\n" + CONN_CLOSE + status)
+        await client.drain()
     
-    def serve_404(self, client):
+    async def serve_404(self, client, conn=CONN_CLOSE):
         """Phục vụ trang 404"""
         message = "404 Not Found"
         
         response = "HTTP/1.1 404 Not Found\r\n"
         response += "Content-Type: text/plain\r\n"
         response += f"Content-Length: {len(message)}\r\n"
-        response += "Connection: close\r\n\r\n"
-        response += message
         
-        client.send(response.encode())
+        client.write(response.encode())
+        client.write(conn)
+        client.write(message.encode())
+        await client.drain()
     
     def get_html_template(self):
         """Trả về template HTML cho trang giám sát"""
@@ -188,104 +677,8 @@ class WebServer:
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=0">
             <title>Hệ Thống Giám Sát IoT</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    margin: 0;
-                    padding: 20px;
-                    background-color: #f0f0f0;
-                    font-size: 16px;
-                }
-                .container {
-                    max-width: 1000px;
-                    margin: 0 auto;
-                    background: white;
-                    padding: 20px;
-                    border-radius: 5px;
-                    box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-                }
-                h1 {
-                    color: #333;
-                    text-align: center;
-                    font-size: 24px;
-                }
-                .panel {
-                    margin-bottom: 20px;
-                    padding: 15px;
-                    border-radius: 5px;
-                    background-color: #fff;
-                    box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-                }
-                .section {
-                    margin-bottom: 20px;
-                }
-                h2, h3 {
-                    color: #333;
-                    margin-top: 0;
-                }
-                .sensor-grid {
-                    display: grid;
-                    grid-template-columns: repeat(auto-fill, minmax(150px, 1fr));
-                    gap: 15px;
-                    margin-bottom: 20px;
-                }
-                .sensor-card {
-                    background-color: #f9f9f9;
-                    border-radius: 5px;
-                    padding: 15px;
-                    text-align: center;
-                    box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-                }
-                .sensor-card h3 {
-                    margin-top: 0;
-                    font-size: 16px;
-                    color: #555;
-                }
-                .sensor-card p {
-                    font-size: 24px;
-                    font-weight: bold;
-                    margin: 10px 0 0 0;
-                    color: #007bff;
-                }
-                .sensor-value {
-                    display: flex;
-                    justify-content: space-between;
-                    margin-bottom: 10px;
-                    padding: 5px 0;
-                    border-bottom: 1px solid #eee;
-                }
-                .sensor-label {
-                    color: #555;
-                    font-weight: bold;
-                }
-                .alert {
-                    background-color: #ffcccc;
-                    color: #cc0000;
-                    padding: 10px 15px;
-                    border-radius: 5px;
-                    margin-bottom: 15px;
-                    display: none;
-                }
-                
-                /* Responsive design cho điện thoại di động */
-                @media (max-width: 600px) {
-                    body {
-                        padding: 10px;
-                    }
-                    .container {
-                        padding: 10px;
-                    }
-                    .sensor-grid {
-                        grid-template-columns: repeat(2, 1fr);
-                    }
-                    .sensor-card p {
-                        font-size: 20px;
-                    }
-                    h1 {
-                        font-size: 20px;
-                    }
-                }
-            </style>
+            <link rel="stylesheet" href="/app.css">
+            <script src="/app.js" defer></script>
         </head>
         <body>
             <div class="container">
@@ -342,123 +735,6 @@ class WebServer:
                 </div>
             </div>
             
-            <script>
-                // Biến theo dõi trạng thái cập nhật
-                let lastUpdateTime = 0;
-                let updateInterval = 10000; // 10 giây
-                
-                // Thêm thông báo trạng thái cập nhật
-                let statusContainer = document.createElement('div');
-                statusContainer.style.position = 'fixed';
-                statusContainer.style.bottom = '20px';
-                statusContainer.style.left = '50%';
-                statusContainer.style.transform = 'translateX(-50%)';
-                statusContainer.style.backgroundColor = 'rgba(0,0,0,0.7)';
-                statusContainer.style.color = 'white';
-                statusContainer.style.padding = '10px 20px';
-                statusContainer.style.borderRadius = '20px';
-                statusContainer.style.zIndex = '1000';
-                statusContainer.style.fontSize = '14px';
-                statusContainer.style.display = 'none';
-                document.body.appendChild(statusContainer);
-                
-                // Hiển thị thông báo
-                function showStatus(message, isError = false) {
-                    statusContainer.textContent = message;
-                    statusContainer.style.backgroundColor = isError ? 'rgba(200,0,0,0.8)' : 'rgba(0,0,0,0.7)';
-                    statusContainer.style.display = 'block';
-                    
-                    // Tự động ẩn sau 3 giây
-                    setTimeout(() => {
-                        statusContainer.style.display = 'none';
-                    }, 3000);
-                }
-                
-                // Hàm cập nhật dữ liệu từ server
-                function updateData() {
-                    showStatus('Đang cập nhật dữ liệu...');
-                    
-                    fetch('/data')
-                        .then(response => {
-                            if (!response.ok) {
-                                throw new Error(`Lỗi HTTP: ${response.status}`);
-                            }
-                            return response.json();
-                        })
-                        .then(data => {
-                            // Cập nhật dữ liệu trên trang
-                            document.getElementById('temp1').textContent = (data.temp1 != null) ? data.temp1.toFixed(1) + '°C' : 'N/A';
-                            document.getElementById('temp2').textContent = (data.temp2 != null) ? data.temp2.toFixed(1) + '°C' : 'N/A';
-                            document.getElementById('room-temp').textContent = (data.room_temp != null) ? data.room_temp.toFixed(1) + '°C' : 'N/A';
-                            document.getElementById('humidity').textContent = (data.humidity != null) ? data.humidity.toFixed(1) + '%' : 'N/A';
-                            document.getElementById('water-level').textContent = (data.water_level != null) ? data.water_level.toFixed(2) + 'm' : 'N/A';
-                            document.getElementById('tank-volume').textContent = (data.tank_volume != null) ? data.tank_volume.toFixed(1) + 'L' : 'N/A';
-                            
-                            // Cập nhật thời gian cập nhật gần nhất
-                            document.getElementById('last-update').textContent = data.timestamp || 'Không có dữ liệu';
-                            
-                            // Hiển thị cảnh báo nếu có
-                            if (data.alerts) {
-                                document.getElementById('alert-temp1').style.display = data.alerts.temp1 ? 'block' : 'none';
-                                document.getElementById('alert-temp2').style.display = data.alerts.temp2 ? 'block' : 'none';
-                                document.getElementById('alert-water').style.display = data.alerts.water_level ? 'block' : 'none';
-                            }
-                            
-                            lastUpdateTime = Date.now();
-                            showStatus('Đã cập nhật dữ liệu thành công');
-                        })
-                        .catch(error => {
-                            console.error('Lỗi khi lấy dữ liệu:', error);
-                            showStatus('Lỗi khi cập nhật dữ liệu', true);
-                        });
-                }
-                
-                // Cập nhật dữ liệu ngay khi trang được tải
-                window.addEventListener('load', function() {
-                    // Kiểm tra nếu initialSensorData đã được cung cấp từ server
-                    if (typeof initialSensorData !== 'undefined') {
-                        // Cập nhật UI với dữ liệu ban đầu
-                        document.getElementById('temp1').textContent = (initialSensorData.temp1 != null) ? initialSensorData.temp1.toFixed(1) + '°C' : 'N/A';
-                        document.getElementById('temp2').textContent = (initialSensorData.temp2 != null) ? initialSensorData.temp2.toFixed(1) + '°C' : 'N/A';
-                        document.getElementById('room-temp').textContent = (initialSensorData.room_temp != null) ? initialSensorData.room_temp.toFixed(1) + '°C' : 'N/A';
-                        document.getElementById('humidity').textContent = (initialSensorData.humidity != null) ? initialSensorData.humidity.toFixed(1) + '%' : 'N/A';
-                        document.getElementById('water-level').textContent = (initialSensorData.water_level != null) ? initialSensorData.water_level.toFixed(2) + 'm' : 'N/A';
-                        document.getElementById('tank-volume').textContent = (initialSensorData.tank_volume != null) ? initialSensorData.tank_volume.toFixed(1) + 'L' : 'N/A';
-                        
-                        // Cập nhật thời gian cập nhật gần nhất
-                        document.getElementById('last-update').textContent = initialSensorData.timestamp || 'Không có dữ liệu';
-                        
-                        if (initialSensorData.alerts) {
-                            document.getElementById('alert-temp1').style.display = initialSensorData.alerts.temp1 ? 'block' : 'none';
-                            document.getElementById('alert-temp2').style.display = initialSensorData.alerts.temp2 ? 'block' : 'none';
-                            document.getElementById('alert-water').style.display = initialSensorData.alerts.water_level ? 'block' : 'none';
-                        }
-                        
-                        showStatus('Dữ liệu ban đầu đã được tải');
-                    } else {
-                        // Tải dữ liệu từ API nếu không có dữ liệu ban đầu
-                        updateData();
-                    }
-                    
-                    // Thiết lập cập nhật định kỳ
-                    setInterval(updateData, updateInterval);
-                    
-                    // Thêm nút làm mới thủ công
-                    let refreshButton = document.createElement('button');
-                    refreshButton.textContent = 'Làm mới dữ liệu';
-                    refreshButton.style.display = 'block';
-                    refreshButton.style.margin = '20px auto';
-                    refreshButton.style.padding = '10px 20px';
-                    refreshButton.style.backgroundColor = '#007bff';
-                    refreshButton.style.color = 'white';
-                    refreshButton.style.border = 'none';
-                    refreshButton.style.borderRadius = '5px';
-                    refreshButton.style.cursor = 'pointer';
-                    refreshButton.onclick = updateData;
-                    
-                    document.querySelector('.container').appendChild(refreshButton);
-                });
-            </script>
         </body>
         </html>
         """
@@ -3,17 +3,19 @@ import time
 import socket
 import gc
 import config
+import logger
+from runtime import format_time
 
 class WiFiManager:
-    def __init__(self):
-        self.ssid = config.WIFI_SSID
-        self.password = config.WIFI_PASSWORD
+    def __init__(self, ssid=None, password=None):
+        self.ssid = ssid if ssid is not None else config.WIFI_SSID
+        self.password = password if password is not None else config.WIFI_PASSWORD
         self.wlan = network.WLAN(network.STA_IF)
         self.ip = None
     
     def connect(self):
         """Kết nối đến mạng WiFi"""
-        print(f"Đang kết nối đến mạng: {self.ssid}")
+        logger.info("Đang kết nối đến mạng: %s", self.ssid)
         self.wlan.active(True)
         self.wlan.config(pm = 0xa11140)
         if not self.wlan.isconnected():
@@ -24,15 +26,15 @@ class WiFiManager:
                 if self.wlan.isconnected():
                     break
                 max_wait -= 1
-                print("Đang đợi kết nối...")
+                logger.info("Đang đợi kết nối...")
                 time.sleep(1)
             
         if self.wlan.isconnected():
             self.ip = self.wlan.ifconfig()[0]
-            print(f"Đã kết nối thành công! IP: {self.ip}")
+            logger.info("Đã kết nối thành công! IP: %s", self.ip)
             return True
         else:
-            print("Kết nối thất bại.")
+            logger.error("Kết nối thất bại.")
             return False
 
     def get_ip(self):
@@ -40,4 +42,29 @@ class WiFiManager:
         if self.wlan.isconnected():
             return self.wlan.ifconfig()[0]
         return None
-
+    
+    def sync_time(self, host=None, attempts=3):
+        """
+        Đồng bộ RTC qua NTP (ntptime, UTC)
+        
+        Sau khi khởi động RTC của Pico W bắt đầu lại từ epoch: cần đồng bộ
+        trước khi ghi nhật ký telemetry theo thời gian. Trả về True nếu thành công.
+        """
+        host = host or config.NTP_HOST
+        if not host:
+            return False
+        try:
+            import ntptime
+        except ImportError:
+            logger.warning("Không có module ntptime, bỏ qua đồng bộ thời gian")
+            return False
+        ntptime.host = host
+        for _ in range(attempts):
+            try:
+                ntptime.settime()
+                logger.info("Đã đồng bộ thời gian với %s: %s", host, format_time())
+                return True
+            except Exception as e:
+                logger.warning("Lỗi đồng bộ NTP với %s: %s", host, e)
+                time.sleep(1)
+        return False
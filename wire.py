@@ -0,0 +1,110 @@
+"""
+Định dạng nhị phân gọn cho dữ liệu gửi lên IRIV Controller
+
+Một lô gồm:
+- 1 byte phiên bản (WIRE_VERSION)
+- varint số bản ghi
+- bản ghi đầu: struct cố định SAMPLE_FORMAT (timestamp giây + các giá trị
+  fixed-point theo thứ tự FIELDS, hệ số lấy từ schema.CHANNELS)
+- mỗi bản ghi sau: varint zigzag của chênh lệch timestamp và của từng giá
+  trị so với bản ghi trước
+
+Các mẫu liên tiếp thay đổi ít nên phần lớn chênh lệch chỉ tốn 1 byte.
+"""
+import struct
+from schema import FIELDS, CHANNELS
+
+WIRE_VERSION = 1
+CONTENT_TYPE = "application/octet-stream"
+
+SAMPLE_FORMAT = "<I" + "".join(CHANNELS[name][1] for name in FIELDS)
+SAMPLE_SIZE = struct.calcsize(SAMPLE_FORMAT)
+
+SCALES = tuple(CHANNELS[name][0] for name in FIELDS)
+
+
+def _put_varint(buf, n):
+    while n > 0x7F:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _get_varint(data, pos):
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return n, pos
+        shift += 7
+
+
+def _put_signed(buf, n):
+    # zigzag: số âm nhỏ cũng chỉ tốn ít byte
+    _put_varint(buf, (n << 1) if n >= 0 else ((-n << 1) - 1))
+
+
+def _get_signed(data, pos):
+    z, pos = _get_varint(data, pos)
+    return ((z >> 1) if not z & 1 else -((z + 1) >> 1)), pos
+
+
+def _fixed(data):
+    """dict giá trị fixed-point -> list theo thứ tự FIELDS (None -> 0)"""
+    values = []
+    for name in FIELDS:
+        value = data.get(name)
+        values.append(0 if value is None else value)
+    return values
+
+
+def encode(items):
+    """
+    Mã hóa lô [(t, data)] (theo thứ tự thời gian) thành bytes
+
+    Ném ValueError nếu giá trị của bản ghi đầu vượt khoảng của SAMPLE_FORMAT:
+    gửi lại cũng không được nên bên gọi phải bỏ lô này.
+    """
+    buf = bytearray([WIRE_VERSION])
+    _put_varint(buf, len(items))
+    prev_t = prev = None
+    for t, data in items:
+        values = _fixed(data)
+        if prev is None:
+            try:
+                buf.extend(struct.pack(SAMPLE_FORMAT, t, *values))
+            except Exception as e:  # struct.error (CPython), OverflowError (MicroPython)
+                raise ValueError("không mã hóa được bản ghi t={}: {}".format(t, e))
+        else:
+            _put_signed(buf, t - prev_t)
+            for value, old in zip(values, prev):
+                _put_signed(buf, value - old)
+        prev_t, prev = t, values
+    return bytes(buf)
+
+
+def decode(data):
+    """Giải mã lô nhị phân thành list dict {"timestamp": t, tên: giá trị thực}"""
+    if not data or data[0] != WIRE_VERSION:
+        raise ValueError("phiên bản wire không hỗ trợ: {}".format(data[0] if data else None))
+    count, pos = _get_varint(data, 1)
+    samples = []
+    t = values = None
+    for i in range(count):
+        if i == 0:
+            record = struct.unpack_from(SAMPLE_FORMAT, data, pos)
+            pos += SAMPLE_SIZE
+            t, values = record[0], list(record[1:])
+        else:
+            dt, pos = _get_signed(data, pos)
+            t += dt
+            for j in range(len(values)):
+                delta, pos = _get_signed(data, pos)
+                values[j] += delta
+        sample = {"timestamp": t}
+        for name, scale, value in zip(FIELDS, SCALES, values):
+            sample[name] = value / scale
+        samples.append(sample)
+    return samples